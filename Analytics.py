@@ -1,142 +1,391 @@
-import sqlite3
 import datetime
-from functools import reduce
-from tabulate import tabulate
+from itertools import groupby, islice
+from Database import get_connection
+from StreakEngine import calculate_streaks
+from Cache import cached, habit_tag
+from Instrumentation import instrumented
+from LogStore import iter_logs, logs_in_window
 
+# format of habit_logs.completed_at
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-def display_table_habits():
+# number of rows rendered per table when printing long results
+PAGE_SIZE = 1000
+
+
+def iter_rows(conn, query, params=(), chunk_size=1000):
+    """
+    Run a query and yield its rows lazily. The rows are fetched from the cursor in chunks, so only one chunk is held
+    in memory at a time.
+    :param conn: sqlite3 connection
+    :param query: SQL query
+    :param params: query parameters
+    :param chunk_size: number of rows fetched from the cursor at a time
+    :return: generator of row tuples
+    """
+    c = conn.cursor()
+    c.execute(query, params)
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        c.close()
+
+
+def paginate(rows, page_size=PAGE_SIZE):
+    """
+    Split an iterable of rows into pages without materializing it
+    :param rows: iterable of rows
+    :param page_size: maximum number of rows per page
+    :return: generator of lists of rows
+    """
+    rows = iter(rows)
+    while True:
+        page = list(islice(rows, page_size))
+        if not page:
+            break
+        yield page
+
+
+def format_table(rows, headers):
+    """
+    Format rows as a grid table. tabulate is imported on first use, it is the slowest import of the application.
+    :param rows: iterable of rows
+    :param headers: list of column headers
+    :return: str
+    """
+    from tabulate import tabulate
+    return tabulate(rows, headers=headers, tablefmt="fancy_grid")
+
+
+def print_table(rows, headers, page_size=PAGE_SIZE):
+    """
+    Print rows as formatted tables of at most page_size rows each, so that long results are rendered in linear time
+    and bounded memory
+    :param rows: iterable of rows
+    :param headers: column headers, repeated on every page
+    :param page_size: maximum number of rows per table
+    :return: None
+    """
+    printed = False
+    for page in paginate(rows, page_size):
+        print(format_table(page, headers))
+        printed = True
+    if not printed:
+        print(format_table([], headers))
+
+
+@instrumented
+def display_table_habits(conn=None, cache=None):
     """
     Display the habits table in a formatted table
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
     :return: None
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM habits")
-    habits = c.fetchall()
-    conn.close()
-    print(tabulate(habits,
-                   headers=["ID", "Name", "Created at", "Frequency", "Completed", "Ongoing streak", "Longest streak",
-                            "Last completed at"], tablefmt="fancy_grid"))
+    conn = get_connection(conn)
+    if cache is None:
+        habits = iter_rows(conn, "SELECT * FROM habits")
+    else:
+        habits = cached(cache, ("get_habits",), lambda: conn.execute("SELECT * FROM habits").fetchall(), ("habits",),
+                        conn)
+    print_table(habits, headers=["ID", "Name", "Created at", "Frequency", "Completed", "Ongoing streak",
+                                 "Longest streak", "Last completed at"])
 
 
-def show_habits_frequency():
+@instrumented
+def show_habits_frequency(conn=None, cache=None):
     """
     Show all habits with a specific frequency
-    :return:
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: None
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
-
     # get the frequency from the user
     frequency = input("Enter the frequency of the habit in full days (e.g. 7 for weekly): ")
 
-    # get the habits with the frequency from the user
-    c.execute("SELECT name, frequency FROM habits WHERE frequency = ?", (frequency,))
-    habits = c.fetchall()
-    conn.close()
-
     # display the habits with the frequency from the user
-    print(tabulate(habits, headers=["Name", "Frequency"], tablefmt="fancy_grid"))
+    print(format_table(habits_with_frequency(frequency, conn, cache), ["Name", "Frequency"]))
 
 
-def show_longest_streak():
+def habits_with_frequency(frequency, conn=None, cache=None):
     """
-    Show the longest streak for all habits
-    :return: None
+    Get all habits with a specific frequency
+    :param frequency: frequency in days
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: list of (name, frequency) rows
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
+    conn = get_connection(conn)
+    return cached(cache, ("habits_frequency", str(frequency)),
+                  lambda: conn.execute("SELECT name, frequency FROM habits WHERE frequency = ?",
+                                       (frequency,)).fetchall(), ("habits",), conn)
 
-    # get the longest streak for all habits
-    c.execute("SELECT name, MAX(longest_streak) FROM habits")
-    habits = c.fetchall()
-    conn.close()
 
+@instrumented
+def show_longest_streak(conn=None, cache=None):
+    """
+    Show the longest streak for all habits
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: None
+    """
     # display the longest streak for all habits
-    print(tabulate(habits, headers=["Name", "Longest streak"], tablefmt="fancy_grid"))
+    print(format_table(longest_streak(conn, cache), ["Name", "Longest streak"]))
 
 
-def show_longest_streak_habit():
+def longest_streak(conn=None, cache=None):
     """
-    Show the longest streak for a specific habit
-    :return:
+    Get the habit with the longest streak of all habits
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: list with one (name, longest streak) row
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
+    conn = get_connection(conn)
+    return cached(cache, ("longest_streak",),
+                  lambda: conn.execute("SELECT name, MAX(longest_streak) FROM habits").fetchall(), ("habits",), conn)
 
-    # get all habits from the database
-    c.execute("SELECT name FROM habits")
-    show_habits = c.fetchall()
 
+@instrumented
+def show_longest_streak_habit(conn=None, cache=None):
+    """
+    Show the longest streak for a specific habit
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: None
+    """
     # show all habits to the user and ask him which habit he wants to see the longest streak for
-    print(tabulate(show_habits, headers=["Name"], tablefmt="fancy_grid"))
+    print_table(map(lambda name: [name], habit_names(conn, cache)), headers=["Name"])
     name = input("Enter the exact name of the habit: ")
 
     # get the longest streak for the habit chosen by user
-    c.execute("SELECT name, ongoing_streak, longest_streak, last_completed_at FROM habits WHERE name = ?", (name,))
-    habits = c.fetchall()
-    conn.close()
+    habits = habit_streak(name, conn, cache)
     # if no habits with this name exist, print a message, else continue
     if len(habits) == 0:
         return print("No habit with this name exists.")
     else:
-        print(tabulate(habits, headers=["Name", "Ongoing streak", "Longest streak",
-                                        "Last completed at"], tablefmt="fancy_grid"))
+        print(format_table(habits, ["Name", "Ongoing streak", "Longest streak", "Last completed at"]))
 
 
-def clear_database():
+def habit_streak(name, conn=None, cache=None):
+    """
+    Get the streaks of a specific habit
+    :param name: exact name of the habit
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habit through
+    :return: list of (name, ongoing streak, longest streak, last completed at) rows, empty if there is no such habit
     """
-    Drops the table habits and habit_logs.
+    conn = get_connection(conn)
+    return cached(cache, ("longest_streak_habit", name),
+                  lambda: conn.execute("SELECT name, ongoing_streak, longest_streak, last_completed_at "
+                                       "FROM habits WHERE name = ?", (name,)).fetchall(), (habit_tag(name),), conn)
+
+
+def streaks(conn=None, cache=None):
+    """
+    Get the streaks of all habits
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the habits through
+    :return: list of (name, frequency, ongoing streak, longest streak, last completed at) rows ordered by id
+    """
+    conn = get_connection(conn)
+    return cached(cache, ("streaks",),
+                  lambda: conn.execute("SELECT name, frequency, ongoing_streak, longest_streak, last_completed_at "
+                                       "FROM habits ORDER BY id").fetchall(), ("habits",), conn)
+
+
+@instrumented
+def clear_database(conn=None):
+    """
+    Drops the table habits and habit_logs and the tables derived from them.
+    :param conn: connection of the database to clear, defaults to the shared connection
     :return: None
     """
-    conn = sqlite3.connect('habits.db')
+    conn = get_connection(conn)
     c = conn.cursor()
     c.execute("DROP TABLE habits")
     c.execute("DROP TABLE habit_logs")
+
+    # drop the tables derived from habits and habit_logs as well
+    c.execute("DROP TABLE IF EXISTS streak_checkpoints")
+    c.execute("DROP TABLE IF EXISTS habits_fts")
+    c.execute("DROP TABLE IF EXISTS habit_daily_completions")
+    c.execute("DROP TABLE IF EXISTS habit_weekly_completions")
+    c.execute("DROP TABLE IF EXISTS habit_log_archive")
+    conn.commit()
     print("Database cleared.")
 
 
-def show_completed_within_last_week():
+@instrumented
+def show_completed_within_last_week(conn=None):
     """
-    Show all habits that have been completed within the last 7 days using the filter function. Prints out a list of
-    habit names.. :return: None
+    Show all habits that have been completed within the last 7 days. The date range is filtered by SQLite on the
+    index of habit_logs.completed_at, so only the rows of the last week are read. Prints out a list of habit names.
+    :param conn: connection to query, defaults to the shared connection
+    :return: None
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
-
     # Get the date 7 days ago
     today = datetime.datetime.today()
     last_week = today - datetime.timedelta(days=7)
 
-    # Query the habit_logs table for all habit_ids that have been completed within the last 7 days
-    c.execute(
-        "SELECT habit_id, habits.name, completed_at FROM habit_logs JOIN habits ON habit_logs.habit_id = habits.id")
-    habits = c.fetchall()
-
-    # Convert the completed_at column to datetime objects
-    habits = [(h[0], h[1], datetime.datetime.strptime(h[2], "%Y-%m-%d %H:%M:%S")) for h in habits]
-
-    # Use the filter function to get all the habits completed within the last week
-    habits = list(filter(lambda h: h[2] >= last_week, habits))
+    habits = completions_in_window(last_week, conn=conn)
 
     # Use tabulate to display the results
     table_headers = ["Habit ID", "Habit Name", "Completed at"]
-    print(tabulate(habits, headers=table_headers, tablefmt="fancy_grid"))
-    conn.close()
+    print_table(habits, headers=table_headers)
+
+
+def get_window(period, reference=None):
+    """
+    Get the calendar window [start, end) of the given period that contains the reference date
+    :param period: "day", "week" (ISO week, starting on Monday) or "month"
+    :param reference: date or datetime within the window (default: now)
+    :return: tuple of two datetime objects (start, end)
+    """
+    if reference is None:
+        reference = datetime.datetime.now()
+    start = datetime.datetime(reference.year, reference.month, reference.day)
+
+    if period == "day":
+        end = start + datetime.timedelta(days=1)
+    elif period == "week":
+        start = start - datetime.timedelta(days=start.weekday())
+        end = start + datetime.timedelta(days=7)
+    elif period == "month":
+        start = start.replace(day=1)
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    else:
+        raise ValueError("unknown period {!r}, expected 'day', 'week' or 'month'".format(period))
+    return start, end
+
+
+def completions_in_window(start, end=None, conn=None, chunk_size=1000):
+    """
+    Get all completions logged within the window [start, end), from habit_logs and the log archive. The range
+    predicate is evaluated by SQLite on the index of habit_logs.completed_at and on the key of the archive and the
+    rows are streamed in chunks, so the cost depends on the size of the window and not on the size of the whole
+    history.
+    :param start: datetime (or date) where the window starts, inclusive
+    :param end: datetime (or date) where the window ends, exclusive (default: no upper bound)
+    :param conn: connection to query, defaults to the shared connection
+    :param chunk_size: number of rows fetched from the cursor at a time
+    :return: generator of (habit id, habit name, completed at) tuples ordered by completed at
+    """
+    conn = get_connection(conn)
+    return logs_in_window(conn, _format_timestamp(start), _format_timestamp(end) if end is not None else None,
+                          chunk_size)
+
+
+def _format_timestamp(value):
+    """
+    Format a date or datetime the way completed_at is stored in habit_logs, so that it can be compared as text
+    :param value: date or datetime
+    :return: str
+    """
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return value.strftime(TIMESTAMP_FORMAT)
 
 
-def get_habit_names():
+@instrumented
+def get_habit_names(conn=None, cache=None):
     """
-    Get the names of all habits. Prints a formatted table with the names of all habits.
+    Get the names of all habits. Prints formatted tables with the names of all habits, one page at a time.
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache to read the names through
     :return: None
     """
-    conn = sqlite3.connect('habits.db')
-    c = conn.cursor()
-    c.execute("SELECT name FROM habits")
-    habits = c.fetchall()
-
-    # use the reduce function to iterate over the list of tuples, and for each tuple,
-    # it extracts the name and appends it to the accumulator acc.
-    habit_names = reduce(lambda acc, habit: acc + [[habit[0]]], habits, [])
-    print(tabulate(habit_names, headers=["Name"], tablefmt="fancy_grid"))
-    conn.close()
+    # use the map function to lazily turn every name into a table row
+    print_table(map(lambda name: [name], habit_names(conn, cache)), headers=["Name"])
+
+
+@instrumented
+def habit_names(conn=None, cache=None):
+    """
+    Get the names of all habits, streamed from the database or read through the cache
+    :param conn: connection to query, defaults to the shared connection
+    :param cache: optional QueryCache, the names are then loaded as a list
+    :return: iterable of habit names
+    """
+    if cache is None:
+        return iter_habit_names(conn)
+    return cached(cache, ("habit_names",), lambda: list(iter_habit_names(conn)), ("habits",), conn)
+
+
+def iter_habit_names(conn=None, chunk_size=1000):
+    """
+    Get the names of all habits lazily, in the order of their ids
+    :param conn: connection to query, defaults to the shared connection
+    :param chunk_size: number of rows fetched from the cursor at a time
+    :return: generator of habit names
+    """
+    conn = get_connection(conn)
+    return (row[0] for row in iter_rows(conn, "SELECT name FROM habits ORDER BY id", chunk_size=chunk_size))
+
+
+@instrumented
+def habit_statistics(conn=None, reference=None, cache=None):
+    """
+    Calculate streak and completion statistics of every habit from the habit logs. Only the distinct completion
+    days of a habit count, the streaks follow the same rule as complete_habit.
+    The result contains for every habit:
+        longest_streak, ongoing_streak: the streaks calculated from the logs
+        completions: number of days the habit has been completed
+        completion_rate: completions divided by the number of periods of the habit's frequency between the first
+                         completion and the reference day (at most 1.0)
+        max_gap, mean_gap: largest and average number of days between two completions
+    :param conn: connection to query, defaults to the shared connection
+    :param reference: date the completion rate is calculated up to (default: today)
+    :param cache: optional QueryCache to read the statistics through
+    :return: dict of habit id to a dict with the statistics
+    """
+    conn = get_connection(conn)
+    reference = reference or datetime.date.today()
+    return cached(cache, ("habit_statistics", reference), lambda: _habit_statistics(conn, reference.toordinal()),
+                  ("habits", "habit_logs"), conn)
+
+
+def _habit_statistics(conn, reference, first_id=None, last_id=None):
+    """
+    Calculate the statistics of habit_statistics
+    :param conn: sqlite3 connection
+    :param reference: day number the completion rate is calculated up to
+    :param first_id: only habits with this id or higher (default: no lower bound)
+    :param last_id: only habits with this id or lower (default: no upper bound)
+    :return: dict of habit id to a dict with the statistics
+    """
+    condition = "BETWEEN ? AND ?"
+    params = (-2 ** 63 if first_id is None else first_id, 2 ** 63 - 1 if last_id is None else last_id)
+    frequencies = dict(conn.execute("SELECT id, frequency FROM habits WHERE id " + condition, params))
+    statistics = {habit_id: _empty_statistics() for habit_id in frequencies}
+
+    logs = iter_logs(conn, first_id=first_id, last_id=last_id)
+    for habit_id, rows in groupby(logs, key=lambda row: row[0]):
+        if habit_id not in frequencies:
+            continue
+        completions = [row[1] for row in rows]
+        days = sorted({datetime.date.fromisoformat(completed_at[:10]).toordinal() for completed_at in completions})
+        frequency = frequencies[habit_id]
+        _, ongoing_streak, longest_streak = calculate_streaks(completions, frequency)
+        gaps = [later - earlier for earlier, later in zip(days, days[1:])]
+        expected = (reference - days[0]) // frequency + 1 if reference >= days[0] else 1
+        statistics[habit_id] = {
+            "longest_streak": longest_streak,
+            "ongoing_streak": ongoing_streak,
+            "completions": len(days),
+            "completion_rate": min(1.0, len(days) / expected),
+            "max_gap": max(gaps, default=0),
+            "mean_gap": sum(gaps) / len(gaps) if gaps else 0.0,
+        }
+    return statistics
+
+
+def _empty_statistics():
+    """
+    Statistics of a habit that has never been completed
+    """
+    return {"longest_streak": 0, "ongoing_streak": 0, "completions": 0, "completion_rate": 0.0, "max_gap": 0,
+            "mean_gap": 0.0}
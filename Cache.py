@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    A read-through LRU cache with a time to live for query results
+
+    Every entry is stored with a set of tags naming the data it was read from: "habits" for queries over the whole
+    habits table, "habit_logs" for queries over the logs and "habit:<name>" for queries about a single habit.
+    Writes invalidate the tags they touch, so only the affected entries are dropped. Commits of other connections,
+    also those of other processes, are noticed by PRAGMA data_version of the connection a lookup is made for: if
+    it has changed since the last lookup on that connection, all entries are dropped. Callers get a copy of the
+    cached lists and dicts, so changing a result doesn't change the cache.
+
+    ...
+
+    Attributes
+    ----------
+
+    maxsize : int
+        maximum number of entries, the least recently used entry is evicted first (default: 256)
+    ttl : float
+        seconds an entry stays valid (default: 60.0)
+    hits : int
+        number of lookups answered from the cache
+    misses : int
+        number of lookups that had to run the query
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # counts invalidations, a value loaded while data changed is not stored
+        self._generation = 0
+        # PRAGMA data_version last seen per connection, by id (connections can't be weakly referenced)
+        self._versions = {}
+
+    def get_or_load(self, key, load, tags=(), conn=None):
+        """
+        Get the cached value of a key or load and cache it
+        :param key: hashable key of the query, e.g. a tuple of the query name and its parameters
+        :param load: function without arguments that runs the query
+        :param tags: tags of the data the query reads
+        :param conn: connection the query runs on, to notice the commits of other connections (default: no check)
+        :return: a copy of the cached value or the loaded value
+        """
+        if conn is not None:
+            self.check_version(conn)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[1])
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, value, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return _copy(value)
+
+    def check_version(self, conn):
+        """
+        Drop all entries if another connection has committed since the last check on this connection. A connection
+        checked for the first time drops them as well, it can't tell what happened before.
+        :param conn: sqlite3 connection
+        :return: None
+        """
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            if self._versions.get(id(conn)) == version:
+                return
+            if len(self._versions) >= self.maxsize:
+                self._versions.clear()  # connections that are gone
+            self._versions[id(conn)] = version
+            self._generation += 1
+            self._entries.clear()
+
+    def invalidate(self, *tags):
+        """
+        Drop all entries that carry one of the tags
+        :param tags: tags of the changed data
+        :return: None
+        """
+        tags = set(tags)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if entry[2] & tags]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Drop all entries
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get the counters of the cache
+        :return: dict with hits, misses and the current number of entries
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def habit_tag(name):
+    """
+    Get the tag of the queries about a single habit
+    :param name: habit name
+    :return: str
+    """
+    return "habit:" + str(name)
+
+
+def cached(cache, key, load, tags=(), conn=None):
+    """
+    Run a query through a cache, or directly if there is none
+    :param cache: QueryCache or None
+    :param key: key of the query
+    :param load: function without arguments that runs the query
+    :param tags: tags of the data the query reads
+    :param conn: connection the query runs on, see QueryCache.get_or_load
+    :return: the result of the query
+    """
+    if cache is None:
+        return load()
+    return cache.get_or_load(key, load, tags, conn)
+
+
+def _copy(value):
+    """
+    Copy a cached value for a caller: lists and dicts are copied, rows (tuples) and numbers are immutable
+    """
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    return value
@@ -0,0 +1,281 @@
+"""
+Buffered completions in front of the habit model, written in group commits.
+
+Every HabitModel.complete_habit call is a transaction of its own, so a burst of completions waits for the database
+lock and the commit once per completion. The CompletionQueue returns as soon as a completion is buffered and a
+background thread writes the buffer with HabitModel.complete_habits, one transaction for all completions that
+arrived within max_delay seconds or as soon as max_items are waiting.
+
+Without a journal the buffer only lives in memory and the completions of the last max_delay seconds are lost if the
+process dies. With a journal every completion is first appended to a JSON Lines file, the durability decides when
+the line reaches the disk:
+
+    buffered: the line is written to the disk with the next group commit, a crash loses the lines since the last one
+    flush:    the line is handed to the operating system at once, it survives a crash of the process
+    fsync:    the line is synced to the disk at once, it survives a crash of the machine
+
+After every group commit the journal is rewritten to the completions that are still waiting. A queue opened on an
+existing journal first writes the completions left in it by a crashed process (replay). The queue completes a habit
+at most once per day, like complete_habit, so a completion that had already been committed before the crash is
+not logged twice.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from HabitModel import HabitModel
+
+DURABILITY = ("buffered", "flush", "fsync")
+
+
+class CompletionQueue:
+    """
+    Buffers habit completions and writes them in group commits on a background thread
+
+    The thread opens its own connection from the ConnectionManager of the model; a model on a single connection
+    shares it with the thread, so that connection must allow other threads. The queue writes with a model that
+    doesn't print the messages for the interactive menu. Completions of habits that don't exist are dropped and
+    collected in unknown.
+
+    ...
+
+    Attributes
+    ----------
+
+    journal : str
+        path of the JSON Lines journal, None to buffer in memory only
+    max_items : int
+        number of waiting completions that starts a group commit at once (default: 100)
+    max_delay : float
+        seconds a completion waits at most for its group commit (default: 0.05)
+    durability : str
+        when a journal line reaches the disk, one of DURABILITY (default: flush)
+    replayed : int
+        number of completions written from the journal when the queue was opened
+    committed : int
+        number of completions written or dropped since the queue was opened, including the replayed ones
+    unknown : list
+        (name, completed_at) of the completions that were dropped because there is no habit with the name
+    """
+
+    def __init__(self, model, journal=None, max_items=100, max_delay=0.05, durability="flush"):
+        """
+        :param model: HabitModel to write the completions with
+        :param journal: path of the journal, None to buffer in memory only
+        :param max_items: number of waiting completions that starts a group commit at once
+        :param max_delay: seconds a completion waits at most for its group commit
+        :param durability: one of DURABILITY
+        """
+        if durability not in DURABILITY:
+            raise ValueError("durability must be one of {}".format(", ".join(DURABILITY)))
+        if max_items < 1 or max_delay < 0:
+            raise ValueError("max_items must be positive and max_delay can't be negative")
+        self.model = model
+        self.journal = journal
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.durability = durability
+        self.committed = 0
+        self.unknown = []
+        self._buffer = []
+        self._first = None  # monotonic time the oldest waiting completion was buffered
+        self._queued = 0
+        self._flush_requested = False
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._file = None
+
+        self.replayed = self._replay() if journal is not None else 0
+        self.committed = self.replayed
+        self._queued = self.replayed
+        if journal is not None:
+            self._file = open(journal, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="completion-queue", daemon=True)
+        self._thread.start()
+
+    def complete(self, name, completed_at=None):
+        """
+        Buffer the completion of a habit, it is written with the next group commit
+        :param name: name of the habit
+        :param completed_at: datetime of the completion (default: now)
+        :return: None
+        """
+        completed_at = completed_at or datetime.datetime.now()
+        with self._condition:
+            if self._closed:
+                raise ValueError("the completion queue is closed")
+            if self._file is not None:
+                self._file.write(_journal_line(name, completed_at))
+                if self.durability != "buffered":
+                    self._file.flush()
+                if self.durability == "fsync":
+                    os.fsync(self._file.fileno())
+            if not self._buffer:
+                self._first = time.monotonic()
+            self._buffer.append((str(name), completed_at))
+            self._queued += 1
+            if len(self._buffer) >= self.max_items:
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Write all buffered completions now and wait until they are committed. Completions of habits that don't exist
+        count as committed, they are dropped and collected in unknown.
+        :param timeout: seconds to wait at most (default: no limit)
+        :return: True if everything buffered before the call has been committed, False on timeout
+        """
+        with self._condition:
+            target = self._queued
+            self._flush_requested = True
+            self._condition.notify_all()
+            committed = self._condition.wait_for(lambda: self.committed >= target or self._error is not None,
+                                                 timeout)
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            return committed
+
+    def pending(self):
+        """
+        Get the number of buffered completions that are not committed yet
+        :return: int
+        """
+        with self._condition:
+            return self._queued - self.committed
+
+    def close(self):
+        """
+        Write the buffered completions, stop the background thread and close the journal
+        :return: None
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        """
+        Background thread: wait for a full buffer, the deadline of the oldest completion, a flush or close and write
+        the buffer in one group commit
+        """
+        model = self._writer_model()
+        while True:
+            with self._condition:
+                while not self._ready():
+                    timeout = None if not self._buffer else self._first + self.max_delay - time.monotonic()
+                    self._condition.wait(timeout)
+                if not self._buffer:
+                    return  # closed and nothing left to write
+                batch, self._buffer = self._buffer, []
+                self._flush_requested = False
+                if self._file is not None and self.durability == "buffered":
+                    self._file.flush()
+            unknown = []
+            try:
+                model.complete_habits(batch, once_per_day=True, unknown=unknown)
+            except Exception as error:
+                with self._condition:
+                    # keep the completions for the next attempt, they are still in the journal
+                    self._buffer[:0] = batch
+                    self._first = time.monotonic()
+                    self._error = error
+                    self._condition.notify_all()
+                    if self._closed:
+                        return
+                time.sleep(self.max_delay)
+                continue
+            with self._condition:
+                self.committed += len(batch)
+                self._drop_unknown(batch, unknown)
+                self._error = None
+                self._first = time.monotonic() if self._buffer else None
+                self._rewrite_journal()
+                self._condition.notify_all()
+
+    def _writer_model(self):
+        """
+        Get a model for the writes of the calling thread that doesn't print messages. With a ConnectionManager it has
+        an own connection, sqlite connections belong to one thread.
+        """
+        model = self.model
+        return HabitModel(model.conn if model.manager is None else None, model.manager, model.cache, messages=False)
+
+    def _drop_unknown(self, batch, unknown):
+        """
+        Remember the completions of a written batch whose habit doesn't exist
+        """
+        if unknown:
+            names = set(unknown)
+            self.unknown.extend(item for item in batch if item[0] in names)
+
+    def _ready(self):
+        """
+        Check whether a group commit is due (or the thread can stop), with the condition held
+        """
+        if not self._buffer:
+            return self._closed
+        return (self._closed or self._flush_requested or len(self._buffer) >= self.max_items
+                or time.monotonic() >= self._first + self.max_delay)
+
+    def _rewrite_journal(self):
+        """
+        Replace the journal with the completions that are still waiting, with the condition held
+        """
+        if self._file is None:
+            return
+        if not self._buffer:
+            self._file.seek(0)
+            self._file.truncate()
+        else:
+            self._file.close()
+            with open(self.journal + ".tmp", "w", encoding="utf-8") as file:
+                file.writelines(_journal_line(name, completed_at) for name, completed_at in self._buffer)
+                file.flush()
+                if self.durability == "fsync":
+                    os.fsync(file.fileno())
+            os.replace(self.journal + ".tmp", self.journal)
+            self._file = open(self.journal, "a", encoding="utf-8")
+        if self.durability == "fsync":
+            os.fsync(self._file.fileno())
+
+    def _replay(self):
+        """
+        Write the completions left in the journal by an earlier process and empty it
+        :return: number of completions in the journal
+        """
+        if not os.path.exists(self.journal):
+            return 0
+        batch = []
+        with open(self.journal, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    batch.append((entry["name"], datetime.datetime.fromisoformat(entry["completed_at"])))
+                except (ValueError, KeyError, TypeError):
+                    continue  # the last line is cut off if the process died while writing it
+        if batch:
+            unknown = []
+            self._writer_model().complete_habits(batch, once_per_day=True, unknown=unknown)
+            self._drop_unknown(batch, unknown)
+        open(self.journal, "w").close()
+        return len(batch)
+
+
+def _journal_line(name, completed_at):
+    """
+    Format a completion as a line of the journal
+    """
+    return json.dumps({"name": str(name), "completed_at": completed_at.isoformat(sep=" ")}) + "\n"
@@ -0,0 +1,158 @@
+"""
+Streaming import and export of the habits and habit_logs tables as CSV or JSON Lines.
+
+Rows are read from the database with fetchmany and from files line by line, and written in batches with
+executemany, so the memory use does not depend on the number of rows.
+"""
+import csv
+import json
+from itertools import chain, islice
+from LogStore import archived_logs
+from Rollups import record_completions
+
+# the columns of the tables that can be imported and exported
+COLUMNS = {
+    "habits": ["id", "name", "created_at", "frequency", "is_completed", "ongoing_streak", "longest_streak",
+               "last_completed_at"],
+    "habit_logs": ["id", "habit_id", "completed_at"],
+}
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(path, fmt=None):
+    """
+    Get the file format from the explicit format or the file extension
+    :param path: file path
+    :param fmt: "csv", "jsonl" or None to use the file extension
+    :return: "csv" or "jsonl"
+    """
+    if fmt is None:
+        if path.endswith(".csv"):
+            fmt = "csv"
+        elif path.endswith(".jsonl") or path.endswith(".ndjson"):
+            fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError("unknown format for {!r}, expected one of {}".format(path, ", ".join(FORMATS)))
+    return fmt
+
+
+def _check_table(table):
+    """
+    Raise a ValueError if the table can't be imported or exported
+    :param table: table name
+    :return: None
+    """
+    if table not in COLUMNS:
+        raise ValueError("unknown table {!r}, expected one of {}".format(table, ", ".join(COLUMNS)))
+
+
+def export_table(conn, table, path, fmt=None, chunk_size=10000):
+    """
+    Write all rows of a table to a file
+    :param conn: sqlite3 connection
+    :param table: "habits" or "habit_logs"
+    :param path: file to write
+    :param fmt: "csv" or "jsonl" (default: taken from the file extension)
+    :param chunk_size: number of rows fetched from the database at a time
+    :return: the number of rows written
+    """
+    _check_table(table)
+    fmt = detect_format(path, fmt)
+    columns = COLUMNS[table]
+    count = 0
+
+    c = conn.cursor()
+    c.execute("SELECT {} FROM {} ORDER BY id".format(", ".join(columns), table))
+    chunks = iter(lambda: c.fetchmany(chunk_size), [])
+    if table == "habit_logs":
+        # archived logs have no id, they get a new one when the file is imported
+        archived = ((None,) + log for log in archived_logs(conn))
+        chunks = chain(chunks, iter(lambda: list(islice(archived, chunk_size)), []))
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(columns)
+        for rows in chunks:
+            if fmt == "csv":
+                writer.writerows(rows)
+            else:
+                file.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+            count += len(rows)
+    c.close()
+    return count
+
+
+def _read_rows(file, table, fmt):
+    """
+    Read the rows of a file lazily
+    :return: tuple of the column names and a generator of row tuples
+    """
+    if fmt == "csv":
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return [], iter(())
+        unknown = [column for column in header if column not in COLUMNS[table]]
+        if unknown:
+            raise ValueError("unknown column(s) for table {}: {}".format(table, ", ".join(unknown)))
+        # csv has no null, empty fields are imported as null except for names
+        nullable = [column != "name" for column in header]
+        rows = (tuple(None if value == "" and nullable[i] else value for i, value in enumerate(row))
+                for row in reader if row)
+        return header, rows
+
+    columns = COLUMNS[table]
+    records = (json.loads(line) for line in file if line.strip())
+    return columns, (tuple(record.get(column) for column in columns) for record in records)
+
+
+def import_table(conn, table, path, fmt=None, chunk_size=10000):
+    """
+    Insert the rows of a file into a table. Every chunk of rows is written with executemany and committed in its own
+    transaction, imported logs are added to the rollup tables in the same transaction.
+    :param conn: sqlite3 connection
+    :param table: "habits" or "habit_logs"
+    :param path: file to read
+    :param fmt: "csv" or "jsonl" (default: taken from the file extension)
+    :param chunk_size: number of rows written per transaction
+    :return: the number of rows imported
+    """
+    _check_table(table)
+    fmt = detect_format(path, fmt)
+    count = 0
+
+    with open(path, newline="", encoding="utf-8") as file:
+        columns, rows = _read_rows(file, table, fmt)
+        statement = "INSERT INTO {} ({}) VALUES ({})".format(table, ", ".join(columns),
+                                                             ", ".join("?" * len(columns)))
+        rollup = None
+        if table == "habit_logs" and "habit_id" in columns and "completed_at" in columns:
+            rollup = (columns.index("habit_id"), columns.index("completed_at"))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                count += _write_chunk(conn, statement, chunk, rollup)
+                chunk = []
+        if chunk:
+            count += _write_chunk(conn, statement, chunk, rollup)
+    return count
+
+
+def _write_chunk(conn, statement, chunk, rollup=None):
+    """
+    Write one chunk of rows in a transaction
+    :param rollup: positions of habit_id and completed_at in the rows if they are logs to add to the rollups
+    :return: the number of rows written
+    """
+    try:
+        conn.executemany(statement, chunk)
+        if rollup is not None:
+            record_completions(conn, ((row[rollup[0]], row[rollup[1]]) for row in chunk
+                                      if row[rollup[0]] is not None and row[rollup[1]] is not None))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(chunk)
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from Instrumentation import trace_connection
+
+
+class ConnectionManager:
+    """
+    Hands out one sqlite3 connection per thread for a database file and reuses it for every call
+
+    ...
+
+    Attributes
+    ----------
+
+    path : str
+        path of the sqlite database file (default: habits.db)
+    wal : bool
+        whether the connections are switched to WAL journal mode (default: True)
+    timeout : float
+        seconds a connection waits for a lock held by another writer (default: 30.0)
+    """
+
+    def __init__(self, path='habits.db', wal=True, timeout=30.0):
+        self.path = path
+        self.wal = wal
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        """
+        Get the connection of the calling thread, opening it on first use
+        :return: sqlite3 connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open(self):
+        """
+        Open and configure a new connection to the database file
+        :return: sqlite3 connection
+        """
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys=1")  # enable foreign key constraints
+        if self.wal and self.path != ':memory:':
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return trace_connection(conn)
+
+    def close(self):
+        """
+        Close the connection of the calling thread
+        :return: None
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        """
+        Close every connection handed out by this manager
+        :return: None
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def connect_read_only(path):
+    """
+    Open a read-only connection to a database file, e.g. for analytics that must not take a write lock
+    :param path: path of the sqlite database file
+    :return: sqlite3 connection
+    """
+    from urllib.request import pathname2url  # slow to import, only needed here
+    return sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(path))), uri=True)
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+
+def get_manager():
+    """
+    Get the connection manager shared by the model and the analytics module
+    :return: ConnectionManager
+    """
+    global _default_manager
+    if _default_manager is None:
+        with _default_lock:
+            if _default_manager is None:
+                _default_manager = ConnectionManager()
+    return _default_manager
+
+
+def set_manager(manager):
+    """
+    Replace the shared connection manager, e.g. to point the application at another database file
+    :param manager: ConnectionManager to use from now on
+    :return: None
+    """
+    global _default_manager
+    with _default_lock:
+        if _default_manager is not None and _default_manager is not manager:
+            _default_manager.close_all()
+        _default_manager = manager
+
+
+def get_connection(conn=None):
+    """
+    Get the connection to run a query on
+    :param conn: an already open connection that takes precedence over the shared one
+    :return: sqlite3 connection
+    """
+    if conn is not None:
+        return conn
+    return get_manager().connection()
@@ -1,4 +1,5 @@
 import datetime
+from array import array
 
 
 class Habit:
@@ -26,6 +27,10 @@ class Habit:
         date and time when the habit was last completed (default: None)
     """
 
+    # no per-instance __dict__, keeps large numbers of habits small in memory
+    __slots__ = ("id", "name", "created_at", "frequency", "is_completed", "ongoing_streak", "longest_streak",
+                 "last_completed_at")
+
     def __init__(self, name, frequency):
         self.id = None
         self.name = name
@@ -36,5 +41,88 @@ class Habit:
         self.longest_streak = 0
         self.last_completed_at = None
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Create a Habit from a row of the habits table without formatting a new created_at timestamp
+        :param row: tuple with the columns of the habits table in table order
+        :return: Habit object
+        """
+        habit = cls.__new__(cls)
+        (habit.id, habit.name, habit.created_at, habit.frequency, habit.is_completed, habit.ongoing_streak,
+         habit.longest_streak, habit.last_completed_at) = row
+        return habit
+
+
+class HabitTable:
+    """
+    A column oriented collection of habits for large in-memory sets. The numeric columns are stored in typed
+    arrays and Habit objects are only created when a single habit is accessed.
+
+    ...
+
+    Attributes
+    ----------
+
+    ids, frequencies, is_completed, ongoing_streaks, longest_streaks : array
+        numeric columns of the habits table
+    names, created_at, last_completed_at : list
+        text columns of the habits table
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.names = []
+        self.created_at = []
+        self.frequencies = array("l")
+        self.is_completed = array("b")
+        self.ongoing_streaks = array("l")
+        self.longest_streaks = array("l")
+        self.last_completed_at = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build a table from rows of the habits table
+        :param rows: iterable of tuples with the columns of the habits table in table order
+        :return: HabitTable
+        """
+        table = cls()
+        for row in rows:
+            table.append(row)
+        return table
+
+    def append(self, row):
+        """
+        Add a row of the habits table
+        :param row: tuple with the columns of the habits table in table order
+        :return: None
+        """
+        self.ids.append(row[0])
+        self.names.append(row[1])
+        self.created_at.append(row[2])
+        self.frequencies.append(row[3] or 0)
+        self.is_completed.append(row[4] or 0)
+        self.ongoing_streaks.append(row[5] or 0)
+        self.longest_streaks.append(row[6] or 0)
+        self.last_completed_at.append(row[7])
+
+    def row(self, index):
+        """
+        Get a habit as a tuple in the column order of the habits table
+        :param index: position of the habit in the table
+        :return: tuple
+        """
+        return (self.ids[index], self.names[index], self.created_at[index], self.frequencies[index],
+                self.is_completed[index], self.ongoing_streaks[index], self.longest_streaks[index],
+                self.last_completed_at[index])
+
+    def __len__(self):
+        return len(self.ids)
 
+    def __getitem__(self, index):
+        return Habit.from_row(self.row(index))
 
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
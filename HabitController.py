@@ -1,6 +1,14 @@
+import datetime
 from HabitModel import HabitModel
 from Habit import Habit
-from Analytics import *
+from Analytics import display_table_habits, show_habits_frequency, show_longest_streak, show_longest_streak_habit, \
+    show_completed_within_last_week, get_habit_names, clear_database, habits_with_frequency, longest_streak, \
+    habit_streak, streaks, completions_in_window, habit_statistics
+from DataTransfer import import_table, export_table
+from StreakEngine import recompute_streaks, update_streaks
+from Rollups import rebuild_rollups, daily_completions, weekly_completions
+from Cache import cached
+from LogStore import compact_logs
 
 
 class HabitController:
@@ -8,130 +16,354 @@ class HabitController:
     Controller class for the Habit application
     """
 
-    def __init__(self, db_connection=None):
-        self.model = HabitModel(db_connection)
+    def __init__(self, db_connection=None, manager=None, tenant=None, router=None, messages=None):
+        """
+        :param db_connection: an open connection to use instead of the shared connection manager
+        :param manager: ConnectionManager to take the connection from (default: the shared manager)
+        :param tenant: work on the shard of this tenant instead
+        :param router: ShardRouter that maps the tenant to its shard (default: a ShardRouter for "shards")
+        :param messages: file the messages about changes are printed to (default: stdout), False to not print them
+        """
+        if tenant is not None:
+            if router is None:
+                from Sharding import ShardRouter
+                router = ShardRouter()
+            manager = router.manager(tenant)
+        self.tenant = tenant
+        self.model = HabitModel(db_connection, manager, messages=messages)
 
     def add_habit(self, Habit):
         """
         calls the model to add a habit
         :param Habit: input from the user in the view
-        :return: None
+        :return: True if the habit has been added, False if a habit with the name already exists
         """
-        self.model.add_habit(Habit)
+        return self.model.add_habit(Habit)
 
     def delete_habit(self):
         """
-        Calls the model to get all the habits from the database.
-        Then it prints the habits and asks the user to enter the number of the habit to delete.
+        Asks the user for a part of the name of the habit to delete and lets them pick one of the matching habits.
         Afterwards calls the model to delete the habit.
         :return: None
         """
-        # get all habits from the database
-        rows = self.model.get_habits()
+        habit = self.select_habit("delete")
+        if habit is not None:
+            # call the model to delete the habit
+            self.model.delete_habit(habit)
+
+    def delete_habit_named(self, name):
+        """
+        Calls the model to delete the habit with the exact name, without asking the user.
+        :param name: name of the habit
+        :return: True if the habit has been deleted, False if there is no habit with the name
+        """
+        return self.model.delete_habit(Habit(name, 1))
 
-        # create a list of Habit objects
-        habits = []
-        for row in rows:
-            habit = Habit(row[1], row[3])
-            habits.append(habit)
+    def find_habits(self, fragment, limit=20):
+        """
+        Calls the model to search the habits by a part of their name.
+        :param fragment: part of the habit name
+        :param limit: maximum number of habits to return
+        :return: a list of Habit objects
+        """
+        return [Habit.from_row(row) for row in self.model.search_habits(fragment, limit)]
 
-        # print the habits in a formatted way
+    def select_habit(self, action):
+        """
+        Asks the user for a part of a habit name, prints the matching habits and asks the user to enter the number
+        of one of them.
+        :param action: what will be done with the habit, used in the prompts (e.g. "delete")
+        :return: the selected Habit object or None
+        """
+        fragment = input("enter the name or a part of the name of the habit to {}: ".format(action))
+        habits = self.find_habits(fragment)
+        if not habits:
+            print("no habit matches \033[31m" + fragment + "\033[0m!")
+            return None
+
+        # print the matching habits in a formatted way
         for i, habit in enumerate(habits):
             print("{}. {}".format(i + 1, habit.name))
 
-        # ask the user to enter the number of the habit to delete
+        # ask the user to enter the number of the habit
         try:
-            index = int(input("enter the number of the habit to delete: ")) - 1
+            index = int(input("enter the number of the habit to {}: ".format(action))) - 1
         except ValueError:
             print("please enter a number")
-            index = int(input("enter the number of the habit to delete: ")) - 1
-
-        # select the habit to delete
-        try:  # check if the user entered a valid number
-            habits = habits[index]
-        except IndexError:
-            print("either the number you have entered doesn't exist or is not valid!")
-            return
+            return None
 
-        # call the model to delete the habit
-        self.model.delete_habit(habits)
+        # check if the user entered a valid number
+        if 0 <= index < len(habits):
+            return habits[index]
+        print("either the number you have entered doesn't exist or is not valid!")
+        return None
 
     def show_habits_table(self):
         """
         Calls the analysis module to display the habits in a table
         :return: None
         """
-        display_table_habits()
+        display_table_habits(self.model.conn, self.model.cache)
 
     def get_habits(self):
         """
         Calls the model to get all habits from the database.
-        :return:
+        :return: a list of habits
+        """
+        return self.model.get_habits()
+
+    def get_habit_table(self):
+        """
+        Calls the model to load all habits into a compact column oriented HabitTable.
+        :return: HabitTable
+        """
+        return self.model.get_habit_table()
+
+    def get_habits_page(self, after_id=None, before_id=None, limit=20):
+        """
+        Calls the model to get one page of habits.
+        :param after_id: return the habits following this id
+        :param before_id: return the habits preceding this id
+        :param limit: number of habits per page
+        :return: a list of habits
         """
-        self.model.get_habits()
+        return self.model.get_habits_page(after_id, before_id, limit)
+
+    def get_page_boundary(self, page, limit=20):
+        """
+        Calls the model to get the id after which a page starts.
+        :param page: page number, starting at 1
+        :param limit: number of habits per page
+        :return: the id of the last habit before the page, None for the first page
+        """
+        return self.model.get_page_boundary(page, limit)
+
+    def count_habits(self):
+        """
+        Calls the model to count the habits.
+        :return: number of habits
+        """
+        return self.model.count_habits()
 
     def show_habit_names(self):
         """
         Calls the analysis module to get the habit names.
         :return: None
         """
-        get_habit_names()
+        get_habit_names(self.model.conn, self.model.cache)
 
     def show_completed_within_last_week(self):
         """
         Calls the analysis module to get the completed habits last week and then prints them.
         :return: None
         """
-        show_completed_within_last_week()
+        show_completed_within_last_week(self.model.conn)
 
     def show_longest_streak(self):
         """
         Calls the analysis module to get the longest streak and then prints it.
         :return: None
         """
-        show_longest_streak()
+        show_longest_streak(self.model.conn, self.model.cache)
 
     def show_longest_streak_habit(self):
         """
         Calls the analysis module to get the longest streak for a habit and then prints it.
         :return: None
         """
-        show_longest_streak_habit()
+        show_longest_streak_habit(self.model.conn, self.model.cache)
 
     def show_habits_frequency(self):
         """
         Calls the analysis module to get the habits with a certain frequency and then prints them.
         :return: None
         """
-        show_habits_frequency()
+        show_habits_frequency(self.model.conn, self.model.cache)
+
+    def get_streaks(self):
+        """
+        Calls the analysis module to get the streaks of all habits.
+        :return: list of (name, frequency, ongoing streak, longest streak, last completed at) rows
+        """
+        return streaks(self.model.conn, self.model.cache)
+
+    def get_longest_streak(self):
+        """
+        Calls the analysis module to get the habit with the longest streak.
+        :return: list with one (name, longest streak) row
+        """
+        return longest_streak(self.model.conn, self.model.cache)
+
+    def get_habit_streak(self, name):
+        """
+        Calls the analysis module to get the streaks of a habit.
+        :param name: exact name of the habit
+        :return: list of (name, ongoing streak, longest streak, last completed at) rows, empty if there is no such
+                 habit
+        """
+        return habit_streak(name, self.model.conn, self.model.cache)
+
+    def get_habits_frequency(self, frequency):
+        """
+        Calls the analysis module to get the habits with a certain frequency.
+        :param frequency: frequency in days
+        :return: list of (name, frequency) rows
+        """
+        return habits_with_frequency(frequency, self.model.conn, self.model.cache)
+
+    def get_completed_within_last_week(self):
+        """
+        Calls the analysis module to get the completions of the last 7 days.
+        :return: list of (habit id, habit name, completed at) rows
+        """
+        return list(completions_in_window(datetime.datetime.today() - datetime.timedelta(days=7),
+                                          conn=self.model.conn))
+
+    def get_habit_statistics(self, reference=None):
+        """
+        Calls the analysis module to get the streak and completion statistics of every habit.
+        :param reference: date the completion rate is calculated up to (default: today)
+        :return: dict of habit id to a dict with the statistics, see Analytics.habit_statistics
+        """
+        return habit_statistics(self.model.conn, reference, self.model.cache)
 
     def complete_habit(self):
         """
-        Calls the model to get all habits and then asks the user to select one to complete.
+        Asks the user for a part of the name of the habit to complete and lets them pick one of the matching habits.
         Afterwards calls the models to complete the habit.
         :return: None
         """
-        # get all habits from the database
-        rows = self.model.get_habits()
+        habit = self.select_habit("complete")
+        if habit is not None:
+            self.model.complete_habit(habit)
 
-        # create a list of Habit objects
-        habits = []
-        for row in rows:
-            habit = Habit(row[1], row[2])
-            habits.append(habit)
+    def complete_habit_named(self, name):
+        """
+        Calls the model to complete the habit with the exact name, without asking the user.
+        :param name: name of the habit
+        :return: True if the completion has been recorded, False if the habit doesn't exist or is already completed
+                 today
+        """
+        return self.model.complete_habit(Habit(name, 1))
 
-        # print the habits in a formatted way
-        for i, habit in enumerate(habits):
-            print("{}. {}".format(i + 1, habit.name))
+    def complete_habits(self, batch, once_per_day=False):
+        """
+        Calls the model to complete many habits in one transaction, e.g. for a nightly sync.
+        Unlike complete_habit a batch logs every completion by default, also several of a habit on the same day: a
+        sync or backfill carries recorded events with their own timestamps, which are kept like imported logs and
+        counted by the rollups. Pass once_per_day to get the idempotency of complete_habit instead, so a batch can be
+        written again without logging anything twice.
+        :param batch: iterable of (habit, completed_at) pairs, see HabitModel.complete_habits
+        :param once_per_day: skip the completions on or before the day a habit was last completed
+        :return: the number of completions written
+        """
+        return self.model.complete_habits(batch, once_per_day)
 
-        # ask the user to enter the number of the habit to complete
-        index = int(input("enter the number of the habit to complete: ")) - 1
+    def import_data(self, table, path, fmt=None):
+        """
+        Calls the data transfer module to import the rows of a CSV or JSON Lines file into a table
+        :param table: "habits" or "habit_logs"
+        :param path: file to import
+        :param fmt: "csv" or "jsonl" (default: taken from the file extension)
+        :return: the number of rows imported
+        """
+        count = import_table(self.model.conn, table, path, fmt)
+        self.model.cache.clear()
+        self.model.print_message("\033[31m" + str(count) + "\033[0m rows have been imported into " + table + ".")
+        return count
 
-        # complete the habit if the index is valid
-        if 0 <= index < len(habits):
-            self.model.complete_habit(habits[index])
+    def export_data(self, table, path, fmt=None):
+        """
+        Calls the data transfer module to export a table to a CSV or JSON Lines file
+        :param table: "habits" or "habit_logs"
+        :param path: file to write
+        :param fmt: "csv" or "jsonl" (default: taken from the file extension)
+        :return: the number of rows exported
+        """
+        count = export_table(self.model.conn, table, path, fmt)
+        self.model.print_message("\033[31m" + str(count) + "\033[0m rows of " + table + " have been exported to " + path
+                                 + ".")
+        return count
+
+    def rebuild_streaks(self, incremental=False):
+        """
+        Calls the streak engine to recalculate the streaks of all habits from the habit logs
+        :param incremental: only process the logs added since the last run
+        :return: the number of habits updated
+        """
+        if incremental:
+            count = update_streaks(self.model.conn)
         else:
-            print("either the number you have entered doesn't exist or is not valid!")
+            count = recompute_streaks(self.model.conn)
+        self.model.cache.clear()
+        self.model.print_message("The streaks of \033[31m" + str(count) + "\033[0m habits have been recalculated.")
+        return count
+
+    def rebuild_rollups(self):
+        """
+        Calls the rollup module to recreate the completions per day and per week from the habit logs
+        :return: the number of daily buckets
+        """
+        count = rebuild_rollups(self.model.conn)
+        self.model.cache.invalidate("habit_logs")
+        self.model.print_message("The completion rollups have been rebuilt, \033[31m" + str(count)
+                                 + "\033[0m days with completions.")
+        return count
+
+    def compact_logs(self, before=None):
+        """
+        Calls the log store to move the completions before a day into the compact archive
+        :param before: date (or "%Y-%m-%d" string) of the first day that stays in habit_logs (default: today)
+        :return: the number of logs moved
+        """
+        moved = compact_logs(self.model.conn, before)
+        self.model.cache.invalidate("habit_logs")
+        self.model.print_message("\033[31m" + str(moved) + "\033[0m habit logs have been moved to the archive.")
+        return moved
+
+    def write_snapshot(self, path, full=False):
+        """
+        Calls the snapshot module to bring the read-only analytics snapshot up to date
+        :param path: snapshot file
+        :param full: write the snapshot from scratch instead of appending the new logs
+        :return: the number of logs read from the database
+        """
+        from Snapshot import refresh_snapshot, write_snapshot  # only the snapshot command needs it
+        count = write_snapshot(self.model.conn, path) if full else refresh_snapshot(self.model.conn, path)
+        self.model.print_message("The snapshot " + path + " has been updated, \033[31m" + str(count)
+                                 + "\033[0m habit logs read.")
+        return count
+
+    def daily_completions(self, habit_id=None, start=None, end=None):
+        """
+        Calls the rollup module to get the number of completions per habit and day
+        :param habit_id: only this habit (default: all habits)
+        :param start: first day "%Y-%m-%d", inclusive
+        :param end: last day "%Y-%m-%d", exclusive
+        :return: list of (habit id, day, completions)
+        """
+        return cached(self.model.cache, ("daily_completions", habit_id, start, end),
+                      lambda: daily_completions(self.model.conn, habit_id, start, end), ("habit_logs",),
+                      self.model.conn)
+
+    def weekly_completions(self, habit_id=None, start=None, end=None):
+        """
+        Calls the rollup module to get the number of completions per habit and ISO week
+        :param habit_id: only this habit (default: all habits)
+        :param start: first week "%G-W%V", inclusive
+        :param end: last week "%G-W%V", exclusive
+        :return: list of (habit id, week, completions)
+        """
+        return cached(self.model.cache, ("weekly_completions", habit_id, start, end),
+                      lambda: weekly_completions(self.model.conn, habit_id, start, end), ("habit_logs",),
+                      self.model.conn)
+
+    def cache_stats(self):
+        """
+        Returns the hit and miss counters of the query cache.
+        :return: dict with hits, misses and the current number of cached queries
+        """
+        return self.model.cache.stats()
 
     def insert_sample_data(self):
         """
@@ -146,7 +378,7 @@ class HabitController:
         :return: None
         """
         # clear the database
-        clear_database()
+        clear_database(self.model.conn)
 
         # recreate the tables
         self.model.recreate_tables()
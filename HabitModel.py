@@ -1,164 +1,355 @@
 import sqlite3
 import datetime
+from Database import get_manager
+from Migrations import migrate, reset
+from Habit import HabitTable
+from Cache import QueryCache, cached, habit_tag
+from Rollups import record_completions
+from Instrumentation import instrumented, trace_connection
 
 
 class HabitModel:
 
-    def __init__(self, db_connection=None):
+    def __init__(self, db_connection=None, manager=None, cache=None, messages=None):
         """
         Model for the Habit application
+        :param db_connection: an open connection to use instead of the shared connection manager
+        :param manager: ConnectionManager to take the connection from (default: the shared manager)
+        :param cache: QueryCache for the results of read queries (default: a new QueryCache)
+        :param messages: file the messages for the user are printed to (default: stdout), False to not print them
         """
+        self.messages = messages
+        self.cache = cache if cache is not None else QueryCache()
+        self.manager = None
         if db_connection is not None:
             self.conn = db_connection
         else:
-            self.conn = sqlite3.connect('habits.db')
-            self.conn.execute("PRAGMA foreign_keys=1")  # enable foreign key constraints
-            self.conn.execute("CREATE TABLE IF NOT EXISTS habits (id integer PRIMARY KEY AUTOINCREMENT, "
-                              "                                   name text, "
-                              "                                   created_at date, "
-                              "                                   frequency int, "
-                              "                                   is_completed int, "
-                              "                                   ongoing_streak int, "
-                              "                                   longest_streak int, "
-                              "                                   last_completed_at text)"
-                              )
-            self.conn.execute("CREATE TABLE IF NOT EXISTS habit_logs (id integer PRIMARY KEY AUTOINCREMENT, "
-                              "                                       habit_id int, "
-                              "                                       completed_at date,"
-                              "                                       CONSTRAINT FK_habits "
-                              "                                       FOREIGN KEY (habit_id) REFERENCES habits(id)"
-                              "                                       ON DELETE CASCADE)"
-                              )
+            self.manager = manager if manager is not None else get_manager()
+            self.conn = self.manager.connection()
+        trace_connection(self.conn)
+        migrate(self.conn)  # create the schema or upgrade it in place to the current version
 
+    def print_message(self, text):
+        """
+        Print a message for the user to the messages file of the model
+        :param text: message
+        :return: None
+        """
+        if self.messages is not False:
+            print(text, file=self.messages)
+
+    @instrumented
     def recreate_tables(self):
         """
         recreate the tables in the database
         :return: None
         """
         self.conn.execute("PRAGMA foreign_keys=1")  # enable foreign key constraints
-        self.conn.execute("CREATE TABLE IF NOT EXISTS habits (id integer PRIMARY KEY AUTOINCREMENT, "
-                          "                                   name text, "
-                          "                                   created_at date, "
-                          "                                   frequency int, "
-                          "                                   is_completed int, "
-                          "                                   ongoing_streak int, "
-                          "                                   longest_streak int, "
-                          "                                   last_completed_at text)"
-                          )
-        self.conn.execute("CREATE TABLE IF NOT EXISTS habit_logs (id integer PRIMARY KEY AUTOINCREMENT, "
-                          "                                       habit_id int, "
-                          "                                       completed_at date,"
-                          "                                       CONSTRAINT FK_habits "
-                          "                                       FOREIGN KEY (habit_id) REFERENCES habits(id)"
-                          "                                       ON DELETE CASCADE)"
-                          )
+        reset(self.conn)
+        migrate(self.conn)
+        self.cache.clear()
 
+    @instrumented
     def get_habits(self):
         """
         Get all habits from the database
         :return: a list of habits
         """
-        conn = sqlite3.connect('habits.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM habits")
-        habits = c.fetchall()
-        return habits
+        return cached(self.cache, ("get_habits",), lambda: self.conn.execute("SELECT * FROM habits").fetchall(),
+                      ("habits",), self.conn)
 
+    @instrumented
+    def get_habit_table(self):
+        """
+        Load all habits into a column oriented HabitTable, the rows are streamed from the cursor
+        :return: HabitTable
+        """
+        return HabitTable.from_rows(self.conn.execute("SELECT * FROM habits ORDER BY id"))
+
+    @instrumented
+    def get_habits_page(self, after_id=None, before_id=None, limit=20):
+        """
+        Get one page of habits ordered by id. The page is looked up by the id next to it (keyset pagination), so
+        every page costs the same no matter how far into the table it is.
+        :param after_id: return the habits following this id (default: start at the first habit)
+        :param before_id: return the habits preceding this id instead
+        :param limit: number of habits per page
+        :return: a list of habits
+        """
+        return cached(self.cache, ("get_habits_page", after_id, before_id, limit),
+                      lambda: self._get_habits_page(after_id, before_id, limit), ("habits",), self.conn)
+
+    def _get_habits_page(self, after_id, before_id, limit):
+        """
+        Query one page of habits, see get_habits_page
+        :return: a list of habits
+        """
+        if before_id is not None:
+            c = self.conn.execute("SELECT * FROM (SELECT * FROM habits WHERE id < ? ORDER BY id DESC LIMIT ?) "
+                                  "ORDER BY id", (before_id, limit))
+        elif after_id is not None:
+            c = self.conn.execute("SELECT * FROM habits WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+        else:
+            c = self.conn.execute("SELECT * FROM habits ORDER BY id LIMIT ?", (limit,))
+        return c.fetchall()
+
+    @instrumented
+    def get_page_boundary(self, page, limit=20):
+        """
+        Get the id to pass as after_id to get_habits_page to jump straight to a page
+        :param page: page number, starting at 1
+        :param limit: number of habits per page
+        :return: the id of the last habit before the page, None for the first page
+        """
+        if page <= 1:
+            return None
+        row = self.conn.execute("SELECT id FROM habits ORDER BY id LIMIT 1 OFFSET ?",
+                                ((page - 1) * limit - 1,)).fetchone()
+        return row[0] if row is not None else None
+
+    @instrumented
+    def search_habits(self, fragment, limit=20):
+        """
+        Find habits by a part of their name. Habits whose name starts with the fragment come first (range scan on
+        the unique name index), followed by habits that contain it anywhere (trigram full text index, or LIKE for
+        fragments shorter than three characters and for databases without FTS5).
+        :param fragment: part of the habit name
+        :param limit: maximum number of habits to return
+        :return: a list of habits
+        """
+        fragment = str(fragment)
+        habits = self.conn.execute("SELECT * FROM habits WHERE name >= ? AND name < ? ORDER BY name LIMIT ?",
+                                   (fragment, fragment + "\U0010ffff", limit)).fetchall()
+        if len(habits) >= limit:
+            return habits
+
+        found = {habit[0] for habit in habits}
+        if len(fragment) >= 3 and self._has_search_index():
+            cursor = self.conn.execute("SELECT habits.* FROM habits_fts JOIN habits ON habits.id = habits_fts.rowid "
+                                       "WHERE habits_fts MATCH ? LIMIT ?",
+                                       ('"' + fragment.replace('"', '""') + '"', limit + len(found)))
+        else:
+            pattern = fragment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            cursor = self.conn.execute("SELECT * FROM habits WHERE name LIKE ? ESCAPE '\\' LIMIT ?",
+                                       ("%" + pattern + "%", limit + len(found)))
+        habits.extend(habit for habit in cursor if habit[0] not in found)
+        return habits[:limit]
+
+    def _has_search_index(self):
+        """
+        Check whether the full text index exists, see Migrations.create_search_index
+        :return: bool
+        """
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'habits_fts'").fetchone() is not None
+
+    @instrumented
+    def count_habits(self):
+        """
+        Count the habits in the database
+        :return: number of habits
+        """
+        return cached(self.cache, ("count_habits",),
+                      lambda: self.conn.execute("SELECT COUNT(*) FROM habits").fetchone()[0], ("habits",),
+                      self.conn)
+
+    @instrumented
     def add_habit(self, habit):
         """
         Create a new Habit object and add it to the database
         :param habit: takes the user input for the habit name and frequency
-        :return: None
+        :return: True if the habit has been added, False if a habit with the name already exists
         """
-        self.conn.execute("INSERT INTO habits ( id, "
-                          "                     name, "
-                          "                     created_at, "
-                          "                     frequency, "
-                          "                     is_completed, "
-                          "                     ongoing_streak, "
-                          "                     longest_streak, "
-                          "                     last_completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                          (habit.id, habit.name, habit.created_at, habit.frequency, habit.is_completed,
-                           habit.ongoing_streak,
-                           habit.longest_streak, habit.last_completed_at))
+        try:
+            self.conn.execute("INSERT INTO habits ( id, "
+                              "                     name, "
+                              "                     created_at, "
+                              "                     frequency, "
+                              "                     is_completed, "
+                              "                     ongoing_streak, "
+                              "                     longest_streak, "
+                              "                     last_completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (habit.id, habit.name, habit.created_at, habit.frequency, habit.is_completed,
+                               habit.ongoing_streak,
+                               habit.longest_streak, habit.last_completed_at))
+        except sqlite3.IntegrityError:
+            # habit names are unique, see Migrations.py
+            self.conn.rollback()
+            self.print_message("A habit with the name \u001B[31m{0}\u001B[0m already exists!".format(str(habit.name)))
+            return False
         self.conn.commit()
-        print(
+        self.cache.invalidate("habits", habit_tag(habit.name))
+        self.print_message(
             "Habit with the name \u001B[31m{0}\u001B[0m and the frequency of \u001B[31m{1}\u001B[0m days has been "
             "added successfully!".format(
                 str(habit.name), str(habit.frequency)))
+        return True
 
+    @instrumented
     def delete_habit(self, habit):
         """
         Delete a habit from the database
         :param habit: user input which habit to delete
-        :return: None
+        :return: True if the habit has been deleted, False if there is no habit with the name
         """
-        self.conn = sqlite3.connect('habits.db')
-        self.conn.execute("DELETE FROM habits WHERE name = ?", (habit.name,))
+        deleted = self.conn.execute("DELETE FROM habits WHERE name = ?", (habit.name,)).rowcount
         self.conn.commit()
-        print("Habit with the name \033[31m" + str(habit.name) + "\033[0m has been deleted from the database!")
+        if deleted == 0:
+            self.print_message("There is no habit with the name \033[31m" + str(habit.name) + "\033[0m!")
+            return False
+        self.cache.invalidate("habits", "habit_logs", habit_tag(habit.name))
+        self.print_message("Habit with the name \033[31m" + str(habit.name)
+                           + "\033[0m has been deleted from the database!")
+        return True
 
+    @instrumented
     def complete_habit(self, habit):
         """
-        Update the habit table with the current date and update the ongoing_streak and longest_streak
+        Update the habit table with the current date and update the ongoing_streak and longest_streak. The streaks
+        are read and written in one BEGIN IMMEDIATE transaction, which takes the write lock before the read, so
+        concurrent completions from other threads or processes can't interleave. A habit is completed at most once
+        per day, further completions on the same day are not logged.
         :param habit: user input which habit to complete
-        :return: None
+        :return: True if the completion has been recorded, False if the habit doesn't exist or is already completed
+                 today
         """
-        # get the last_completed_at, ongoing_streak and longest_streak from the habits table for the selected habit
-        cursor = self.conn.execute("SELECT  id, "
-                                   "        last_completed_at, "
-                                   "        ongoing_streak, "
-                                   "        longest_streak, "
-                                   "        frequency "
-                                   "        FROM habits WHERE name = ?", (habit.name,))
-        habit_id, last_completed_at, ongoing_streak, longest_streak, frequency = cursor.fetchone()
-
         # get the current date in different string formats
-        today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        today_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # compare the last_completed_at date with the current date
-        # do nothing if the habit has already been completed today
-        if last_completed_at == today_str:
-            pass
-
-        # update the ongoing_streak and longest_streak if last_completed_at is empty
-        elif last_completed_at == '':
-            ongoing_streak = 1
-
-        # update the ongoing_streak if the last_completed_at date is not empty and the difference between the
-        # current date and the last_completed_at date is equal to the frequency
-        elif last_completed_at is not None and (
-                datetime.datetime.now() - datetime.datetime.strptime(last_completed_at, "%Y-%m-%d")).days == frequency:
-            ongoing_streak = ongoing_streak + 1
-
-        # reset the ongoing_streak if streak has been broken
-        # (i.e. the difference between today and the last_completed_at is not equal to the frequency)
-        else:
-            ongoing_streak = 1
+        now = datetime.datetime.now()
+        today_str = now.strftime("%Y-%m-%d")
+        today_datetime = now.strftime("%Y-%m-%d %H:%M:%S")
 
-        # update the historical longest_streak if the ongoing_streak is higher than the longest streak
-        if ongoing_streak > longest_streak:
-            longest_streak = ongoing_streak
-        else:
-            longest_streak = longest_streak
-
-        # update the habits table with the new values
-        self.conn.execute(
-            "UPDATE habits SET  is_completed = 1, "
-            "                   ongoing_streak = ?, "
-            "                   longest_streak = ?, "
-            "                   last_completed_at = ? "
-            "WHERE name = ?", (ongoing_streak, longest_streak, today_str, habit.name))
-
-        # add a completion entry to the habit_logs table
-        self.conn.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)", (habit_id, today_datetime))
-        self.conn.commit()
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # get the last_completed_at, ongoing_streak and longest_streak from the habits table for the selected habit
+            cursor = self.conn.execute("SELECT  id, "
+                                       "        last_completed_at, "
+                                       "        ongoing_streak, "
+                                       "        longest_streak, "
+                                       "        frequency "
+                                       "        FROM habits WHERE name = ?", (habit.name,))
+            row = cursor.fetchone()
+            if row is None or row[1] == today_str:
+                self.conn.rollback()
+                if row is None:
+                    self.print_message("There is no habit with the name \033[31m" + str(habit.name) + "\033[0m!")
+                else:
+                    self.print_message("Habit with the name \033[31m" + str(habit.name)
+                                       + "\033[0m has already been completed today.")
+                return False
+            habit_id, last_completed_at, ongoing_streak, longest_streak, frequency = row
+
+            ongoing_streak, longest_streak = update_streak(last_completed_at, ongoing_streak, longest_streak,
+                                                           frequency, now)
+
+            # update the habits table with the new values
+            self.conn.execute(
+                "UPDATE habits SET  is_completed = 1, "
+                "                   ongoing_streak = ?, "
+                "                   longest_streak = ?, "
+                "                   last_completed_at = ? "
+                "WHERE id = ?", (ongoing_streak, longest_streak, today_str, habit_id))
+
+            # add a completion entry to the habit_logs table
+            self.conn.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                              (habit_id, today_datetime))
+            record_completions(self.conn, [(habit_id, today_datetime)])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.cache.invalidate("habits", "habit_logs", habit_tag(habit.name))
+
+        self.print_message("Habit with the name \033[31m" + str(habit.name)
+                           + "\033[0m has been marked as completed. The ongoing streak is \033[31m"
+                           + str(ongoing_streak) + "\033[0m and the longest streak is \033[31m" + str(longest_streak)
+                           + "\033[0m. ")
+        return True
 
-        print("Habit with the name \033[31m" + str(habit.name)
-              + "\033[0m has been marked as completed. The ongoing streak is \033[31m" + str(ongoing_streak) +
-              "\033[0m and the longest streak is \033[31m" + str(longest_streak) + "\033[0m. ")
+    @instrumented
+    def complete_habits(self, batch, once_per_day=False, unknown=None):
+        """
+        Complete many habits at once. The streaks are calculated in memory in the order of the completion
+        timestamps and all updates and habit_logs entries are written with executemany in a single transaction.
+        Completions that are older than the last completion of a habit are logged but don't change its streaks.
+        :param batch: iterable of (habit, completed_at) pairs, where habit is a Habit object or a habit name and
+                      completed_at a datetime (None for now)
+        :param once_per_day: like complete_habit, skip the completions on or before the day a habit was last
+                             completed, so writing the same batch twice doesn't log anything twice
+        :param unknown: list the names of the batch without a habit are appended to (default: only printed)
+        :return: the number of completions written
+        """
+        # group the completions by habit name
+        completions = {}
+        now = datetime.datetime.now()
+        for habit, completed_at in batch:
+            name = habit if isinstance(habit, str) else habit.name
+            completions.setdefault(str(name), []).append(completed_at if completed_at is not None else now)
+        if not completions:
+            return 0
+
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # get the current streaks of all habits in the batch, in chunks to stay below the sqlite variable limit
+            names = list(completions)
+            states = {}
+            for i in range(0, len(names), 500):
+                chunk = names[i:i + 500]
+                cursor = self.conn.execute("SELECT  name, "
+                                           "        id, "
+                                           "        last_completed_at, "
+                                           "        ongoing_streak, "
+                                           "        longest_streak, "
+                                           "        frequency "
+                                           "        FROM habits WHERE name IN ({})".format(",".join("?" * len(chunk))),
+                                           chunk)
+                for row in cursor:
+                    states[row[0]] = row[1:]
+
+            updates = []
+            logs = []
+            for name, timestamps in completions.items():
+                if name not in states:
+                    continue
+                habit_id, last_completed_at, ongoing_streak, longest_streak, frequency = states[name]
+                for completed_at in sorted(timestamps):
+                    if once_per_day and last_completed_at is not None and \
+                            completed_at.strftime("%Y-%m-%d") <= last_completed_at:
+                        continue
+                    if last_completed_at is None or completed_at.strftime("%Y-%m-%d") >= last_completed_at:
+                        ongoing_streak, longest_streak = update_streak(last_completed_at, ongoing_streak,
+                                                                       longest_streak, frequency, completed_at)
+                        last_completed_at = completed_at.strftime("%Y-%m-%d")
+                    logs.append((habit_id, completed_at.strftime("%Y-%m-%d %H:%M:%S")))
+                updates.append((ongoing_streak, longest_streak, last_completed_at, habit_id))
 
+            # write all changes at once
+            self.conn.executemany(
+                "UPDATE habits SET  is_completed = 1, "
+                "                   ongoing_streak = ?, "
+                "                   longest_streak = ?, "
+                "                   last_completed_at = ? "
+                "WHERE id = ?", updates)
+            self.conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)", logs)
+            record_completions(self.conn, logs)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.cache.invalidate("habits", "habit_logs", *(habit_tag(name) for name in states))
+
+        missing = [name for name in completions if name not in states]
+        if missing:
+            self.print_message("No habit exists with the name(s): \033[31m" + ", ".join(missing) + "\033[0m")
+            if unknown is not None:
+                unknown.extend(missing)
+        self.print_message("\033[31m" + str(len(logs)) + "\033[0m completions of \033[31m" + str(len(updates)) +
+                           "\033[0m habits have been saved.")
+        return len(logs)
+
+    @instrumented
     def insert_sample_data(self):
         """
         Insert sample data into the database
@@ -217,8 +408,49 @@ class HabitModel:
                 "VALUES (?, ?, ?)",
                 row
             )
+        record_completions(self.conn, [(row[1], row[2]) for row in data_logs])
 
         self.conn.commit()
-        self.conn.close()
+        self.cache.clear()
+
+        self.print_message("Sample data has been inserted into the database.")
+
+
+def update_streak(last_completed_at, ongoing_streak, longest_streak, frequency, completed_at):
+    """
+    Calculate the streaks of a habit after it has been completed
+    :param last_completed_at: date string (%Y-%m-%d) of the previous completion or None
+    :param ongoing_streak: ongoing streak before the completion
+    :param longest_streak: longest streak before the completion
+    :param frequency: frequency of the habit in days
+    :param completed_at: datetime of the completion
+    :return: tuple of the new ongoing_streak and longest_streak
+    """
+    ongoing_streak = ongoing_streak or 0
+    longest_streak = longest_streak or 0
+
+    # compare the last_completed_at date with the date of the completion
+    # do nothing if the habit has already been completed that day
+    if last_completed_at == completed_at.strftime("%Y-%m-%d"):
+        pass
+
+    # update the ongoing_streak and longest_streak if last_completed_at is empty
+    elif last_completed_at == '':
+        ongoing_streak = 1
+
+    # update the ongoing_streak if the last_completed_at date is not empty and the difference between the
+    # completion date and the last_completed_at date is equal to the frequency
+    elif last_completed_at is not None and (
+            completed_at - datetime.datetime.strptime(last_completed_at, "%Y-%m-%d")).days == frequency:
+        ongoing_streak = ongoing_streak + 1
+
+    # reset the ongoing_streak if streak has been broken
+    # (i.e. the difference between the completion and the last_completed_at is not equal to the frequency)
+    else:
+        ongoing_streak = 1
+
+    # update the historical longest_streak if the ongoing_streak is higher than the longest streak
+    if ongoing_streak > longest_streak:
+        longest_streak = ongoing_streak
 
-        print("Sample data has been inserted into the database.")
+    return ongoing_streak, longest_streak
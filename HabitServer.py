@@ -0,0 +1,261 @@
+"""
+HTTP/JSON API for the habit tracker, built on the standard library.
+
+The server speaks HTTP/1.1 with keep-alive and handles every client connection on its own thread. The requests
+are passed on to a HabitService running on a background event loop, so writes are executed one after another by its
+writer and reads run on its pool of reader threads with reused database connections.
+
+    GET    /habits?after_id=&limit=               one page of habits ordered by id
+    GET    /habits/<name>                         a single habit
+    GET    /search?q=&limit=                      habits whose name contains q
+    GET    /statistics                            streak and completion statistics of every habit
+    GET    /completions?start=&end=               completions in a time window ("%Y-%m-%d %H:%M:%S")
+    GET    /completions/daily?habit_id=&start=&end=
+    GET    /completions/weekly?habit_id=&start=&end=
+    POST   /habits                                {"name": ..., "frequency": ...}
+    POST   /habits/<name>/complete                mark a habit as completed now
+    POST   /completions                           {"completions": [[name, completed_at or null], ...]}
+    DELETE /habits/<name>                         delete a habit and its logs
+"""
+import asyncio
+import datetime
+import json
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from DataTransfer import COLUMNS
+from HabitService import HabitService
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class HabitServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server that answers the requests with a HabitService
+
+    ...
+
+    Attributes
+    ----------
+
+    service : HabitService
+        service the requests are passed on to, it runs on the event loop of a background thread
+    quiet : bool
+        whether the log line of every request is suppressed (default: True)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, path='habits.db', readers=4, quiet=True):
+        self.quiet = quiet
+        self.service = HabitService(path, readers=readers)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="habit-service", daemon=True)
+        self._thread.start()
+        self.call(self.service.start)
+        try:
+            super().__init__(address, HabitRequestHandler)
+        except Exception:
+            # e.g. the port is in use, nothing could close the service later
+            self._stop_service()
+            raise
+
+    def call(self, method, *args):
+        """
+        Run a coroutine method of the service on its event loop and wait for the result
+        :param method: coroutine function, e.g. self.service.get_habits
+        :return: the result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(method(*args), self._loop).result()
+
+    def server_close(self):
+        """
+        Close the socket, then finish the pending writes and stop the service
+        :return: None
+        """
+        super().server_close()
+        self._stop_service()
+
+    def _stop_service(self):
+        """
+        Finish the pending writes, stop the service and its event loop
+        """
+        if self._thread.is_alive():
+            self.call(self.service.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+class HabitRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes the requests of one client connection to the service and writes the JSON responses
+    """
+
+    protocol_version = "HTTP/1.1"  # keep the connection open between requests
+    disable_nagle_algorithm = True  # headers and body are written separately, don't delay the body
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _dispatch(self, method):
+        """
+        Read the request body, find the route and send its result as JSON
+        :param method: HTTP method of the request
+        :return: None
+        """
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # without the length of the body the next request can't be found, the connection is closed
+            self.close_connection = True
+            self._send(400, {"error": "invalid Content-Length {!r}".format(self.headers.get("Content-Length"))})
+            return
+        body = self.rfile.read(length) if length else b""
+        try:
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.fullmatch(url.path)
+                if match and route_method == method:
+                    arguments = [unquote(group) for group in match.groups()]
+                    status, payload = handler(self.server, query, json.loads(body) if body else {}, *arguments)
+                    break
+            else:
+                status, payload = 404, {"error": "no route for {} {}".format(method, url.path)}
+        except (ValueError, TypeError, KeyError) as error:
+            # json.JSONDecodeError is a ValueError as well
+            status, payload = 400, {"error": str(error)}
+        except sqlite3.Error as error:
+            status, payload = 500, {"error": str(error)}
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _habit(row):
+    """
+    Turn a row of the habits table into a JSON object
+    """
+    return dict(zip(COLUMNS["habits"], row))
+
+
+def _int(query, key, default=None):
+    value = query.get(key)
+    return default if value is None else int(value)
+
+
+def list_habits(server, query, body):
+    rows = server.call(server.service.get_habits_page, _int(query, "after_id"), None, _int(query, "limit", 20))
+    return 200, [_habit(row) for row in rows]
+
+
+def get_habit(server, query, body, name):
+    row = server.call(server.service.get_habit, name)
+    if row is None:
+        return 404, {"error": "there is no habit with the name {!r}".format(name)}
+    return 200, _habit(row)
+
+
+def search_habits(server, query, body):
+    rows = server.call(server.service.search_habits, query.get("q", ""), _int(query, "limit", 20))
+    return 200, [_habit(row) for row in rows]
+
+
+def statistics(server, query, body):
+    return 200, server.call(server.service.habit_statistics)
+
+
+def completions(server, query, body):
+    start = datetime.datetime.strptime(query["start"], TIMESTAMP_FORMAT)
+    end = datetime.datetime.strptime(query["end"], TIMESTAMP_FORMAT) if "end" in query else None
+    return 200, server.call(server.service.completions_in_window, start, end)
+
+
+def daily_completions(server, query, body):
+    return 200, server.call(server.service.daily_completions, _int(query, "habit_id"), query.get("start"),
+                            query.get("end"))
+
+
+def weekly_completions(server, query, body):
+    return 200, server.call(server.service.weekly_completions, _int(query, "habit_id"), query.get("start"),
+                            query.get("end"))
+
+
+def add_habit(server, query, body):
+    habit_id = server.call(server.service.add_habit, str(body["name"]), int(body["frequency"]))
+    return 201, {"id": habit_id}
+
+
+def complete_habit(server, query, body, name):
+    ongoing_streak, longest_streak = server.call(server.service.complete_habit, name)
+    return 200, {"ongoing_streak": ongoing_streak, "longest_streak": longest_streak}
+
+
+def complete_habits(server, query, body):
+    batch = [(name, datetime.datetime.strptime(completed_at, TIMESTAMP_FORMAT) if completed_at else None)
+             for name, completed_at in body["completions"]]
+    return 200, {"completions": server.call(server.service.complete_habits, batch)}
+
+
+def delete_habit(server, query, body, name):
+    server.call(server.service.delete_habit, name)
+    return 200, {"deleted": name}
+
+
+# method, path pattern and handler of every route, path groups are passed to the handler
+ROUTES = [
+    ("GET", re.compile(r"/habits"), list_habits),
+    ("GET", re.compile(r"/habits/([^/]+)"), get_habit),
+    ("GET", re.compile(r"/search"), search_habits),
+    ("GET", re.compile(r"/statistics"), statistics),
+    ("GET", re.compile(r"/completions"), completions),
+    ("GET", re.compile(r"/completions/daily"), daily_completions),
+    ("GET", re.compile(r"/completions/weekly"), weekly_completions),
+    ("POST", re.compile(r"/habits"), add_habit),
+    ("POST", re.compile(r"/habits/([^/]+)/complete"), complete_habit),
+    ("POST", re.compile(r"/completions"), complete_habits),
+    ("DELETE", re.compile(r"/habits/([^/]+)"), delete_habit),
+]
+
+
+def serve(host="127.0.0.1", port=8000, path='habits.db', readers=4, quiet=False):
+    """
+    Run the server until it is interrupted
+    :param host: address to listen on
+    :param port: port to listen on
+    :param path: path of the sqlite database file
+    :param readers: number of reader threads of the service
+    :param quiet: whether the log line of every request is suppressed
+    :return: None
+    """
+    server = HabitServer((host, port), path, readers, quiet)
+    print("Serving the habit API on \033[31mhttp://{}:{}\033[0m".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,285 @@
+"""
+Asyncio facade over the habit model for many concurrent clients in one process.
+
+Writes are put on a queue and executed one after another by a single writer task on its own thread and
+connection, so they never wait for each other's database locks. Reads run concurrently on a pool of reader threads,
+each with its own connection from the ConnectionManager. With WAL journaling the readers see the last committed
+state while the writer works. All connections share one QueryCache, so a write invalidates the cached reads of every
+reader.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Database import ConnectionManager
+from HabitModel import HabitModel
+from Habit import Habit
+from Cache import QueryCache
+from Analytics import completions_in_window, habit_statistics
+from Rollups import daily_completions, weekly_completions
+
+# marks the end of the write queue
+_STOP = object()
+
+
+class HabitService:
+    """
+    Serves the habit model to asyncio clients: one writer task with a bounded queue and a pool of readers
+
+    The service needs a database file, every thread opens its own connection to it. The models of the service don't
+    print the messages for the interactive menu, the service returns results or raises ValueError instead.
+
+    ...
+
+    Attributes
+    ----------
+
+    path : str
+        path of the sqlite database file (default: habits.db)
+    readers : int
+        number of reader threads (default: 4)
+    queue_size : int
+        maximum number of pending writes, further writes wait for a free slot (default: 1000)
+    cache : QueryCache
+        cache for the read queries shared by the writer and all readers
+    """
+
+    def __init__(self, path='habits.db', readers=4, queue_size=1000, cache=None):
+        self.path = path
+        self.readers = readers
+        self.queue_size = queue_size
+        self.cache = cache if cache is not None else QueryCache()
+        self.manager = None
+        self._local = threading.local()
+        self._queue = None
+        self._writer = None
+        self._write_executor = None
+        self._read_executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        """
+        Open the writer and the reader pool. The schema is migrated by the writer before the first read.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        self.manager = ConnectionManager(self.path)
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="habit-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="habit-reader")
+        await loop.run_in_executor(self._write_executor, self._model)
+        self._queue = asyncio.Queue(self.queue_size)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        """
+        Finish the pending writes, then stop the writer and the readers and close all connections
+        :return: None
+        """
+        if self._writer is None:
+            return
+        await self._queue.put((_STOP, None, None))
+        await self._writer
+        self._writer = None
+        self._write_executor.shutdown()
+        self._read_executor.shutdown()
+        self.manager.close_all()
+
+    def _model(self):
+        """
+        Get the model of the calling thread, it is created on first use with a connection of this thread
+        :return: HabitModel
+        """
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = HabitModel(manager=self.manager, cache=self.cache, messages=False)
+            self._local.model = model
+        return model
+
+    async def _write_loop(self):
+        """
+        Run the queued writes one after another on the writer thread
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            func, args, future = await self._queue.get()
+            if func is _STOP:
+                break
+            try:
+                result = await loop.run_in_executor(self._write_executor, self._run_write, func, args)
+            except Exception as error:
+                if not future.cancelled():
+                    future.set_exception(error)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    def _run_write(self, func, args):
+        """
+        Call a write function with the model of the writer thread
+        """
+        return func(self._model(), *args)
+
+    async def _write(self, func, *args):
+        """
+        Queue a write and wait for its result
+        :param func: function called with the writer's model and args
+        :return: the result of func
+        """
+        if self._writer is None:
+            raise RuntimeError("the habit service has not been started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((func, args, future))
+        return await future
+
+    async def _read(self, func, *args):
+        """
+        Run a read on one of the reader threads
+        :param func: function called with the reader's model and args
+        :return: the result of func
+        """
+        if self._writer is None:
+            raise RuntimeError("the habit service has not been started")
+        return await asyncio.get_running_loop().run_in_executor(self._read_executor, self._run_read, func, args)
+
+    def _run_read(self, func, args):
+        return func(self._model(), *args)
+
+    # writes
+
+    async def add_habit(self, name, frequency):
+        """
+        Add a habit
+        :param name: habit name, must not be used by another habit
+        :param frequency: frequency of the habit in days
+        :return: id of the new habit
+        """
+        return await self._write(_add_habit, name, frequency)
+
+    async def complete_habit(self, name):
+        """
+        Mark a habit as completed now
+        :param name: habit name
+        :return: tuple of the ongoing and the longest streak after the completion
+        """
+        return await self._write(_complete_habit, name)
+
+    async def complete_habits(self, batch):
+        """
+        Record many completions in one transaction, see HabitModel.complete_habits
+        :param batch: iterable of (habit name, completion datetime or None for now) pairs
+        :return: the number of completions recorded
+        """
+        return await self._write(HabitModel.complete_habits, list(batch))
+
+    async def delete_habit(self, name):
+        """
+        Delete a habit and its logs
+        :param name: habit name
+        :return: None
+        """
+        return await self._write(_delete_habit, name)
+
+    # reads
+
+    async def get_habits(self):
+        """
+        Get all habits
+        :return: a list of rows of the habits table
+        """
+        return await self._read(HabitModel.get_habits)
+
+    async def get_habit(self, name):
+        """
+        Get a single habit
+        :param name: habit name
+        :return: row of the habits table or None
+        """
+        return await self._read(_get_habit, name)
+
+    async def count_habits(self):
+        """
+        Get the number of habits
+        :return: int
+        """
+        return await self._read(HabitModel.count_habits)
+
+    async def get_habits_page(self, after_id=None, before_id=None, limit=20):
+        """
+        Get one page of habits ordered by id, see HabitModel.get_habits_page
+        :return: a list of rows of the habits table
+        """
+        return await self._read(HabitModel.get_habits_page, after_id, before_id, limit)
+
+    async def search_habits(self, fragment, limit=20):
+        """
+        Search the habits by a part of their name, see HabitModel.search_habits
+        :return: a list of rows of the habits table
+        """
+        return await self._read(HabitModel.search_habits, fragment, limit)
+
+    async def habit_statistics(self, reference=None):
+        """
+        Get the streak and completion statistics of every habit, see Analytics.habit_statistics
+        :return: dict of habit id to a dict with the statistics
+        """
+        return await self._read(lambda model: habit_statistics(model.conn, reference, model.cache))
+
+    async def completions_in_window(self, start, end=None):
+        """
+        Get the completions in a time window, see Analytics.completions_in_window
+        :return: a list of (habit id, habit name, completed at) tuples
+        """
+        return await self._read(lambda model: list(completions_in_window(start, end, model.conn)))
+
+    async def daily_completions(self, habit_id=None, start=None, end=None):
+        """
+        Get the number of completions per habit and day, see Rollups.daily_completions
+        :return: a list of (habit id, day, completions)
+        """
+        return await self._read(lambda model: daily_completions(model.conn, habit_id, start, end))
+
+    async def weekly_completions(self, habit_id=None, start=None, end=None):
+        """
+        Get the number of completions per habit and ISO week, see Rollups.weekly_completions
+        :return: a list of (habit id, week, completions)
+        """
+        return await self._read(lambda model: weekly_completions(model.conn, habit_id, start, end))
+
+
+def _habit_id(model, name):
+    """
+    Get the id of a habit
+    :raise ValueError: if there is no habit with the name
+    """
+    row = model.conn.execute("SELECT id FROM habits WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        raise ValueError("there is no habit with the name {!r}".format(name))
+    return row[0]
+
+
+def _get_habit(model, name):
+    return model.conn.execute("SELECT * FROM habits WHERE name = ?", (name,)).fetchone()
+
+
+def _add_habit(model, name, frequency):
+    if _get_habit(model, name) is not None:
+        raise ValueError("a habit with the name {!r} already exists".format(name))
+    model.add_habit(Habit(name, frequency))
+    return _habit_id(model, name)
+
+
+def _complete_habit(model, name):
+    _habit_id(model, name)
+    model.complete_habit(Habit(name, 1))
+    return model.conn.execute("SELECT ongoing_streak, longest_streak FROM habits WHERE name = ?", (name,)).fetchone()
+
+
+def _delete_habit(model, name):
+    _habit_id(model, name)
+    model.delete_habit(Habit(name, 1))
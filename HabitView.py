@@ -1,6 +1,11 @@
+import time
 from Habit import Habit
 from HabitController import HabitController
-from tabulate import tabulate
+from Analytics import format_table
+
+# headers of the habits table
+HABIT_HEADERS = ["ID", "Name", "Created at", "Frequency", "Completed", "Ongoing streak", "Longest streak",
+                 "Last completed at"]
 
 
 class HabitView:
@@ -66,7 +71,7 @@ class HabitView:
             ["q.", "quit"]
         ]
         headers = ["Main Menu", "Task"]
-        print(tabulate(menu, headers=headers, tablefmt="fancy_grid"))
+        print(format_table(menu, headers))
 
     def add_habit(self):
         """
@@ -87,10 +92,32 @@ class HabitView:
 
     def show_habits_table(self):
         """
-        calls the controller to show the habits table
+        shows the habits table one page at a time and lets the user browse the pages
         :return: None
         """
-        self.controller.show_habits_table()
+        pager = HabitPager(self.controller)
+        pager.render(pager.first())
+        while True:
+            choice = input("[n]ext page, [p]revious page, [j]ump to page (e.g. j 5), [q]uit: ").strip().lower()
+            if choice in ("n", ""):
+                rows = pager.next()
+            elif choice == "p":
+                rows = pager.previous()
+            elif choice.startswith("j"):
+                try:
+                    rows = pager.jump(int(choice[1:]))
+                except ValueError:
+                    print("please enter the page number after j, e.g. j 5")
+                    continue
+            elif choice == "q":
+                break
+            else:
+                print("Invalid choice. Please try again.")
+                continue
+            if rows is None:
+                print("there is no such page.")
+            else:
+                pager.render(rows)
         print_end()
 
     def show_habit_names(self):
@@ -182,6 +209,108 @@ class HabitView:
         return Habit(name)
 
 
+class HabitPager:
+    """
+    Browses the habits table page by page. Only the rows of the visible page are queried and rendered.
+
+    ...
+
+    Attributes
+    ----------
+
+    controller : HabitController
+        controller to get the pages from
+    page_size : int
+        number of habits per page (default: 20)
+    page : int
+        number of the visible page, starting at 1
+    first_id : int
+        id of the first habit on the visible page
+    last_id : int
+        id of the last habit on the visible page
+    """
+
+    def __init__(self, controller, page_size=20):
+        self.controller = controller
+        self.page_size = page_size
+        self.page = 1
+        self.first_id = None
+        self.last_id = None
+
+    def page_count(self):
+        """
+        counts the pages of the habits table
+        :return: the number of pages
+        """
+        return max(1, -(-self.controller.count_habits() // self.page_size))
+
+    def first(self):
+        """
+        goes to the first page
+        :return: the rows of the first page
+        """
+        return self._show(1, self.controller.get_habits_page(limit=self.page_size))
+
+    def next(self):
+        """
+        goes to the next page
+        :return: the rows of the next page, None if the visible page is the last one
+        """
+        if self.last_id is None:
+            return None
+        return self._show(self.page + 1,
+                          self.controller.get_habits_page(after_id=self.last_id, limit=self.page_size))
+
+    def previous(self):
+        """
+        goes to the previous page
+        :return: the rows of the previous page, None if the visible page is the first one
+        """
+        if self.first_id is None or self.page <= 1:
+            return None
+        return self._show(self.page - 1,
+                          self.controller.get_habits_page(before_id=self.first_id, limit=self.page_size))
+
+    def jump(self, page):
+        """
+        goes straight to a page
+        :param page: page number, starting at 1
+        :return: the rows of the page, None if it doesn't exist
+        """
+        if page < 1:
+            return None
+        if page == 1:
+            return self.first()
+        after_id = self.controller.get_page_boundary(page, self.page_size)
+        if after_id is None:
+            return None
+        return self._show(page, self.controller.get_habits_page(after_id=after_id, limit=self.page_size))
+
+    def _show(self, page, rows):
+        """
+        make the page with the given rows the visible one, unless it is empty
+        :return: the rows, None if there are none
+        """
+        if not rows and page != 1:
+            return None
+        self.page = page
+        self.first_id = rows[0][0] if rows else None
+        self.last_id = rows[-1][0] if rows else None
+        return rows
+
+    def render(self, rows):
+        """
+        prints the rows of the visible page and how long rendering took
+        :param rows: rows of the page
+        :return: render time in seconds
+        """
+        start = time.perf_counter()
+        print(format_table(rows, HABIT_HEADERS))
+        seconds = time.perf_counter() - start
+        print("page {} of {}, rendered in {:.1f} ms".format(self.page, self.page_count(), seconds * 1000))
+        return seconds
+
+
 def print_end():
     """
     Prints a line of dashes.
@@ -0,0 +1,230 @@
+"""
+Timing and query instrumentation for the model and analytics functions.
+
+Set the environment variable HABIT_INSTRUMENT=1 to record for every operation the number of calls, the wall time
+with a latency histogram, the SQL statements executed, the rows returned and the rows written (as counted by
+sqlite3's total_changes, so including the rows written by triggers such as the search index). At exit the metrics are
+written to HABIT_INSTRUMENT_FILE (default: habit_metrics.json), as Prometheus text if the file name ends with
+.prom or .txt and as JSON otherwise.
+
+The variable is read once at import. Without it the instrumented decorator returns the function unchanged and
+trace_connection does nothing, so the instrumentation costs nothing when it is off.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from Habit import HabitTable
+
+ENABLED = os.environ.get("HABIT_INSTRUMENT", "") not in ("", "0")
+METRICS_FILE = os.environ.get("HABIT_INSTRUMENT_FILE", "habit_metrics.json")
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket is unbounded
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# statement counter and open operations of the current thread, updated by the trace callbacks
+_local = threading.local()
+
+
+class Registry:
+    """
+    Collects the metrics of the instrumented operations
+
+    ...
+
+    Attributes
+    ----------
+
+    operations : dict
+        operation name to a dict with calls, seconds, statements, rows_read, rows_written and the counts of the
+        latency buckets
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, statements, rows_read, rows_written):
+        """
+        Add one call of an operation
+        :param name: operation name
+        :param seconds: wall time of the call
+        :param statements: number of SQL statements executed
+        :param rows_read: number of rows returned
+        :param rows_written: number of rows inserted, updated or deleted
+        :return: None
+        """
+        with self._lock:
+            operation = self.operations.get(name)
+            if operation is None:
+                operation = {"calls": 0, "seconds": 0.0, "statements": 0, "rows_read": 0, "rows_written": 0,
+                             "buckets": [0] * (len(BUCKETS) + 1)}
+                self.operations[name] = operation
+            operation["calls"] += 1
+            operation["seconds"] += seconds
+            operation["statements"] += statements
+            operation["rows_read"] += rows_read
+            operation["rows_written"] += rows_written
+            index = 0
+            while index < len(BUCKETS) and seconds > BUCKETS[index]:
+                index += 1
+            operation["buckets"][index] += 1
+
+    def to_json(self):
+        """
+        Get the metrics as a JSON document, the histogram is given as bucket upper bound to count
+        :return: str
+        """
+        with self._lock:
+            result = {}
+            for name, operation in sorted(self.operations.items()):
+                bounds = [str(bound) for bound in BUCKETS] + ["+Inf"]
+                result[name] = dict(operation, buckets=dict(zip(bounds, operation["buckets"])))
+        return json.dumps(result, indent=2)
+
+    def to_prometheus(self):
+        """
+        Get the metrics in the Prometheus text exposition format
+        :return: str
+        """
+        lines = ["# HELP habit_operation_seconds Wall time of the habit tracker operations.",
+                 "# TYPE habit_operation_seconds histogram"]
+        counters = []
+        with self._lock:
+            for name, operation in sorted(self.operations.items()):
+                label = 'operation="{}"'.format(name)
+                total = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), operation["buckets"]):
+                    total += count
+                    lines.append('habit_operation_seconds_bucket{{{},le="{}"}} {}'.format(label, bound, total))
+                lines.append("habit_operation_seconds_sum{{{}}} {}".format(label, operation["seconds"]))
+                lines.append("habit_operation_seconds_count{{{}}} {}".format(label, operation["calls"]))
+                for key in ("statements", "rows_read", "rows_written"):
+                    counters.append((key, label, operation[key]))
+        for key in ("statements", "rows_read", "rows_written"):
+            lines.append("# TYPE habit_operation_{}_total counter".format(key))
+            lines.extend("habit_operation_{}_total{{{}}} {}".format(key, label, value)
+                         for counter, label, value in counters if counter == key)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics to a file, as Prometheus text for .prom and .txt files and as JSON otherwise
+        :param path: file to write
+        :return: None
+        """
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w") as file:
+            file.write(text)
+
+    def clear(self):
+        """
+        Drop all metrics
+        :return: None
+        """
+        with self._lock:
+            self.operations.clear()
+
+
+registry = Registry()
+
+
+def trace_connection(conn, force=False):
+    """
+    Count the statements a connection executes and the rows it changes for the running operations. Does nothing
+    while the instrumentation is off.
+    :param conn: sqlite3 connection
+    :param force: trace the connection even if the instrumentation is off
+    :return: the connection
+    """
+    if ENABLED or force:
+        conn.set_trace_callback(lambda statement: _on_statement(conn))
+    return conn
+
+
+def _on_statement(conn):
+    """
+    Trace callback: count the statement and remember the changes of the connection before the first statement of
+    every running operation
+    """
+    _local.statements = getattr(_local, "statements", 0) + 1
+    for touched in getattr(_local, "frames", ()):
+        if id(conn) not in touched:
+            touched[id(conn)] = (conn, conn.total_changes)
+
+
+class measure:
+    """
+    Context manager that records the block as one call of an operation
+
+    ...
+
+    Attributes
+    ----------
+
+    name : str
+        operation name
+    rows_read : int
+        number of rows the block returned, set it inside the block
+    """
+
+    def __init__(self, name, registry=registry):
+        self.name = name
+        self.rows_read = 0
+        self._registry = registry
+
+    def __enter__(self):
+        frames = getattr(_local, "frames", None)
+        if frames is None:
+            frames = _local.frames = []
+        self._touched = {}
+        frames.append(self._touched)
+        self._statements = getattr(_local, "statements", 0)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        _local.frames.pop()  # the blocks are nested, the innermost is last
+        written = sum(conn.total_changes - changes for conn, changes in self._touched.values())
+        self._registry.record(self.name, seconds, getattr(_local, "statements", 0) - self._statements,
+                              self.rows_read, written)
+
+
+def instrument(func, name=None, registry=registry):
+    """
+    Wrap a function so that every call is recorded as an operation
+    :param func: function to wrap
+    :param name: operation name (default: class and name of a method, module and name of a function)
+    :param registry: Registry to record into
+    :return: the wrapper
+    """
+    if name is None:
+        # methods are named by their class, functions by their module
+        name = func.__qualname__ if "." in func.__qualname__ else "{}.{}".format(func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure(name, registry) as operation:
+            result = func(*args, **kwargs)
+            # lists of rows, dicts by habit id and habit tables count as rows read, generators are not counted
+            if isinstance(result, (list, dict, HabitTable)):
+                operation.rows_read = len(result)
+        return result
+
+    return wrapper
+
+
+def instrumented(func):
+    """
+    Decorator that records every call of the function as an operation while the instrumentation is on
+    :param func: function or method to instrument
+    :return: the wrapper, or the function itself if the instrumentation is off
+    """
+    return instrument(func) if ENABLED else func
+
+
+if ENABLED:
+    atexit.register(lambda: registry.write(METRICS_FILE))
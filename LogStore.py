@@ -0,0 +1,171 @@
+"""
+Compact storage for the history of the habit logs.
+
+habit_logs stores every completion as a row with an autoincrement id and a 19 character "%Y-%m-%d %H:%M:%S" text,
+plus two index entries. compact_logs moves the completions before a day into habit_log_archive, a WITHOUT ROWID
+table keyed by habit id and the time of the completion as seconds since EPOCH, small integers that SQLite stores in
+one to four bytes. Completions of a habit at the same second are stored once with a count. The table is clustered by
+its key, so the completions of a habit are stored next to each other and read in order without an index.
+
+New completions are always written to habit_logs, compacting is explicit (cli.py compact-logs). iter_logs,
+logs_in_window and count_logs read both tables and return the completions in the format of habit_logs, so the
+analytics, the streak engine and the rollups don't need to know where a completion is stored.
+"""
+import datetime
+import heapq
+from itertools import repeat
+
+# time 0 of the archive, 2000-01-01 00:00:00 as unix time; the times are stored without time zone like the text in
+# habit_logs, the offset only keeps the numbers small
+EPOCH = datetime.datetime(2000, 1, 1)
+EPOCH_UNIX = 946684800
+
+# SQL expressions that format the time of an archived completion like habit_logs.completed_at and its day
+ARCHIVE_COMPLETED_AT = "datetime(completed_at + {}, 'unixepoch')".format(EPOCH_UNIX)
+ARCHIVE_DAY = "date(completed_at + {}, 'unixepoch')".format(EPOCH_UNIX)
+
+# only completions in exactly this format are archived, so that they are read back unchanged
+_TIMESTAMP_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]"
+
+# logs that can be moved: older than the given day, in the standard format, of an existing habit and already
+# processed by the incremental streak engine (update_streaks only reads the logs after a habit's checkpoint)
+_MOVABLE = ("completed_at < ? AND completed_at GLOB '{}' AND habit_id IN (SELECT id FROM habits) "
+            "AND id <= COALESCE((SELECT last_log_id FROM streak_checkpoints "
+            "                    WHERE streak_checkpoints.habit_id = habit_logs.habit_id), id)"
+            ).format(_TIMESTAMP_GLOB)
+
+
+def compact_logs(conn, before=None):
+    """
+    Move the completions logged before a day from habit_logs into the archive, in one transaction
+    :param conn: sqlite3 connection
+    :param before: date (or "%Y-%m-%d" string) of the first day that stays in habit_logs (default: today)
+    :return: number of logs moved
+    """
+    before = before or datetime.date.today()
+    if isinstance(before, str):
+        before = datetime.date.fromisoformat(before)  # raises ValueError for anything but a day
+    before = before.strftime("%Y-%m-%d")
+    if conn.in_transaction:
+        conn.commit()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO habit_log_archive (habit_id, completed_at, count) "
+                     "SELECT habit_id, CAST(strftime('%s', completed_at) AS INTEGER) - ?, COUNT(*) "
+                     "FROM habit_logs WHERE " + _MOVABLE + " GROUP BY 1, 2 "
+                     "ON CONFLICT (habit_id, completed_at) DO UPDATE SET count = count + excluded.count",
+                     (EPOCH_UNIX, before))
+        moved = conn.execute("DELETE FROM habit_logs WHERE " + _MOVABLE, (before,)).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return moved
+
+
+def iter_logs(conn, habit_ids=None, first_id=None, last_id=None):
+    """
+    Get the completions of habits from habit_logs and the archive
+    :param conn: sqlite3 connection
+    :param habit_ids: only these habits, at most 500 (default: all habits)
+    :param first_id: only habits with this id or higher (default: no lower bound)
+    :param last_id: only habits with this id or lower (default: no upper bound)
+    :return: generator of (habit id, completed at) tuples ordered by habit id and completed at
+    """
+    conditions = ["habit_id BETWEEN ? AND ?"]
+    params = [-2 ** 63 if first_id is None else first_id, 2 ** 63 - 1 if last_id is None else last_id]
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        conditions.append("habit_id IN ({})".format(",".join("?" * len(habit_ids))))
+        params.extend(habit_ids)
+    where = " WHERE " + " AND ".join(conditions)
+
+    recent = conn.execute("SELECT habit_id, completed_at FROM habit_logs" + where +
+                          " ORDER BY habit_id, completed_at", params)
+    archived = conn.execute("SELECT count, habit_id, " + ARCHIVE_COMPLETED_AT + " FROM habit_log_archive" + where +
+                            " ORDER BY habit_id, completed_at", params)
+    return heapq.merge(recent, _expand(archived))
+
+
+def archived_logs(conn):
+    """
+    Get the completions of the archive only
+    :param conn: sqlite3 connection
+    :return: generator of (habit id, completed at) tuples ordered by habit id and completed at
+    """
+    return _expand(conn.execute("SELECT count, habit_id, " + ARCHIVE_COMPLETED_AT + " FROM habit_log_archive "
+                                "ORDER BY habit_id, completed_at"))
+
+
+def logs_in_window(conn, start, end=None, chunk_size=1000):
+    """
+    Get the completions of all habits within the window [start, end) from habit_logs and the archive
+    :param conn: sqlite3 connection
+    :param start: "%Y-%m-%d %H:%M:%S" where the window starts, inclusive
+    :param end: "%Y-%m-%d %H:%M:%S" where the window ends, exclusive (default: no upper bound)
+    :param chunk_size: number of rows fetched from the cursors at a time
+    :return: generator of (habit id, habit name, completed at) tuples ordered by completed at
+    """
+    # the range is evaluated by SQLite on the index of habit_logs.completed_at and on the key of the archive,
+    # habit by habit (CROSS JOIN keeps habits the outer loop)
+    window = "completed_at >= ?"
+    params = [start]
+    archive_params = [_seconds(start)]
+    if end is not None:
+        window += " AND completed_at < ?"
+        params.append(end)
+        archive_params.append(_seconds(end))
+
+    recent = conn.execute("SELECT habit_logs.habit_id, habits.name, habit_logs.completed_at "
+                          "FROM habit_logs JOIN habits ON habit_logs.habit_id = habits.id "
+                          "WHERE habit_logs." + window + " ORDER BY habit_logs.completed_at", params)
+    archived = conn.execute("SELECT count, habits.id, habits.name, " + ARCHIVE_COMPLETED_AT + " "
+                            "FROM habits CROSS JOIN habit_log_archive ON habit_log_archive.habit_id = habits.id "
+                            "WHERE habit_log_archive." + window + " ORDER BY habit_log_archive.completed_at",
+                            archive_params)
+    return heapq.merge(_fetch(recent, chunk_size), _expand(_fetch(archived, chunk_size)), key=lambda row: row[2])
+
+
+def count_logs(conn, by_habit=False):
+    """
+    Count the completions in habit_logs and the archive
+    :param conn: sqlite3 connection
+    :param by_habit: count per habit
+    :return: number of completions, or dict of habit id to number of completions
+    """
+    if by_habit:
+        counts = dict(conn.execute("SELECT habit_id, COUNT(*) FROM habit_logs GROUP BY habit_id"))
+        for habit_id, count in conn.execute("SELECT habit_id, SUM(count) FROM habit_log_archive GROUP BY habit_id"):
+            counts[habit_id] = counts.get(habit_id, 0) + count
+        return counts
+    return (conn.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0]
+            + conn.execute("SELECT COALESCE(SUM(count), 0) FROM habit_log_archive").fetchone()[0])
+
+
+def _seconds(timestamp):
+    """
+    Convert a "%Y-%m-%d %H:%M:%S" timestamp into seconds since EPOCH
+    """
+    return int((datetime.datetime.fromisoformat(timestamp) - EPOCH).total_seconds())
+
+
+def _fetch(cursor, chunk_size):
+    """
+    Yield the rows of a cursor, fetched in chunks
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _expand(rows):
+    """
+    Repeat every archived completion count times, the count is the first column and is dropped
+    """
+    for row in rows:
+        if row[0] == 1:
+            yield row[1:]
+        else:
+            yield from repeat(row[1:], row[0])
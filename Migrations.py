@@ -0,0 +1,154 @@
+"""
+Versioned schema migrations for the habits database.
+
+The schema version of a database file is stored in ``PRAGMA user_version``. Every migration upgrades the schema by
+exactly one version, so an existing habits.db is upgraded in place by running only the migrations it is missing.
+"""
+import sqlite3
+from Rollups import fill_rollups
+
+
+def create_search_index(conn):
+    """
+    Create the full text index used by HabitModel.search_habits and keep it in sync with habits.name through
+    triggers. SQLite builds without FTS5 or its trigram tokenizer skip it, searching then falls back to LIKE.
+    :param conn: sqlite3 connection
+    :return: None
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS habits_fts USING fts5(name, content='habits', "
+                     "content_rowid='id', tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    conn.execute("CREATE TRIGGER IF NOT EXISTS habits_fts_insert AFTER INSERT ON habits BEGIN "
+                 "INSERT INTO habits_fts (rowid, name) VALUES (new.id, new.name); END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS habits_fts_delete AFTER DELETE ON habits BEGIN "
+                 "INSERT INTO habits_fts (habits_fts, rowid, name) VALUES ('delete', old.id, old.name); END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS habits_fts_update AFTER UPDATE OF name ON habits BEGIN "
+                 "INSERT INTO habits_fts (habits_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                 "INSERT INTO habits_fts (rowid, name) VALUES (new.id, new.name); END")
+    conn.execute("INSERT INTO habits_fts (habits_fts) VALUES ('rebuild')")
+
+
+# each migration is a list of statements (or functions taking the connection) that upgrades the schema from the
+# previous version to its own version
+MIGRATIONS = [
+    # 1: the original tables
+    ["CREATE TABLE IF NOT EXISTS habits (id integer PRIMARY KEY AUTOINCREMENT, "
+     "                                   name text, "
+     "                                   created_at date, "
+     "                                   frequency int, "
+     "                                   is_completed int, "
+     "                                   ongoing_streak int, "
+     "                                   longest_streak int, "
+     "                                   last_completed_at text)",
+     "CREATE TABLE IF NOT EXISTS habit_logs (id integer PRIMARY KEY AUTOINCREMENT, "
+     "                                       habit_id int, "
+     "                                       completed_at date,"
+     "                                       CONSTRAINT FK_habits "
+     "                                       FOREIGN KEY (habit_id) REFERENCES habits(id)"
+     "                                       ON DELETE CASCADE)"],
+
+    # 2: unique habit names and indexes for the lookups by name and the joins on habit_id.
+    # habits that share a name are merged into the oldest one (the logs are moved over) before the unique index
+    # is created, a plain index on name keeps the merge from scanning the table for every row
+    ["CREATE INDEX IF NOT EXISTS idx_habits_name_merge ON habits (name)",
+     "UPDATE habit_logs SET habit_id = (SELECT MIN(keep.id) FROM habits AS dup "
+     "                                  JOIN habits AS keep ON keep.name = dup.name "
+     "                                  WHERE dup.id = habit_logs.habit_id) "
+     "WHERE habit_id IN (SELECT dup.id FROM habits AS dup "
+     "                   WHERE dup.id > (SELECT MIN(keep.id) FROM habits AS keep WHERE keep.name = dup.name))",
+     "DELETE FROM habits WHERE id > (SELECT MIN(keep.id) FROM habits AS keep WHERE keep.name = habits.name)",
+     "DROP INDEX idx_habits_name_merge",
+     "CREATE UNIQUE INDEX IF NOT EXISTS idx_habits_name ON habits (name)",
+     "CREATE INDEX IF NOT EXISTS idx_habit_logs_habit_completed ON habit_logs (habit_id, completed_at)"],
+
+    # 3: index for the date range queries over all habits
+    ["CREATE INDEX IF NOT EXISTS idx_habit_logs_completed ON habit_logs (completed_at)"],
+
+    # 4: checkpoints of the streak engine, see StreakEngine.py
+    ["CREATE TABLE IF NOT EXISTS streak_checkpoints (habit_id integer PRIMARY KEY, "
+     "                                               last_log_id int, "
+     "                                               last_completed_at text, "
+     "                                               ongoing_streak int, "
+     "                                               longest_streak int, "
+     "                                               FOREIGN KEY (habit_id) REFERENCES habits(id) "
+     "                                               ON DELETE CASCADE)"],
+
+    # 5: full text index for searching habits by a part of their name
+    [create_search_index],
+
+    # 6: completions per habit and day and per habit and ISO week, see Rollups.py
+    ["CREATE TABLE IF NOT EXISTS habit_daily_completions (habit_id int, "
+     "                                                    day text, "
+     "                                                    completions int, "
+     "                                                    PRIMARY KEY (habit_id, day), "
+     "                                                    FOREIGN KEY (habit_id) REFERENCES habits(id) "
+     "                                                    ON DELETE CASCADE) WITHOUT ROWID",
+     "CREATE TABLE IF NOT EXISTS habit_weekly_completions (habit_id int, "
+     "                                                     week text, "
+     "                                                     completions int, "
+     "                                                     PRIMARY KEY (habit_id, week), "
+     "                                                     FOREIGN KEY (habit_id) REFERENCES habits(id) "
+     "                                                     ON DELETE CASCADE) WITHOUT ROWID",
+     "CREATE INDEX IF NOT EXISTS idx_habit_daily_completions_day ON habit_daily_completions (day)",
+     "CREATE INDEX IF NOT EXISTS idx_habit_weekly_completions_week ON habit_weekly_completions (week)",
+     fill_rollups],
+
+    # 7: compact archive of old completions, see LogStore.py
+    ["CREATE TABLE IF NOT EXISTS habit_log_archive (habit_id int NOT NULL, "
+     "                                              completed_at int NOT NULL, "
+     "                                              count int NOT NULL DEFAULT 1, "
+     "                                              PRIMARY KEY (habit_id, completed_at), "
+     "                                              FOREIGN KEY (habit_id) REFERENCES habits(id) "
+     "                                              ON DELETE CASCADE) WITHOUT ROWID"],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    """
+    Get the schema version of a database
+    :param conn: sqlite3 connection
+    :return: the version stored in PRAGMA user_version
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Upgrade the schema of a database to the latest version. Every migration runs in its own transaction together
+    with the update of the version number, so an interrupted upgrade can simply be run again.
+    :param conn: sqlite3 connection
+    :return: the schema version after the upgrade
+    """
+    version = get_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    if conn.in_transaction:
+        conn.commit()
+    for version in range(version + 1, SCHEMA_VERSION + 1):
+        try:
+            conn.execute("BEGIN")
+            for statement in MIGRATIONS[version - 1]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute("PRAGMA user_version = {:d}".format(version))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return version
+
+
+def reset(conn):
+    """
+    Mark a database as empty so that the next migrate() creates the whole schema again, e.g. after dropping tables
+    :param conn: sqlite3 connection
+    :return: None
+    """
+    conn.execute("PRAGMA user_version = 0")
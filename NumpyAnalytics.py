@@ -0,0 +1,156 @@
+"""
+Vectorized NumPy backend for the streak and completion statistics of Analytics.habit_statistics.
+
+The habit logs are loaded into two columnar arrays (habit id, day number) and every statistic is computed with
+array operations over all habits at once. NumPy is optional: the module can be imported without it, but calling
+its functions raises an ImportError.
+"""
+import datetime
+from Database import get_connection
+from LogStore import ARCHIVE_DAY
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+# julianday() of 0001-01-01 minus one, turns a julian day into the same number as date.toordinal()
+_ORDINAL_OFFSET = 1721424.5
+
+
+def _require_numpy():
+    """
+    Raise an ImportError if numpy is not installed
+    """
+    if np is None:
+        raise ImportError("the NumPy analytics backend needs numpy, install it with 'pip install numpy'")
+
+
+def load_logs(conn=None, chunk_size=100000):
+    """
+    Load the habit logs into columnar arrays. The day numbers are calculated by SQLite, so no timestamp is parsed
+    in Python.
+    :param conn: connection to query, defaults to the shared connection
+    :param chunk_size: number of rows fetched from the cursor at a time
+    :return: tuple of two int64 arrays (habit ids, day numbers as in date.toordinal())
+    """
+    _require_numpy()
+    conn = get_connection(conn)
+    c = conn.cursor()
+    c.execute("SELECT habit_id, CAST(julianday(substr(completed_at, 1, 10)) - ? AS INTEGER) FROM habit_logs "
+              "UNION ALL SELECT habit_id, CAST(julianday(" + ARCHIVE_DAY + ") - ? AS INTEGER) FROM habit_log_archive",
+              (_ORDINAL_OFFSET, _ORDINAL_OFFSET))
+    chunks = []
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64).reshape(-1, 2))
+    c.close()
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    logs = np.concatenate(chunks)
+    return logs[:, 0], logs[:, 1]
+
+
+def habit_statistics(conn=None, reference=None):
+    """
+    Vectorized version of Analytics.habit_statistics, returns the same result
+    :param conn: connection to query, defaults to the shared connection
+    :param reference: date the completion rate is calculated up to (default: today)
+    :return: dict of habit id to a dict with the statistics
+    """
+    _require_numpy()
+    conn = get_connection(conn)
+    habits = np.array(conn.execute("SELECT id, frequency FROM habits ORDER BY id").fetchall(),
+                      dtype=np.int64).reshape(-1, 2)
+    habit_ids, days = load_logs(conn)
+    stats = compute_statistics(habit_ids, days, habits[:, 0], habits[:, 1],
+                               (reference or datetime.date.today()).toordinal())
+    return statistics_by_habit(habits[:, 0], stats)
+
+
+def statistics_by_habit(ids, stats):
+    """
+    Convert the arrays of compute_statistics into the result of Analytics.habit_statistics
+    :param ids: sorted int array of all habit ids
+    :param stats: dict of statistic name to an array aligned with ids
+    :return: dict of habit id to a dict with the statistics
+    """
+    result = {}
+    for i, habit_id in enumerate(ids.tolist()):
+        result[habit_id] = {
+            "longest_streak": int(stats["longest_streak"][i]),
+            "ongoing_streak": int(stats["ongoing_streak"][i]),
+            "completions": int(stats["completions"][i]),
+            "completion_rate": float(stats["completion_rate"][i]),
+            "max_gap": int(stats["max_gap"][i]),
+            "mean_gap": float(stats["mean_gap"][i]),
+        }
+    return result
+
+
+def compute_statistics(habit_ids, days, ids, frequencies, reference):
+    """
+    Compute the statistics of all habits from columnar log arrays
+    :param habit_ids: int array with the habit id of every log
+    :param days: int array with the day number of every log
+    :param ids: sorted int array of all habit ids
+    :param frequencies: int array with the frequency of every habit in ids
+    :param reference: day number the completion rate is calculated up to
+    :return: dict of statistic name to an array aligned with ids
+    """
+    _require_numpy()
+    count = len(ids)
+    stats = {
+        "longest_streak": np.zeros(count, dtype=np.int64),
+        "ongoing_streak": np.zeros(count, dtype=np.int64),
+        "completions": np.zeros(count, dtype=np.int64),
+        "completion_rate": np.zeros(count, dtype=np.float64),
+        "max_gap": np.zeros(count, dtype=np.int64),
+        "mean_gap": np.zeros(count, dtype=np.float64),
+    }
+
+    # drop logs of unknown habits, then keep one entry per habit and day in sorted order
+    positions = np.searchsorted(ids, habit_ids)
+    known = positions < count
+    known[known] = ids[positions[known]] == habit_ids[known]
+    positions, days = positions[known], days[known]
+    if len(days) == 0:
+        return stats
+    order = np.lexsort((days, positions))
+    positions, days = positions[order], days[order]
+    distinct = np.ones(len(days), dtype=bool)
+    distinct[1:] = (positions[1:] != positions[:-1]) | (days[1:] != days[:-1])
+    positions, days = positions[distinct], days[distinct]
+
+    # segments of consecutive entries belonging to the same habit
+    n = len(days)
+    first = np.ones(n, dtype=bool)
+    first[1:] = positions[1:] != positions[:-1]
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], n) - 1
+    segment_habits = positions[starts]
+
+    # a completion continues the streak if it is exactly one period after the previous one of the same habit
+    gaps = np.zeros(n, dtype=np.int64)
+    gaps[1:] = days[1:] - days[:-1]
+    gaps[first] = 0
+    continues = (gaps == frequencies[positions]) & ~first
+
+    # the streak at every entry is its distance to the latest entry that started a streak
+    breaks = np.flatnonzero(~continues)
+    streak = np.arange(n) - breaks[np.cumsum(~continues) - 1] + 1
+
+    completions = ends - starts + 1
+    first_days = days[starts]
+    periods = np.where(reference >= first_days, (reference - first_days) // frequencies[segment_habits] + 1, 1)
+
+    stats["longest_streak"][segment_habits] = np.maximum.reduceat(streak, starts)
+    stats["ongoing_streak"][segment_habits] = streak[ends]
+    stats["completions"][segment_habits] = completions
+    stats["completion_rate"][segment_habits] = np.minimum(1.0, completions / periods)
+    stats["max_gap"][segment_habits] = np.maximum.reduceat(gaps, starts)
+    stats["mean_gap"][segment_habits] = np.where(completions > 1,
+                                                 (days[ends] - first_days) / np.maximum(completions - 1, 1), 0.0)
+    return stats
@@ -0,0 +1,97 @@
+"""
+Multi-process backend for the streak and completion statistics of Analytics.habit_statistics.
+
+The habits are split into ranges of habit ids with about the same number of logs. Every range is calculated by a
+worker of a ProcessPoolExecutor with its own read-only connection to the database file, and the partial results are
+merged in the order of the ranges, so the result is the same for any number of workers.
+"""
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+from Analytics import _habit_statistics
+from Database import connect_read_only
+from LogStore import count_logs
+
+# read-only connection of a worker process, opened by _open_worker
+_worker_conn = None
+
+
+def partition(conn, parts):
+    """
+    Split the habits into ranges of habit ids with about the same number of logs each
+    :param conn: sqlite3 connection
+    :param parts: maximum number of ranges
+    :return: list of (first id, last id) tuples in ascending order, covering all habits
+    """
+    ids = [row[0] for row in conn.execute("SELECT id FROM habits ORDER BY id")]
+    if not ids:
+        return []
+    # one index scan of habit_logs and one scan of the archive, habits without logs still cost a little
+    weights = count_logs(conn, by_habit=True)
+    costs = [weights.get(habit_id, 0) + 1 for habit_id in ids]
+    target = sum(costs) / max(1, parts)
+
+    ranges = []
+    first = 0
+    total = 0
+    for i, cost in enumerate(costs):
+        total += cost
+        if total >= target * (len(ranges) + 1) and len(ranges) < parts - 1:
+            ranges.append((ids[first], ids[i]))
+            first = i + 1
+    if first < len(ids):
+        ranges.append((ids[first], ids[-1]))
+    return ranges
+
+
+def _open_worker(path):
+    """
+    Open the read-only connection of a worker process, it is reused for every range the worker calculates
+    """
+    global _worker_conn
+    _worker_conn = connect_read_only(path)
+
+
+def _statistics_range(reference, first_id, last_id):
+    """
+    Calculate the statistics of one range of habit ids in a worker process
+    """
+    return _habit_statistics(_worker_conn, reference, first_id, last_id)
+
+
+def habit_statistics(path, reference=None, workers=None, parts=None):
+    """
+    Parallel version of Analytics.habit_statistics, returns the same result
+    :param path: path of the sqlite database file, an in-memory database can't be shared with other processes
+    :param reference: date the completion rate is calculated up to (default: today)
+    :param workers: number of worker processes (default: number of CPUs)
+    :param parts: number of habit id ranges (default: four per worker, so a slow range doesn't hold up the rest)
+    :return: dict of habit id to a dict with the statistics, ordered by habit id
+    """
+    if path == ':memory:':
+        raise ValueError("the parallel analytics need a database file")
+    reference = (reference or datetime.date.today()).toordinal()
+    workers = workers or os.cpu_count() or 1
+
+    conn = connect_read_only(path)
+    try:
+        ranges = partition(conn, parts or workers * 4)
+        if workers == 1:
+            return _merge(_habit_statistics(conn, reference, first, last) for first, last in ranges)
+    finally:
+        conn.close()
+
+    with ProcessPoolExecutor(workers, initializer=_open_worker, initargs=(path,)) as pool:
+        firsts, lasts = zip(*ranges) if ranges else ((), ())
+        return _merge(pool.map(_statistics_range, [reference] * len(ranges), firsts, lasts))
+
+
+def _merge(results):
+    """
+    Merge the partial results of the ranges in ascending order of the habit ids
+    """
+    statistics = {}
+    for result in results:
+        for habit_id in sorted(result):
+            statistics[habit_id] = result[habit_id]
+    return statistics
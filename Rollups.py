@@ -0,0 +1,129 @@
+"""
+Materialized completion counts per habit and day and per habit and ISO week.
+
+The rollup tables habit_daily_completions and habit_weekly_completions are kept up to date by complete_habit,
+complete_habits and the import of habit_logs, so questions like "how often was a habit completed per week" are
+answered from one row per bucket instead of a scan of habit_logs. rebuild_rollups recreates them from the logs.
+"""
+import datetime
+from collections import Counter
+from LogStore import ARCHIVE_DAY
+
+
+def week_of(day):
+    """
+    Get the ISO week of a day
+    :param day: "%Y-%m-%d" string (longer timestamps are cut to the date)
+    :return: week as "%G-W%V", e.g. "2023-W18"
+    """
+    year, week, _ = datetime.date.fromisoformat(day[:10]).isocalendar()
+    return "{:04d}-W{:02d}".format(year, week)
+
+
+def record_completions(conn, completions):
+    """
+    Add completions to the rollup tables. Runs inside the transaction of the caller, which also writes the logs.
+    :param conn: sqlite3 connection
+    :param completions: iterable of (habit id, completed_at) pairs
+    :return: None
+    """
+    daily = Counter((habit_id, str(completed_at)[:10]) for habit_id, completed_at in completions)
+    weekly = Counter()
+    for (habit_id, day), count in daily.items():
+        weekly[habit_id, week_of(day)] += count
+
+    conn.executemany("INSERT INTO habit_daily_completions (habit_id, day, completions) VALUES (?, ?, ?) "
+                     "ON CONFLICT (habit_id, day) DO UPDATE SET completions = completions + excluded.completions",
+                     ((habit_id, day, count) for (habit_id, day), count in daily.items()))
+    conn.executemany("INSERT INTO habit_weekly_completions (habit_id, week, completions) VALUES (?, ?, ?) "
+                     "ON CONFLICT (habit_id, week) DO UPDATE SET completions = completions + excluded.completions",
+                     ((habit_id, week, count) for (habit_id, week), count in weekly.items()))
+
+
+def rebuild_rollups(conn):
+    """
+    Recreate the rollup tables from habit_logs. The daily counts are aggregated by SQLite, the weekly counts are
+    summed up from the daily ones.
+    :param conn: sqlite3 connection
+    :return: number of daily buckets
+    """
+    if conn.in_transaction:
+        conn.commit()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        count = fill_rollups(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def fill_rollups(conn):
+    """
+    Replace the content of the rollup tables with the counts from habit_logs and the log archive, inside the
+    caller's transaction
+    :param conn: sqlite3 connection
+    :return: number of daily buckets
+    """
+    conn.execute("DELETE FROM habit_daily_completions")
+    conn.execute("DELETE FROM habit_weekly_completions")
+    logs = "SELECT habit_id, substr(completed_at, 1, 10) AS day, 1 AS count FROM habit_logs"
+    # the archive is created by a later migration than the rollups
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'habit_log_archive'").fetchone() is not None:
+        logs += " UNION ALL SELECT habit_id, " + ARCHIVE_DAY + ", count FROM habit_log_archive"
+    conn.execute("INSERT INTO habit_daily_completions (habit_id, day, completions) "
+                 "SELECT habit_id, day, SUM(count) FROM (" + logs + ") "
+                 "WHERE habit_id IN (SELECT id FROM habits) GROUP BY habit_id, day")
+    weekly = Counter()
+    for habit_id, day, count in conn.execute("SELECT habit_id, day, completions FROM habit_daily_completions"):
+        weekly[habit_id, week_of(day)] += count
+    conn.executemany("INSERT INTO habit_weekly_completions (habit_id, week, completions) VALUES (?, ?, ?)",
+                     ((habit_id, week, count) for (habit_id, week), count in weekly.items()))
+    return conn.execute("SELECT COUNT(*) FROM habit_daily_completions").fetchone()[0]
+
+
+def daily_completions(conn, habit_id=None, start=None, end=None):
+    """
+    Get the number of completions per habit and day
+    :param conn: sqlite3 connection
+    :param habit_id: only this habit (default: all habits)
+    :param start: first day "%Y-%m-%d", inclusive (default: no lower bound)
+    :param end: last day "%Y-%m-%d", exclusive (default: no upper bound)
+    :return: list of (habit id, day, completions) ordered by habit and day
+    """
+    return _buckets(conn, "habit_daily_completions", "day", habit_id, start, end)
+
+
+def weekly_completions(conn, habit_id=None, start=None, end=None):
+    """
+    Get the number of completions per habit and ISO week
+    :param conn: sqlite3 connection
+    :param habit_id: only this habit (default: all habits)
+    :param start: first week "%G-W%V", inclusive (default: no lower bound)
+    :param end: last week "%G-W%V", exclusive (default: no upper bound)
+    :return: list of (habit id, week, completions) ordered by habit and week
+    """
+    return _buckets(conn, "habit_weekly_completions", "week", habit_id, start, end)
+
+
+def _buckets(conn, table, bucket, habit_id, start, end):
+    """
+    Query a rollup table, see daily_completions and weekly_completions
+    """
+    conditions = []
+    params = []
+    if habit_id is not None:
+        conditions.append("habit_id = ?")
+        params.append(habit_id)
+    if start is not None:
+        conditions.append("{} >= ?".format(bucket))
+        params.append(start)
+    if end is not None:
+        conditions.append("{} < ?".format(bucket))
+        params.append(end)
+    query = "SELECT habit_id, {0}, completions FROM {1}".format(bucket, table)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY habit_id, {}".format(bucket)
+    return conn.execute(query, params).fetchall()
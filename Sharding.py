@@ -0,0 +1,171 @@
+"""
+Tenant aware storage: every tenant (user) gets its own SQLite database file, a shard.
+
+Writers of different tenants never contend for the same database lock. The shard files are spread over hash bucket
+directories (<directory>/<bucket>/<tenant>.db) so that no directory grows too large. A shard holds the usual schema,
+the habit tables have no tenant column, so two tenants never share a file. Aggregates over all tenants open a
+read-only connection per shard and run on a thread pool.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Database import ConnectionManager, connect_read_only
+from LogStore import count_logs
+
+# tenant ids are used as file names
+TENANT_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ShardRouter:
+    """
+    Maps tenants to their shard files and keeps one ConnectionManager per shard
+
+    ...
+
+    Attributes
+    ----------
+
+    directory : str
+        directory of the shards (default: shards)
+    buckets : int
+        number of hash bucket directories the shards are spread over, must stay the same for a directory
+        (default: 64)
+    wal : bool
+        whether the shard connections are switched to WAL journal mode (default: True)
+    timeout : float
+        seconds a connection waits for a lock held by another writer (default: 30.0)
+    """
+
+    def __init__(self, directory='shards', buckets=64, wal=True, timeout=30.0):
+        self.directory = directory
+        self.buckets = buckets
+        self.wal = wal
+        self.timeout = timeout
+        self._managers = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, tenant):
+        """
+        Get the hash bucket of a tenant, it is the same in every process
+        :param tenant: tenant id
+        :return: int
+        """
+        return int(hashlib.sha1(tenant.encode()).hexdigest()[:8], 16) % self.buckets
+
+    def path(self, tenant):
+        """
+        Get the path of the shard of a tenant
+        :param tenant: tenant id of letters, digits, "_" and "-"
+        :return: str
+        """
+        if not isinstance(tenant, str) or not TENANT_PATTERN.fullmatch(tenant):
+            raise ValueError("invalid tenant id {!r}, use up to 64 letters, digits, '_' or '-'".format(tenant))
+        return os.path.join(self.directory, "{:02x}".format(self.bucket(tenant)), tenant + ".db")
+
+    def manager(self, tenant):
+        """
+        Get the connection manager of the shard of a tenant, the shard directory is created on first use
+        :param tenant: tenant id
+        :return: ConnectionManager
+        """
+        path = self.path(tenant)
+        manager = self._managers.get(tenant)
+        if manager is None:
+            with self._lock:
+                manager = self._managers.get(tenant)
+                if manager is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    manager = ConnectionManager(path, self.wal, self.timeout)
+                    self._managers[tenant] = manager
+        return manager
+
+    def connection(self, tenant):
+        """
+        Get the connection of the calling thread to the shard of a tenant
+        :param tenant: tenant id
+        :return: sqlite3 connection
+        """
+        return self.manager(tenant).connection()
+
+    def tenants(self):
+        """
+        Get the tenants that have a shard
+        :return: sorted list of tenant ids
+        """
+        tenants = []
+        if not os.path.isdir(self.directory):
+            return tenants
+        for bucket in os.listdir(self.directory):
+            folder = os.path.join(self.directory, bucket)
+            if os.path.isdir(folder):
+                tenants.extend(name[:-3] for name in os.listdir(folder)
+                               if name.endswith(".db") and TENANT_PATTERN.fullmatch(name[:-3]))
+        return sorted(tenants)
+
+    def aggregate(self, query, tenants=None, workers=8):
+        """
+        Run a query on the shards of many tenants in parallel, each with its own read-only connection
+        :param query: function called with a sqlite3 connection, returns the result of one shard
+        :param tenants: tenant ids to query (default: all tenants with a shard)
+        :param workers: number of threads
+        :return: dict of tenant id to the result of its shard, ordered by tenant id
+        """
+        tenants = sorted(self.tenants() if tenants is None else tenants)
+
+        def run(tenant):
+            conn = connect_read_only(self.path(tenant))
+            try:
+                return query(conn)
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max(1, min(workers, len(tenants)))) as pool:
+            return dict(zip(tenants, pool.map(run, tenants)))
+
+    def close_all(self):
+        """
+        Close the connections of every shard
+        :return: None
+        """
+        with self._lock:
+            managers, self._managers = self._managers, {}
+        for manager in managers.values():
+            manager.close_all()
+
+
+def tenant_totals(router, tenants=None):
+    """
+    Count the habits and the completions of every tenant
+    :param router: ShardRouter
+    :param tenants: tenant ids (default: all tenants with a shard)
+    :return: dict of tenant id to a dict with habits and completions
+    """
+    def query(conn):
+        habits = conn.execute("SELECT COUNT(*) FROM habits").fetchone()[0]
+        completions = count_logs(conn)
+        return {"habits": habits, "completions": completions}
+
+    return router.aggregate(query, tenants)
+
+
+def daily_completions_across(router, start=None, end=None, tenants=None):
+    """
+    Sum the completions per day over the shards of many tenants, from the daily rollup table of each shard
+    :param router: ShardRouter
+    :param start: first day "%Y-%m-%d", inclusive (default: no lower bound)
+    :param end: last day "%Y-%m-%d", exclusive (default: no upper bound)
+    :param tenants: tenant ids (default: all tenants with a shard)
+    :return: list of (day, completions) ordered by day
+    """
+    def query(conn):
+        return conn.execute("SELECT day, SUM(completions) FROM habit_daily_completions "
+                            "WHERE day >= ? AND day < ? GROUP BY day",
+                            (start or "", end or "\U0010ffff")).fetchall()
+
+    totals = {}
+    for rows in router.aggregate(query, tenants).values():
+        for day, completions in rows:
+            totals[day] = totals.get(day, 0) + completions
+    return sorted(totals.items())
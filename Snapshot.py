@@ -0,0 +1,352 @@
+"""
+Read-only columnar snapshots of the habits and the habit logs for reporting.
+
+write_snapshot copies the habits and all completions (habit_logs and the log archive) in one read transaction into a
+flat binary file. Every column is an array of little-endian 64 bit integers at a fixed offset, the habit names are
+stored once as UTF-8 behind an array of offsets. Snapshot opens the file with mmap, so the columns are read without
+copying as memoryview or NumPy arrays and reports run without touching the live database.
+
+File layout (all numbers int64):
+
+    header        magic, number of habits, number of logs, highest habit_logs id, bytes of names, checksum of the
+                  logs (64 bytes)
+    logs          habit_id[logs], completed_at[logs] (seconds since LogStore.EPOCH, NULL if not a timestamp)
+    habits        id[habits], frequency, ongoing_streak, longest_streak, last_completed_day (date.toordinal()),
+                  created_at (seconds since LogStore.EPOCH), name_offset[habits + 1]
+    names         UTF-8 bytes of all names
+
+refresh_snapshot only reads the habits and the logs with an id above the one stored in the snapshot, the logs of the
+old file are copied over. The new file replaces the old one atomically: readers that have the old file open keep
+their consistent view, the next Snapshot sees the new one. If habits have been deleted or logs changed other than
+by appending, the snapshot is written from scratch: the checksum is a sum over a hash of the habit and the time of
+every completion, recalculated by SQLite on every refresh, so updated, deleted and replaced logs change it. Moving
+logs into the archive doesn't.
+"""
+import contextlib
+import datetime
+import mmap
+import os
+import struct
+import sys
+from array import array
+from LogStore import EPOCH, EPOCH_UNIX
+
+MAGIC = b"HABITSN1"
+HEADER = struct.Struct("<8sqqqqq")
+HEADER_SIZE = 64
+
+# value of missing timestamps and days
+NULL = -2 ** 63
+
+HABIT_COLUMNS = ("id", "frequency", "ongoing_streak", "longest_streak", "last_completed_day", "created_at")
+LOG_COLUMNS = ("habit_id", "completed_at")
+
+# seconds since EPOCH of a habit_logs.completed_at text, NULL if it isn't a timestamp
+_SECONDS = "CAST(strftime('%s', completed_at) AS INTEGER) - {}".format(EPOCH_UNIX)
+
+# hash of a completion for the checksum, the same for a log in habit_logs and in the archive
+_HASH = "(habit_id * 2654435761 + COALESCE({}, -1)) % 4294967291"
+
+
+def write_snapshot(conn, path):
+    """
+    Write a snapshot of the database from scratch
+    :param conn: sqlite3 connection
+    :param path: file to write, replaced atomically
+    :return: number of logs in the snapshot
+    """
+    with _read_transaction(conn):
+        last_log_id = _last_log_id(conn)
+        habit_ids = array("q")
+        completed_at = array("q")
+        for habit_id, seconds, count in conn.execute(
+                "SELECT habit_id, " + _SECONDS + ", 1 FROM habit_logs WHERE id <= ? "
+                "UNION ALL SELECT habit_id, completed_at, count FROM habit_log_archive", (last_log_id,)):
+            habit_ids.extend([habit_id] * count)
+            completed_at.extend([NULL if seconds is None else seconds] * count)
+        habits = _read_habits(conn)
+        checksum = _checksum(conn, last_log_id)
+    _write(path, last_log_id, checksum, [habit_ids], [completed_at], habits)
+    return len(habit_ids)
+
+
+def refresh_snapshot(conn, path):
+    """
+    Bring a snapshot up to date, reading only the logs added since it was written. Writes the snapshot from
+    scratch if it doesn't exist or the logs can't be appended.
+    :param conn: sqlite3 connection
+    :param path: snapshot file
+    :return: number of logs read from the database
+    """
+    try:
+        old = Snapshot(path)
+    except (OSError, ValueError):
+        return write_snapshot(conn, path)
+    try:
+        with _read_transaction(conn):
+            last_log_id = _last_log_id(conn)
+            habits = _read_habits(conn)
+            rows = conn.execute("SELECT habit_id, " + _SECONDS + " FROM habit_logs WHERE id > ? AND id <= ?",
+                                (old.last_log_id, last_log_id)).fetchall()
+            total = (conn.execute("SELECT COUNT(*) FROM habit_logs WHERE id <= ?", (last_log_id,)).fetchone()[0] +
+                     conn.execute("SELECT COALESCE(SUM(count), 0) FROM habit_log_archive").fetchone()[0])
+            unchanged = _checksum(conn, old.last_log_id) == old.checksum
+            checksum = old.checksum + _checksum(conn, last_log_id, old.last_log_id)
+        # deleted habits take their logs with them, deleted, updated or replaced logs change the count or the
+        # checksum, all of them need a new snapshot
+        if not set(old.column("id")) <= set(habits[0]) or old.logs + len(rows) != total or not unchanged:
+            old.close()
+            return write_snapshot(conn, path)
+        habit_ids = array("q", (row[0] for row in rows))
+        completed_at = array("q", (NULL if row[1] is None else row[1] for row in rows))
+        _write(path, last_log_id, checksum, [old.column_bytes("habit_id"), habit_ids],
+               [old.column_bytes("completed_at"), completed_at], habits)
+    finally:
+        old.close()
+    return len(rows)
+
+
+class Snapshot:
+    """
+    Memory-mapped snapshot file, see write_snapshot
+
+    ...
+
+    Attributes
+    ----------
+
+    path : str
+        snapshot file
+    habits : int
+        number of habits
+    logs : int
+        number of logs
+    last_log_id : int
+        highest habit_logs id included
+    checksum : int
+        checksum of the logs, see refresh_snapshot
+    """
+
+    def __init__(self, path):
+        """
+        :param path: snapshot file written by write_snapshot or refresh_snapshot
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER_SIZE:
+            self._mmap.close()
+            raise ValueError("{} is not a habit snapshot".format(path))
+        magic, self.habits, self.logs, self.last_log_id, names, self.checksum = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError("{} is not a habit snapshot".format(path))
+        self._offsets = _layout(self.habits, self.logs)
+        self._names = (self._offsets["names"], names)
+        self._view = memoryview(self._mmap)
+
+    def column(self, name):
+        """
+        Get a column without copying it, needs a little-endian machine
+        :param name: one of LOG_COLUMNS, HABIT_COLUMNS or "name_offset"
+        :return: memoryview of int64 values
+        """
+        if sys.byteorder != "little":
+            raise ValueError("memoryview columns need a little-endian machine, use array()")
+        return self.column_bytes(name).cast("q")
+
+    def column_bytes(self, name):
+        """
+        Get the raw bytes of a column without copying them
+        :param name: one of LOG_COLUMNS, HABIT_COLUMNS or "name_offset"
+        :return: memoryview of bytes
+        """
+        offset, count = self._column(name)
+        return self._view[offset:offset + 8 * count]
+
+    def array(self, name):
+        """
+        Get a column as a read-only NumPy array without copying it
+        :param name: one of LOG_COLUMNS, HABIT_COLUMNS or "name_offset"
+        :return: int64 numpy array
+        """
+        np = _numpy()
+        offset, count = self._column(name)
+        return np.frombuffer(self._mmap, dtype="<i8", count=count, offset=offset)
+
+    def names(self):
+        """
+        Get the names of all habits in the order of the id column
+        :return: list of str
+        """
+        offsets = self.column("name_offset")
+        start = self._names[0]
+        data = self._view[start:start + self._names[1]]
+        return [bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(self.habits)]
+
+    def get_habits(self):
+        """
+        Get the habits with their streaks
+        :return: list of (id, name, frequency, ongoing streak, longest streak, last completed at) rows ordered by id
+        """
+        columns = [self.column(name) for name in ("id", "frequency", "ongoing_streak", "longest_streak",
+                                                  "last_completed_day")]
+        return [(habit_id, name, frequency, ongoing, longest,
+                 None if day == NULL else datetime.date.fromordinal(day).isoformat())
+                for habit_id, name, frequency, ongoing, longest, day in zip(columns[0], self.names(), *columns[1:])]
+
+    def habit_statistics(self, reference=None):
+        """
+        Calculate the statistics of Analytics.habit_statistics from the snapshot, with the NumPy backend
+        :param reference: date the completion rate is calculated up to (default: today)
+        :return: dict of habit id to a dict with the statistics
+        """
+        from NumpyAnalytics import compute_statistics, statistics_by_habit
+        completed_at = self.array("completed_at")
+        known = completed_at != NULL
+        days = completed_at[known] // 86400 + EPOCH.toordinal()
+        ids = self.array("id")
+        stats = compute_statistics(self.array("habit_id")[known], days, ids, self.array("frequency"),
+                                   (reference or datetime.date.today()).toordinal())
+        return statistics_by_habit(ids, stats)
+
+    def close(self):
+        """
+        Unmap the file. NumPy arrays from array() keep the mapping alive, it is closed when they are gone.
+        :return: None
+        """
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _column(self, name):
+        """
+        Get the offset and the number of values of a column
+        """
+        if name not in self._offsets or name == "names":
+            raise ValueError("unknown column {!r}".format(name))
+        count = self.logs if name in LOG_COLUMNS else self.habits + 1 if name == "name_offset" else self.habits
+        return self._offsets[name], count
+
+
+def _layout(habits, logs):
+    """
+    Get the offsets of the columns of a snapshot
+    :return: dict of column name (and "names") to offset
+    """
+    offsets = {}
+    offset = HEADER_SIZE
+    for name in LOG_COLUMNS:
+        offsets[name] = offset
+        offset += 8 * logs
+    for name in HABIT_COLUMNS:
+        offsets[name] = offset
+        offset += 8 * habits
+    offsets["name_offset"] = offset
+    offsets["names"] = offset + 8 * (habits + 1)
+    return offsets
+
+
+def _read_habits(conn):
+    """
+    Read the habit columns
+    :return: tuple of one array per column of HABIT_COLUMNS, the name offsets and the UTF-8 names
+    """
+    columns = tuple(array("q") for _ in HABIT_COLUMNS)
+    name_offsets = array("q", [0])
+    names = bytearray()
+    for row in conn.execute("SELECT id, frequency, ongoing_streak, longest_streak, "
+                            "       CAST(julianday(last_completed_at) - 1721424.5 AS INTEGER), "
+                            "       CAST(strftime('%s', created_at) AS INTEGER) - ?, name "
+                            "FROM habits ORDER BY id", (EPOCH_UNIX,)):
+        for column, value in zip(columns, row):
+            column.append(NULL if value is None else value)
+        names += (row[-1] or "").encode("utf-8")
+        name_offsets.append(len(names))
+    return columns + (name_offsets, bytes(names))
+
+
+def _write(path, last_log_id, checksum, habit_ids, completed_at, habits):
+    """
+    Write a snapshot file to a temporary file and move it into place
+    :param checksum: checksum of all logs, see _checksum
+    :param habit_ids: list of byte buffers (arrays or memoryviews) that make up the habit_id column
+    :param completed_at: list of byte buffers that make up the completed_at column
+    :param habits: result of _read_habits
+    """
+    logs = sum(part.nbytes // 8 if isinstance(part, memoryview) else len(part) for part in habit_ids)
+    names = habits[-1]
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        header = HEADER.pack(MAGIC, len(habits[0]), logs, last_log_id, len(names), checksum)
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        for part in habit_ids + completed_at + list(habits[:-1]):
+            file.write(_little_endian(part))
+        file.write(names)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def _little_endian(part):
+    """
+    Get the bytes of an int64 column part in little-endian order, memoryviews of a snapshot already are
+    """
+    if isinstance(part, array) and sys.byteorder != "little":
+        part = array("q", part)
+        part.byteswap()
+    return part
+
+
+def _last_log_id(conn):
+    """
+    Get the highest id in habit_logs
+    """
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM habit_logs").fetchone()[0]
+
+
+def _checksum(conn, last_log_id, after_log_id=None):
+    """
+    Get the checksum of the logs in habit_logs up to an id and the archive, or of the logs in habit_logs after an id
+    """
+    if after_log_id is not None:
+        return conn.execute("SELECT COALESCE(SUM(" + _HASH.format(_SECONDS) + "), 0) FROM habit_logs "
+                            "WHERE id > ? AND id <= ?", (after_log_id, last_log_id)).fetchone()[0]
+    return (conn.execute("SELECT COALESCE(SUM(" + _HASH.format(_SECONDS) + "), 0) FROM habit_logs WHERE id <= ?",
+                         (last_log_id,)).fetchone()[0] +
+            conn.execute("SELECT COALESCE(SUM(count * " + _HASH.format("completed_at") + "), 0) "
+                         "FROM habit_log_archive").fetchone()[0])
+
+
+def _numpy():
+    """
+    Import numpy, an optional dependency that only array() and habit_statistics() need. It is imported on first
+    use, so importing this module stays fast.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("snapshot arrays need numpy, install it with 'pip install numpy'") from None
+    return numpy
+
+
+@contextlib.contextmanager
+def _read_transaction(conn):
+    """
+    Run a block in one read transaction, so that all its queries see the same state of the database
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("ROLLBACK")  # nothing has been written
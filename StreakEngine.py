@@ -0,0 +1,194 @@
+"""
+Recalculates the streaks stored in the habits table from the completions in habit_logs.
+
+The logs of every habit are processed once in the order of completed_at with the same rule complete_habit uses: a
+completion on the same day as the previous one doesn't change the streak, a completion exactly `frequency` days
+after the previous one extends it and any other completion starts a new streak.
+
+After a run the state of every processed habit is saved in streak_checkpoints together with the highest log id at
+that time, so incremental updates only read the logs that have been added since. A habit whose new logs are older
+than its last completion is recalculated from all of its logs. Full recalculations read the archived logs as well,
+LogStore.compact_logs never archives logs newer than a habit's checkpoint.
+"""
+import datetime
+from itertools import groupby
+from LogStore import iter_logs
+
+# number of habit ids per query, stays below the sqlite variable limit
+_CHUNK = 500
+
+
+def calculate_streaks(completions, frequency, state=None):
+    """
+    Calculate the streaks of one habit in a single pass over its completions
+    :param completions: iterable of completed_at strings ("%Y-%m-%d %H:%M:%S") in ascending order
+    :param frequency: frequency of the habit in days
+    :param state: (last completion day "%Y-%m-%d", ongoing streak, longest streak) to continue from,
+                  None to start without completions
+    :return: the new state as (last completion day, ongoing streak, longest streak)
+    """
+    last_day, ongoing_streak, longest_streak = state or (None, 0, 0)
+    last_ordinal = _ordinal(last_day) if last_day else None
+
+    for completed_at in completions:
+        day = completed_at[:10]
+        if day == last_day:
+            continue
+        ordinal = _ordinal(day)
+        if last_ordinal is not None and ordinal - last_ordinal == frequency:
+            ongoing_streak += 1
+        else:
+            ongoing_streak = 1
+        longest_streak = max(longest_streak, ongoing_streak)
+        last_ordinal = ordinal
+        last_day = day
+
+    return last_day, ongoing_streak, longest_streak
+
+
+def _ordinal(day):
+    """
+    Convert a "%Y-%m-%d" string into a day number
+    """
+    return datetime.date(int(day[:4]), int(day[5:7]), int(day[8:10])).toordinal()
+
+
+def recompute_streaks(conn, habit_ids=None):
+    """
+    Recalculate the streaks of habits from all of their logs
+    :param conn: sqlite3 connection
+    :param habit_ids: ids of the habits to recalculate (default: all habits)
+    :return: the number of habits updated
+    """
+    with _transaction(conn):
+        high_water_mark = _last_log_id(conn)
+        frequencies = _frequencies(conn, habit_ids)
+        states = _replay(conn, list(frequencies), frequencies)
+        _save(conn, frequencies, states, high_water_mark)
+    return len(frequencies)
+
+
+def update_streaks(conn, habit_ids=None):
+    """
+    Update the streaks of habits incrementally from the logs added after their checkpoint. Habits without a
+    checkpoint or with new logs older than their last completion are recalculated from all of their logs.
+    :param conn: sqlite3 connection
+    :param habit_ids: ids of the habits to update (default: all habits)
+    :return: the number of habits whose streaks have been updated
+    """
+    with _transaction(conn):
+        high_water_mark = _last_log_id(conn)
+        frequencies = _frequencies(conn, habit_ids)
+        checkpoints = {}
+        for chunk in _chunks(list(frequencies)):
+            cursor = conn.execute("SELECT habit_id, last_log_id, last_completed_at, ongoing_streak, longest_streak "
+                                  "FROM streak_checkpoints WHERE habit_id IN ({})".format(",".join("?" * len(chunk))),
+                                  chunk)
+            checkpoints.update((row[0], row[1:]) for row in cursor)
+
+        rebuild = [habit_id for habit_id in frequencies if habit_id not in checkpoints]
+        states = {}
+        if checkpoints:
+            # only the logs written after the oldest checkpoint are read
+            cursor = conn.execute("SELECT habit_logs.habit_id, habit_logs.completed_at "
+                                  "FROM habit_logs JOIN streak_checkpoints "
+                                  "ON streak_checkpoints.habit_id = habit_logs.habit_id "
+                                  "WHERE habit_logs.id > ? AND habit_logs.id > streak_checkpoints.last_log_id "
+                                  "ORDER BY habit_logs.habit_id, habit_logs.completed_at",
+                                  (min(checkpoint[0] for checkpoint in checkpoints.values()),))
+            for habit_id, rows in groupby(cursor, key=lambda row: row[0]):
+                if habit_id not in checkpoints:
+                    continue
+                completions = [row[1] for row in rows]
+                last_day = checkpoints[habit_id][1]
+                if last_day is not None and completions[0][:10] < last_day:
+                    rebuild.append(habit_id)
+                else:
+                    states[habit_id] = calculate_streaks(completions, frequencies[habit_id], checkpoints[habit_id][1:])
+
+        states.update(_replay(conn, rebuild, frequencies))
+
+        # habits without new logs keep their streaks, only their checkpoint moves forward
+        changed = set(rebuild) | set(states)
+        _save(conn, changed, states, high_water_mark)
+        unchanged = [habit_id for habit_id in checkpoints if habit_id not in changed]
+        for chunk in _chunks(unchanged):
+            conn.execute("UPDATE streak_checkpoints SET last_log_id = ? WHERE habit_id IN ({})".format(
+                ",".join("?" * len(chunk))), [high_water_mark] + chunk)
+    return len(changed)
+
+
+def _replay(conn, habit_ids, frequencies):
+    """
+    Calculate the streaks of habits from all of their logs
+    :return: dict of habit id to state, habits without logs are left out
+    """
+    states = {}
+    for chunk in _chunks(habit_ids):
+        # the logs of habit_logs and of the archive, see LogStore.py
+        for habit_id, rows in groupby(iter_logs(conn, chunk), key=lambda row: row[0]):
+            states[habit_id] = calculate_streaks((row[1] for row in rows), frequencies[habit_id])
+    return states
+
+
+def _last_log_id(conn):
+    """
+    Get the highest id in habit_logs
+    """
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM habit_logs").fetchone()[0]
+
+
+def _frequencies(conn, habit_ids):
+    """
+    Get the frequency of the habits
+    :return: dict of habit id to frequency
+    """
+    if habit_ids is None:
+        return dict(conn.execute("SELECT id, frequency FROM habits"))
+    frequencies = {}
+    for chunk in _chunks(list(habit_ids)):
+        frequencies.update(conn.execute("SELECT id, frequency FROM habits WHERE id IN ({})".format(
+            ",".join("?" * len(chunk))), chunk))
+    return frequencies
+
+
+def _save(conn, habit_ids, states, high_water_mark):
+    """
+    Write the streaks and checkpoints of the habits, habits without a state have no completions
+    """
+    rows = [(habit_id,) + states.get(habit_id, (None, 0, 0)) for habit_id in habit_ids]
+    conn.executemany("UPDATE habits SET last_completed_at = ?, ongoing_streak = ?, longest_streak = ? WHERE id = ?",
+                     (row[1:] + row[:1] for row in rows))
+    conn.executemany("INSERT OR REPLACE INTO streak_checkpoints "
+                     "(habit_id, last_log_id, last_completed_at, ongoing_streak, longest_streak) "
+                     "VALUES (?, ?, ?, ?, ?)", ((row[0], high_water_mark) + row[1:] for row in rows))
+
+
+def _chunks(values):
+    """
+    Split a list into chunks of at most _CHUNK values
+    """
+    for i in range(0, len(values), _CHUNK):
+        yield values[i:i + _CHUNK]
+
+
+class _transaction:
+    """
+    Context manager that runs a block in a BEGIN IMMEDIATE transaction
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
+        return False
@@ -0,0 +1,72 @@
+"""
+Deterministic generator of synthetic habits and completion histories for benchmarks and tests.
+
+The same arguments always produce the same database content. Habits get realistic frequencies (mostly daily and
+weekly) and an adherence between 30 and 95 percent, every period of a habit since its creation is completed with
+that probability at a random time of day, sometimes twice. The streaks and the rollups are calculated from the
+generated logs afterwards, so the database looks like one that has been used for years.
+"""
+import datetime
+import random
+from Rollups import rebuild_rollups
+from StreakEngine import recompute_streaks
+
+# frequencies in days and how often they occur
+FREQUENCIES = (1, 2, 3, 7, 14, 30)
+FREQUENCY_WEIGHTS = (50, 10, 10, 25, 3, 2)
+
+# words the habit names are made of, so that name searches find realistic numbers of matches
+WORDS = ("read", "run", "walk", "meditate", "stretch", "journal", "cook", "clean", "study", "practice", "call",
+         "water", "sleep", "swim", "write", "review", "plan", "budget", "garden", "learn")
+
+# date the generated histories end on, fixed so that the data doesn't depend on the day it is generated
+END = datetime.datetime(2024, 1, 1)
+
+# number of rows per executemany call
+_CHUNK = 10000
+
+
+def generate(conn, habits=1000, years=1, seed=0, end=END):
+    """
+    Fill an empty database (schema migrated) with synthetic habits and logs
+    :param conn: sqlite3 connection
+    :param habits: number of habits
+    :param years: length of the history in years, habits are created at random times within it
+    :param seed: seed of the random generator
+    :param end: datetime the histories end on
+    :return: tuple of the number of habits and the number of logs written
+    """
+    rng = random.Random(seed)
+    start = end - datetime.timedelta(days=int(365 * years))
+    span = (end - start).total_seconds()
+
+    rows = []
+    logs = 0
+    for habit_id in range(1, habits + 1):
+        frequency = rng.choices(FREQUENCIES, FREQUENCY_WEIGHTS)[0]
+        created_at = start + datetime.timedelta(seconds=int(rng.random() * span))
+        name = "{} {} {:06d}".format(rng.choice(WORDS), rng.choice(WORDS), habit_id)
+        rows.append((habit_id, name, created_at.strftime("%Y-%m-%d %H:%M:%S"), frequency, 0, 0, 0, None))
+    conn.executemany("INSERT INTO habits VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    chunk = []
+    for habit_id, _, created_at, frequency, _, _, _, _ in rows:
+        adherence = rng.uniform(0.3, 0.95)
+        day = datetime.datetime.strptime(created_at[:10], "%Y-%m-%d")
+        while day < end:
+            if rng.random() < adherence:
+                for _ in range(2 if rng.random() < 0.02 else 1):
+                    completed_at = day + datetime.timedelta(seconds=rng.randrange(86400))
+                    chunk.append((habit_id, completed_at.strftime("%Y-%m-%d %H:%M:%S")))
+            day += datetime.timedelta(days=frequency)
+        if len(chunk) >= _CHUNK:
+            conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)", chunk)
+            logs += len(chunk)
+            chunk = []
+    conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)", chunk)
+    logs += len(chunk)
+    conn.commit()
+
+    recompute_streaks(conn)
+    rebuild_rollups(conn)
+    return habits, logs
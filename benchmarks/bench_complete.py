@@ -0,0 +1,59 @@
+"""
+Measures the throughput of completing habits one at a time with complete_habit (one commit per completion) and
+in a single batch with complete_habits (one transaction for all completions), in completions per second.
+
+usage: python benchmarks/bench_complete.py [habits]
+"""
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Database import ConnectionManager  # noqa: E402
+from Habit import Habit  # noqa: E402
+from HabitModel import HabitModel  # noqa: E402
+
+
+def create_model(path, habits):
+    """
+    Create a database with the given number of daily habits
+    """
+    model = HabitModel(manager=ConnectionManager(path))
+    created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    model.conn.executemany("INSERT INTO habits (name, created_at, frequency, is_completed, ongoing_streak, "
+                           "longest_streak, last_completed_at) VALUES (?, ?, 1, 0, 0, 0, NULL)",
+                           (("habit {}".format(i), created_at) for i in range(habits)))
+    model.conn.commit()
+    return model
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        single = create_model(os.path.join(tmp, "single.db"), habits)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(habits):
+                single.complete_habit(Habit("habit {}".format(i), 1))
+        single_seconds = time.perf_counter() - start
+        single.manager.close_all()
+
+        batched = create_model(os.path.join(tmp, "batch.db"), habits)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            batched.complete_habits(("habit {}".format(i), None) for i in range(habits))
+        batch_seconds = time.perf_counter() - start
+        batched.manager.close_all()
+
+    print("completions:                   {}".format(habits))
+    print("complete_habit (one by one):   {:10.0f} completions/s".format(habits / single_seconds))
+    print("complete_habits (one batch):   {:10.0f} completions/s".format(habits / batch_seconds))
+
+
+if __name__ == '__main__':
+    main()
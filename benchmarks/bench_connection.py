@@ -0,0 +1,68 @@
+"""
+Compares the per-call latency of opening a new sqlite3 connection for every query (the old behaviour of the
+model and analytics functions) with reusing the connection handed out by the ConnectionManager.
+
+usage: python benchmarks/bench_connection.py [calls]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Database import ConnectionManager  # noqa: E402
+from HabitModel import HabitModel  # noqa: E402
+
+
+def query_with_new_connection(path):
+    """
+    Run one query the way the code did before the connection manager existed
+    :param path: database file
+    :return: None
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("SELECT * FROM habits").fetchall()
+    conn.close()
+
+
+def query_with_manager(manager):
+    """
+    Run one query on the pooled connection
+    :param manager: ConnectionManager
+    :return: None
+    """
+    manager.connection().execute("SELECT * FROM habits").fetchall()
+
+
+def measure(func, arg, calls):
+    """
+    Call func(arg) a number of times and return the mean latency in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        func(arg)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        manager = ConnectionManager(path)
+        model = HabitModel(manager=manager)
+        model.insert_sample_data()
+
+        before = measure(query_with_new_connection, path, calls)
+        after = measure(query_with_manager, manager, calls)
+        manager.close_all()
+
+    print("calls per variant:           {}".format(calls))
+    print("connect per call (before):   {:8.1f} us/call".format(before))
+    print("connection manager (after):  {:8.1f} us/call".format(after))
+    print("speedup:                     {:8.1f}x".format(before / after))
+
+
+if __name__ == '__main__':
+    main()
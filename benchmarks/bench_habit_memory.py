@@ -0,0 +1,64 @@
+"""
+Measures time and memory (tracemalloc) of loading habits rows into memory as
+  - plain objects with a __dict__, built through the constructor like the controller used to (Habit(name, frequency)
+    formats a new created_at timestamp every time)
+  - Habit objects with __slots__ built with Habit.from_row
+  - a column oriented HabitTable
+
+usage: python benchmarks/bench_habit_memory.py [habits]
+"""
+import datetime
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Habit import Habit, HabitTable  # noqa: E402
+
+
+class DictHabit:
+    """
+    The Habit class before it had __slots__
+    """
+
+    def __init__(self, name, frequency):
+        self.id = None
+        self.name = name
+        self.created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.frequency = frequency
+        self.is_completed = False
+        self.ongoing_streak = 0
+        self.longest_streak = 0
+        self.last_completed_at = None
+
+
+def measure(label, build, rows):
+    """
+    Build the collection and print the time and the memory it holds
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(rows)
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    print("{:28} {:8.2f} s {:10.1f} MB".format(label, seconds, size))
+    return result
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rows = [(i, "habit {}".format(i), "2023-05-01 08:00:00", 1 + i % 7, i % 2, i % 5, i % 9, None)
+            for i in range(habits)]
+    print("habits: {}".format(habits))
+    measure("dict objects (constructor):", lambda rows: [DictHabit(row[1], row[3]) for row in rows], rows)
+    measure("slots objects (from_row):", lambda rows: [Habit.from_row(row) for row in rows], rows)
+    measure("HabitTable:", HabitTable.from_rows, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Load test for the HTTP/JSON API: client threads send a mix of reads and writes over keep-alive connections and
+the requests per second and the latency percentiles are reported.
+
+Without an address a server is started in this process on a temporary database. Clients and server then share the
+interpreter, start the server with 'python cli.py serve --quiet' and pass its address to measure it on its own.
+
+usage: python benchmarks/bench_http.py [clients] [requests per client] [host:port]
+"""
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HabitServer import HabitServer  # noqa: E402
+
+# number of habits created before the test and share of the requests that are writes
+HABITS = 200
+WRITE_RATIO = 0.1
+
+
+def request(conn, method, path, body=None):
+    """
+    Send a request on a keep-alive connection and read the whole response
+    :return: HTTP status
+    """
+    conn.request(method, path, json.dumps(body) if body is not None else None,
+                 {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def client(address, names, requests, latencies, seed):
+    """
+    Send a number of requests over one connection and record the latency of each in milliseconds
+    :param address: (host, port) of the server
+    :param names: habit names to work with
+    :param requests: number of requests to send
+    :param latencies: list the latencies are appended to
+    :param seed: seed of the random request mix
+    :return: None
+    """
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(*address)
+    own = []
+    for _ in range(requests):
+        name = quote(rng.choice(names))
+        choice = rng.random()
+        start = time.perf_counter()
+        if choice < WRITE_RATIO:
+            request(conn, "POST", "/habits/{}/complete".format(name))
+        elif choice < 0.6:
+            request(conn, "GET", "/habits/{}".format(name))
+        elif choice < 0.8:
+            request(conn, "GET", "/search?q={}".format(name[:10]))
+        else:
+            request(conn, "GET", "/habits?after_id={}".format(rng.randrange(len(names))))
+        own.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    latencies.extend(own)
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a sorted list of values
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run(address, clients, requests):
+    """
+    Create the habits if needed and run the client threads against a server
+    :return: None
+    """
+    names = ["bench habit {:04d}".format(i) for i in range(HABITS)]
+    conn = http.client.HTTPConnection(*address)
+    for name in names:
+        request(conn, "POST", "/habits", {"name": name, "frequency": 1})
+    conn.close()
+
+    latencies = []
+    threads = [threading.Thread(target=client, args=(address, names, requests, latencies, seed))
+               for seed in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("clients: {}, requests: {}, writes: {:.0%}".format(clients, clients * requests, WRITE_RATIO))
+    print("requests per second: {:10.0f}".format(len(latencies) / elapsed))
+    print("latency p50:         {:10.2f} ms".format(percentile(latencies, 0.5)))
+    print("latency p99:         {:10.2f} ms".format(percentile(latencies, 0.99)))
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    if len(sys.argv) > 3:
+        host, port = sys.argv[3].rsplit(":", 1)
+        run((host, int(port)), clients, requests)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = HabitServer(("127.0.0.1", 0), os.path.join(tmp, "bench.db"))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            run(server.server_address[:2], clients, requests)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares habit_logs with the compact log archive: the size of the database file and the time of a full scan of the
+logs in habit order, the habit statistics and a one month window, once with all logs in habit_logs and once with
+all of them moved to the archive by compact_logs.
+
+usage: python benchmarks/bench_logstore.py [habits] [years]
+"""
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Analytics import completions_in_window, habit_statistics  # noqa: E402
+from LogStore import compact_logs, count_logs, iter_logs  # noqa: E402
+from Migrations import migrate  # noqa: E402
+from SyntheticData import END, generate  # noqa: E402
+
+
+def timed(func, repeat=3):
+    """
+    Call a function a number of times
+    :return: the fastest time in milliseconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def table_bytes(conn, names):
+    """
+    Get the size of tables and indexes from the dbstat virtual table, None if SQLite is built without it
+    """
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN ({})".format(",".join("?" * len(names))),
+                            names).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    years = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "plain.db")
+        conn = sqlite3.connect(plain)
+        migrate(conn)
+        generate(conn, habits, years)
+        logs = count_logs(conn)
+        conn.execute("VACUUM")
+        conn.close()
+
+        compacted = os.path.join(tmp, "compacted.db")
+        shutil.copy(plain, compacted)
+        conn = sqlite3.connect(compacted)
+        compact_logs(conn, END.date() + datetime.timedelta(days=1))
+        conn.execute("VACUUM")
+        conn.close()
+
+        print("{} habits, {} logs over {} years".format(habits, logs, years))
+        print("{:10} {:>10} {:>10} {:>10} {:>14} {:>12}".format("storage", "file MB", "logs MB", "scan ms",
+                                                                "statistics ms", "month ms"))
+        window = (END - datetime.timedelta(days=180), END - datetime.timedelta(days=150))
+        for name, path in (("habit_logs", plain), ("archive", compacted)):
+            conn = sqlite3.connect(path)
+            size = table_bytes(conn, ["habit_logs", "idx_habit_logs_habit_completed", "idx_habit_logs_completed",
+                                      "habit_log_archive"])
+            scan = timed(lambda: sum(1 for _ in iter_logs(conn)))
+            statistics = timed(lambda: habit_statistics(conn, END.date()))
+            month = timed(lambda: sum(1 for _ in completions_in_window(*window, conn=conn)))
+            print("{:10} {:10.1f} {:>10} {:10.1f} {:14.1f} {:12.1f}".format(
+                name, os.path.getsize(path) / 2 ** 20, "-" if size is None else "{:.1f}".format(size / 2 ** 20),
+                scan, statistics, month))
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares listing habit names with the old reduce based implementation of get_habit_names (fetchall, then copy the
+accumulator for every habit) with the streaming pipeline of iter_habit_names and print_table. The old
+implementation is quadratic, so it is only measured up to a limited number of habits.
+
+usage: python benchmarks/bench_names.py [habits] [max habits for the old implementation]
+"""
+import contextlib
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from functools import reduce
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tabulate import tabulate  # noqa: E402
+from Analytics import iter_habit_names, print_table  # noqa: E402
+from Migrations import migrate  # noqa: E402
+
+
+def names_with_reduce(conn):
+    habits = conn.execute("SELECT name FROM habits").fetchall()
+    habit_names = reduce(lambda acc, habit: acc + [[habit[0]]], habits, [])
+    print(tabulate(habit_names, headers=["Name"], tablefmt="fancy_grid"))
+
+
+def names_with_pipeline(conn):
+    print_table(map(lambda name: [name], iter_habit_names(conn)), headers=["Name"])
+
+
+def measure(func, conn):
+    """
+    Run func with its output discarded, once for the time and once for the memory
+    :return: tuple of seconds and peak traced memory in MB
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func(conn)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        func(conn)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    old_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executemany("INSERT INTO habits (name, frequency) VALUES (?, 1)",
+                     (("habit {}".format(i),) for i in range(habits)))
+    conn.commit()
+
+    seconds, peak = measure(names_with_pipeline, conn)
+    print("pipeline, {} habits:   {:8.2f} s, peak {:8.1f} MB".format(habits, seconds, peak))
+
+    conn.execute("DELETE FROM habits WHERE id > ?", (old_limit,))
+    for func, label in ((names_with_reduce, "reduce  "), (names_with_pipeline, "pipeline")):
+        seconds, peak = measure(func, conn)
+        print("{}, {} habits:   {:8.2f} s, peak {:8.1f} MB".format(label, old_limit, seconds, peak))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
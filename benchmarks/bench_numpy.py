@@ -0,0 +1,55 @@
+"""
+Compares Analytics.habit_statistics (row by row in Python) with the vectorized NumPy backend on a generated
+history and checks that both return the same statistics.
+
+usage: python benchmarks/bench_numpy.py [log rows] [habits]
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Analytics  # noqa: E402
+import NumpyAnalytics  # noqa: E402
+from Migrations import migrate  # noqa: E402
+
+
+def main():
+    log_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    habits = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        migrate(conn)
+        conn.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                         ((i, "habit {}".format(i), rng.choice([1, 1, 2, 3, 7])) for i in range(1, habits + 1)))
+        start = datetime.datetime.now() - datetime.timedelta(days=5 * 365)
+        conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         ((rng.randint(1, habits),
+                           (start + datetime.timedelta(seconds=rng.randrange(5 * 365 * 86400))).strftime(
+                               "%Y-%m-%d %H:%M:%S")) for _ in range(log_rows)))
+        conn.commit()
+
+        begin = time.perf_counter()
+        python_result = Analytics.habit_statistics(conn)
+        python_seconds = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        numpy_result = NumpyAnalytics.habit_statistics(conn)
+        numpy_seconds = time.perf_counter() - begin
+        conn.close()
+
+    assert python_result == numpy_result, "the backends returned different statistics"
+    print("log rows: {}, habits: {}".format(log_rows, habits))
+    print("python statistics:   {:8.3f} s".format(python_seconds))
+    print("numpy statistics:    {:8.3f} s".format(numpy_seconds))
+    print("speedup:             {:8.1f}x".format(python_seconds / numpy_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Measures how Analytics.habit_statistics scales over worker processes with the ParallelAnalytics backend on a
+generated history, from one worker up to the number of CPUs, and checks that every run returns the same statistics.
+
+usage: python benchmarks/bench_parallel.py [log rows] [habits] [max workers]
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Analytics  # noqa: E402
+import ParallelAnalytics  # noqa: E402
+from Migrations import migrate  # noqa: E402
+
+
+def main():
+    log_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    habits = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        conn.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                         ((i, "habit {}".format(i), rng.choice([1, 1, 2, 3, 7])) for i in range(1, habits + 1)))
+        start = datetime.datetime.now() - datetime.timedelta(days=5 * 365)
+        conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         ((rng.randint(1, habits),
+                           (start + datetime.timedelta(seconds=rng.randrange(5 * 365 * 86400))).strftime(
+                               "%Y-%m-%d %H:%M:%S")) for _ in range(log_rows)))
+        conn.commit()
+
+        begin = time.perf_counter()
+        expected = Analytics.habit_statistics(conn)
+        baseline = time.perf_counter() - begin
+        conn.close()
+
+        print("log rows: {}, habits: {}, cpus: {}".format(log_rows, habits, os.cpu_count()))
+        print("single process:  {:8.3f} s".format(baseline))
+        workers = 1
+        while workers <= max_workers:
+            begin = time.perf_counter()
+            result = ParallelAnalytics.habit_statistics(path, workers=workers)
+            seconds = time.perf_counter() - begin
+            assert result == expected, "{} workers returned different statistics".format(workers)
+            print("{:3d} workers:     {:8.3f} s  speedup {:5.2f}x".format(workers, seconds, baseline / seconds))
+            workers = workers * 2 if workers * 2 <= max_workers or workers == max_workers else max_workers
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Burst of check-ins: many threads complete every habit at once, directly with complete_habit (one transaction per
+completion) and through the CompletionQueue (group commits) with every durability of the journal.
+
+usage: python benchmarks/bench_queue.py [habits] [threads]
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CompletionQueue import CompletionQueue  # noqa: E402
+from Database import ConnectionManager  # noqa: E402
+from Habit import Habit  # noqa: E402
+from HabitModel import HabitModel  # noqa: E402
+
+
+def setup(path, habits):
+    """
+    Create a database with a number of habits
+    :return: list of the habit names
+    """
+    manager = ConnectionManager(path)
+    model = HabitModel(manager=manager)
+    names = ["habit {:06d}".format(i) for i in range(habits)]
+    model.conn.executemany("INSERT INTO habits (name, created_at, frequency) VALUES (?, '2024-01-01 00:00:00', 1)",
+                           [(name,) for name in names])
+    model.conn.commit()
+    manager.close_all()
+    return names
+
+
+def burst(names, threads, complete):
+    """
+    Complete every habit once, the habits are split over a number of threads
+    :return: seconds until every thread is done
+    """
+    def run(part):
+        for name in names[part::threads]:
+            complete(name)
+
+    workers = [threading.Thread(target=run, args=(part,)) for part in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    with tempfile.TemporaryDirectory() as tmp:
+        print("{} habits completed by {} threads".format(habits, threads))
+        for variant in ("direct", "memory", "buffered", "flush", "fsync"):
+            path = os.path.join(tmp, variant + ".db")
+            names = setup(path, habits)
+            manager = ConnectionManager(path)
+            local = threading.local()
+
+            def model():
+                if not hasattr(local, "model"):
+                    local.model = HabitModel(manager=manager)
+                return local.model
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                if variant == "direct":
+                    seconds = burst(names, threads, lambda name: model().complete_habit(Habit(name, 1)))
+                else:
+                    journal = os.path.join(tmp, variant + ".jsonl") if variant != "memory" else None
+                    queue = CompletionQueue(model(), journal, durability=variant if journal else "flush")
+                    start = time.perf_counter()
+                    burst(names, threads, queue.complete)
+                    # the completions count once they are committed
+                    queue.flush()
+                    seconds = time.perf_counter() - start
+                    queue.close()
+            logs = model().conn.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0]
+            print("{:8} {:8.0f} completions/s   {} logged".format(variant, habits / seconds, logs))
+            manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Measures the latency of HabitModel.search_habits for prefix and substring fragments, compared to loading all
+habits and picking the matches in Python the way delete_habit and complete_habit used to.
+
+usage: python benchmarks/bench_search.py [habits]
+"""
+import os
+import random
+import sqlite3
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HabitModel import HabitModel  # noqa: E402
+
+
+def timed(func, repeat):
+    """
+    Run func repeat times and return the mean latency in milliseconds
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(42)
+    model = HabitModel(sqlite3.connect(":memory:"))
+    names = {"".join(rng.choice(string.ascii_lowercase + " ") for _ in range(rng.randint(8, 30)))
+             for _ in range(habits)}
+    model.conn.executemany("INSERT INTO habits (name, frequency) VALUES (?, 1)", ((name,) for name in names))
+    model.conn.commit()
+    sample = rng.sample(sorted(names), 50)
+
+    print("habits: {}".format(len(names)))
+    print("load all, filter in python:  {:8.3f} ms".format(
+        timed(lambda: [row for row in model.get_habits() if sample[0][3:8] in row[1]], 5)))
+    for label, fragments in (("prefix (6 chars)", [name[:6] for name in sample]),
+                             ("substring (5 chars)", [name[3:8] for name in sample]),
+                             ("substring (2 chars)", [name[3:5] for name in sample])):
+        fragments = iter(fragments * 10)
+        print("search {:21} {:8.3f} ms".format(label + ":", timed(lambda: model.search_habits(next(fragments)), 500)))
+
+
+if __name__ == '__main__':
+    main()
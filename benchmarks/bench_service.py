@@ -0,0 +1,103 @@
+"""
+Load generator for the asyncio HabitService: many concurrent clients send a mix of reads and writes and the
+throughput and the latency percentiles are reported per pool size of reader threads.
+
+usage: python benchmarks/bench_service.py [clients] [requests per client] [habits]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HabitService import HabitService  # noqa: E402
+
+# share of the requests that are writes
+WRITE_RATIO = 0.1
+
+
+async def client(service, names, requests, latencies, seed):
+    """
+    Send a number of requests and record the latency of each in milliseconds
+    :param service: started HabitService
+    :param names: habit names to work with
+    :param requests: number of requests to send
+    :param latencies: dict of "read" and "write" to a list the latencies are appended to
+    :param seed: seed of the random request mix
+    :return: None
+    """
+    rng = random.Random(seed)
+    for _ in range(requests):
+        name = rng.choice(names)
+        start = time.perf_counter()
+        if rng.random() < WRITE_RATIO:
+            await service.complete_habit(name)
+            kind = "write"
+        else:
+            choice = rng.random()
+            if choice < 0.5:
+                await service.get_habit(name)
+            elif choice < 0.8:
+                await service.search_habits(name[:8])
+            else:
+                await service.get_habits_page(rng.randrange(len(names)))
+            kind = "read"
+        latencies[kind].append((time.perf_counter() - start) * 1000)
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of values
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def run(path, readers, clients, requests, names):
+    """
+    Run the load against a service with a number of reader threads
+    :return: (requests per second, latencies)
+    """
+    latencies = {"read": [], "write": []}
+    async with HabitService(path, readers=readers) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(service, names, requests, latencies, seed) for seed in range(clients)))
+        elapsed = time.perf_counter() - start
+    return clients * requests / elapsed, latencies
+
+
+async def setup(path, habits):
+    """
+    Create the habits of the benchmark
+    :return: list of habit names
+    """
+    names = ["habit {:06d}".format(i) for i in range(habits)]
+    async with HabitService(path) as service:
+        for name in names:
+            await service.add_habit(name, 1)
+    return names
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    habits = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    print("clients: {}, requests per client: {}, habits: {}, writes: {:.0%}".format(clients, requests, habits,
+                                                                                    WRITE_RATIO))
+    print("{:>8} {:>10} {:>12} {:>12} {:>12} {:>12}".format("readers", "req/s", "read p50", "read p99",
+                                                           "write p50", "write p99"))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        names = asyncio.run(setup(path, habits))
+        for readers in (1, 2, 4, 8):
+            rate, latencies = asyncio.run(run(path, readers, clients, requests, names))
+            print("{:>8} {:>10.0f} {:>9.2f} ms {:>9.2f} ms {:>9.2f} ms {:>9.2f} ms".format(
+                readers, rate, percentile(latencies["read"], 0.5), percentile(latencies["read"], 0.99),
+                percentile(latencies["write"], 0.5), percentile(latencies["write"], 0.99)))
+
+
+if __name__ == '__main__':
+    main()
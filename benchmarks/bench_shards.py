@@ -0,0 +1,75 @@
+"""
+Compares concurrent writers of many tenants on one shared database file with the same writers on one shard per
+tenant. Every writer thread adds habits and completes them in small transactions.
+
+usage: python benchmarks/bench_shards.py [tenants] [habits per tenant]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Database import ConnectionManager  # noqa: E402
+from Habit import Habit  # noqa: E402
+from HabitModel import HabitModel  # noqa: E402
+from Sharding import ShardRouter  # noqa: E402
+
+
+def write(manager, tenant, habits):
+    """
+    Add and complete habits of one tenant
+    :param manager: ConnectionManager of the database the tenant writes to
+    :param tenant: tenant id, used as a prefix of the habit names on a shared file
+    :param habits: number of habits
+    :return: None
+    """
+    model = HabitModel(manager=manager)
+    for i in range(habits):
+        name = "{} habit {}".format(tenant, i)
+        model.add_habit(Habit(name, 1))
+        model.complete_habit(Habit(name, 1))
+
+
+def run(managers, habits):
+    """
+    Run one writer thread per tenant
+    :param managers: dict of tenant id to the ConnectionManager it writes to
+    :return: seconds
+    """
+    threads = [threading.Thread(target=write, args=(manager, tenant, habits)) for tenant, manager in managers.items()]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    tenants = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    habits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    names = ["tenant{}".format(i) for i in range(tenants)]
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = ConnectionManager(os.path.join(tmp, "shared.db"))
+        HabitModel(manager=shared)
+        shared_seconds = run({tenant: shared for tenant in names}, habits)
+        shared.close_all()
+
+        router = ShardRouter(os.path.join(tmp, "shards"))
+        sharded_seconds = run({tenant: router.manager(tenant) for tenant in names}, habits)
+        router.close_all()
+
+    writes = tenants * habits * 2
+    print("tenants: {}, transactions: {}".format(tenants, writes))
+    print("one shared file:       {:8.3f} s  {:8.0f} transactions/s".format(shared_seconds, writes / shared_seconds))
+    print("one shard per tenant:  {:8.3f} s  {:8.0f} transactions/s".format(sharded_seconds, writes / sharded_seconds))
+
+
+if __name__ == '__main__':
+    main()
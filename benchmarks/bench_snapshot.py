@@ -0,0 +1,77 @@
+"""
+Analytics from the memory-mapped snapshot: the time to write the snapshot from scratch and to refresh it after a
+day of new completions, and the habit statistics calculated from the database (Python and NumPy backend) and from
+the snapshot.
+
+usage: python benchmarks/bench_snapshot.py [habits] [years]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Analytics import habit_statistics  # noqa: E402
+from LogStore import count_logs  # noqa: E402
+from Migrations import migrate  # noqa: E402
+import NumpyAnalytics  # noqa: E402
+from Snapshot import Snapshot, refresh_snapshot, write_snapshot  # noqa: E402
+from SyntheticData import END, generate  # noqa: E402
+
+
+def timed(func, repeat=3):
+    """
+    Call a function a number of times
+    :return: the fastest time in milliseconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    years = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    reference = END.date()
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "habits.db"))
+        migrate(conn)
+        generate(conn, habits, years)
+        path = os.path.join(tmp, "habits.snapshot")
+        print("{} habits, {} logs over {} years".format(habits, count_logs(conn), years))
+
+        print("{:32} {:10.1f} ms".format("write snapshot", timed(lambda: write_snapshot(conn, path))))
+        day = [(habit_id, END.strftime("%Y-%m-%d 23:00:00")) for habit_id in range(1, habits + 1)]
+
+        def refresh():
+            conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)", day)
+            conn.commit()
+            start = time.perf_counter()
+            refresh_snapshot(conn, path)
+            return time.perf_counter() - start
+
+        print("{:32} {:10.1f} ms".format("refresh after {} logs".format(len(day)),
+                                         min(refresh() for _ in range(3)) * 1000))
+        print("{:32} {:10.1f} MB".format("snapshot size", os.path.getsize(path) / 2 ** 20))
+
+        print("{:32} {:10.1f} ms".format("statistics, database", timed(lambda: habit_statistics(conn, reference))))
+        print("{:32} {:10.1f} ms".format("statistics, database NumPy",
+                                         timed(lambda: NumpyAnalytics.habit_statistics(conn, reference))))
+
+        def from_snapshot():
+            with Snapshot(path) as snapshot:
+                return snapshot.habit_statistics(reference)
+
+        print("{:32} {:10.1f} ms".format("statistics, snapshot", timed(from_snapshot)))
+        assert from_snapshot() == habit_statistics(conn, reference)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Tracks the startup time of the entry points: the import time of every module from 'python -X importtime' and the
+wall time of complete runs of the interactive menu (quit right away) and of a command line export.
+
+usage: python benchmarks/bench_startup.py [runs] [results file]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry points and the code that imports them
+IMPORTS = {
+    "main": "import main",
+    "HabitView": "import HabitView",
+    "cli": "import cli",
+}
+
+
+def import_times(code, cwd):
+    """
+    Run code with -X importtime in a new interpreter
+    :return: dict of module name to (self, cumulative) import time in milliseconds
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, capture_output=True,
+                            text=True, check=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own) / 1000, int(cumulative) / 1000)
+    return times
+
+
+def wall_time(args, cwd, stdin=None):
+    """
+    Run a command and measure its wall time in milliseconds
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, input=stdin, capture_output=True, text=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    output = sys.argv[2] if len(sys.argv) > 2 else None
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # the menu opens habits.db in the working directory, create its schema before measuring
+        subprocess.run([sys.executable, os.path.join(ROOT, "cli.py"), "rebuild-rollups"], cwd=tmp,
+                       capture_output=True, check=True)
+
+        for entry, code in IMPORTS.items():
+            samples = [import_times(code, tmp) for _ in range(runs)]
+            total = statistics.median(sample[entry][1] for sample in samples)
+            # the slowest modules of the median run, by their own import time
+            slowest = sorted(samples[0].items(), key=lambda item: -item[1][0])[:5]
+            results["import " + entry] = total
+            print("import {:12} {:8.1f} ms   slowest: {}".format(
+                entry, total, ", ".join("{} {:.1f}".format(name, own) for name, (own, _) in slowest)))
+
+        for name, args, stdin in (("menu start and quit", [os.path.join(ROOT, "main.py")], "q\n"),
+                                  ("cli export", [os.path.join(ROOT, "cli.py"), "export", "habits", "out.csv"], None),
+                                  ("cli --help", [os.path.join(ROOT, "cli.py"), "--help"], None)):
+            total = statistics.median(wall_time(args, tmp, stdin) for _ in range(runs))
+            results[name] = total
+            print("{:19} {:8.1f} ms wall time".format(name, total))
+
+    if output:
+        with open(output, "w") as file:
+            json.dump({"python": sys.version.split()[0], "runs": runs, "results_ms": results}, file, indent=2)
+        print("results written to {}".format(output))
+
+
+if __name__ == '__main__':
+    main()
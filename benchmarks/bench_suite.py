@@ -0,0 +1,205 @@
+"""
+Benchmark suite over a synthetic database: startup, the model operations and every analytics function.
+
+The database is generated deterministically by SyntheticData, so two runs with the same arguments work on the same
+data. Every case is repeated and its minimum, median and mean are written to a JSON results file. Passing the
+results file of an earlier version with --compare prints the change of every case and marks regressions.
+
+usage: python benchmarks/bench_suite.py [--habits N] [--years N] [--seed N] [--repeat N] [--output FILE]
+                                        [--compare FILE] [--threshold FRACTION]
+"""
+import argparse
+import builtins
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Analytics  # noqa: E402
+import NumpyAnalytics  # noqa: E402
+import ParallelAnalytics  # noqa: E402
+from Database import ConnectionManager  # noqa: E402
+from Habit import Habit  # noqa: E402
+from HabitModel import HabitModel  # noqa: E402
+from Migrations import migrate  # noqa: E402
+from SyntheticData import END, generate  # noqa: E402
+
+
+@contextlib.contextmanager
+def answers(value):
+    """
+    Answer every input() prompt with a value while the block runs
+    """
+    original = builtins.input
+    builtins.input = lambda prompt="": value
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def startup(path):
+    """
+    Start a new interpreter that imports the application and opens the database
+    """
+    code = ("import sys; sys.path.insert(0, {!r}); from HabitView import HabitView; "
+            "from HabitController import HabitController; from Database import ConnectionManager; "
+            "HabitController(manager=ConnectionManager({!r}))").format(ROOT, path)
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def cases(path, model):
+    """
+    Get the benchmark cases
+    :param path: database file
+    :param model: HabitModel on the database
+    :return: list of (name, function without arguments); the functions may change the data, but never remove it
+    """
+    conn = model.conn
+    habits = model.count_habits()
+    name = conn.execute("SELECT name FROM habits WHERE id = 1").fetchone()[0]
+    counter = iter(range(10 ** 9))
+    week = Analytics.get_window("week", END.date() - datetime.timedelta(days=7))
+
+    def uncached(func):
+        # the query cache would answer every repeat after the first, measure the query itself
+        def run():
+            model.cache.clear()
+            return func()
+        return run
+
+    def complete_habit():
+        # every habit can be completed once per day, take the next one each time
+        model.complete_habit(Habit(conn.execute("SELECT name FROM habits WHERE id = ?",
+                                                (next(counter) % habits + 1,)).fetchone()[0], 1))
+
+    return [
+        ("startup", lambda: startup(path)),
+        ("model.add_habit", lambda: model.add_habit(Habit("benchmark habit {}".format(next(counter)), 1))),
+        ("model.complete_habit", complete_habit),
+        ("model.complete_habits_100", lambda: model.complete_habits(
+            [(name, END + datetime.timedelta(days=next(counter))) for _ in range(100)])),
+        ("model.get_habits", uncached(model.get_habits)),
+        ("model.get_habit_table", model.get_habit_table),
+        ("model.get_habits_page", uncached(lambda: model.get_habits_page(habits // 2))),
+        ("model.search_habits", uncached(lambda: model.search_habits("read"))),
+        ("model.count_habits", uncached(model.count_habits)),
+        ("analytics.display_table_habits", lambda: Analytics.display_table_habits(conn)),
+        ("analytics.show_habits_frequency", lambda: answers("7")(Analytics.show_habits_frequency)(conn)),
+        ("analytics.show_longest_streak", lambda: Analytics.show_longest_streak(conn)),
+        ("analytics.show_longest_streak_habit", lambda: answers(name)(Analytics.show_longest_streak_habit)(conn)),
+        ("analytics.show_completed_within_last_week", lambda: Analytics.show_completed_within_last_week(conn)),
+        ("analytics.completions_in_window_week", lambda: list(Analytics.completions_in_window(*week, conn=conn))),
+        ("analytics.get_habit_names", lambda: Analytics.get_habit_names(conn)),
+        ("analytics.habit_names", lambda: list(Analytics.habit_names(conn))),
+        ("analytics.habit_statistics", lambda: Analytics.habit_statistics(conn, END.date())),
+        ("analytics.habit_statistics_numpy", lambda: NumpyAnalytics.habit_statistics(conn, END.date())),
+        ("analytics.habit_statistics_parallel", lambda: ParallelAnalytics.habit_statistics(path, END.date())),
+    ]
+
+
+def measure(func, repeat):
+    """
+    Call a function a number of times with its output discarded
+    :return: dict with the min, median and mean in milliseconds
+    """
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(timings), "median_ms": statistics.median(timings), "mean_ms": statistics.mean(timings),
+            "repeat": repeat}
+
+
+def git_revision():
+    """
+    Get the commit the benchmarks ran on, if the code is in a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of the median of every case against an earlier results file
+    """
+    print("\n{:45} {:>12} {:>12} {:>8}".format("case", "baseline ms", "current ms", "change"))
+    for case, current in results["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            print("{:45} {:>12} {:12.3f}".format(case, "-", current["median_ms"]))
+            continue
+        change = current["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        mark = "  REGRESSION" if change > threshold else "  faster" if change < -threshold else ""
+        print("{:45} {:12.3f} {:12.3f} {:+7.0%}{}".format(case, before["median_ms"], current["median_ms"], change,
+                                                           mark))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite over a synthetic habit database.")
+    parser.add_argument("--habits", type=int, default=1000, help="number of generated habits (default: 1000)")
+    parser.add_argument("--years", type=float, default=2, help="years of generated history (default: 2)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the data generator (default: 0)")
+    parser.add_argument("--repeat", type=int, default=5, help="calls per case (default: 5)")
+    parser.add_argument("--output", default="bench_results.json", help="results file (default: bench_results.json)")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="change of the median reported as regression (default: 0.2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        start = time.perf_counter()
+        habits, logs = generate(conn, args.habits, args.years, args.seed)
+        generated = time.perf_counter() - start
+        conn.close()
+        print("generated {} habits and {} logs in {:.1f} s".format(habits, logs, generated))
+
+        manager = ConnectionManager(path)
+        model = HabitModel(manager=manager)
+        results = {"meta": {"habits": habits, "logs": logs, "years": args.years, "seed": args.seed,
+                            "repeat": args.repeat, "python": platform.python_version(),
+                            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                            "revision": git_revision(), "date": datetime.datetime.now().isoformat(timespec="seconds")},
+                   "results": {}}
+        for case, func in cases(path, model):
+            try:
+                results["results"][case] = measure(func, args.repeat)
+            except ImportError as error:
+                # e.g. numpy is not installed
+                print("{:45} skipped: {}".format(case, error))
+                continue
+            print("{:45} {:10.3f} ms median".format(case, results["results"][case]["median_ms"]))
+
+        # clearing the database destroys the data, it runs once at the end
+        results["results"]["analytics.clear_database"] = measure(lambda: Analytics.clear_database(model.conn), 1)
+        manager.close_all()
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("results written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the old way of finding the completions of the last week (read the whole habit_logs join, parse every
+completed_at with strptime and filter in Python) with completions_in_window(), which lets SQLite evaluate the date
+range on the completed_at index.
+
+usage: python benchmarks/bench_window.py [log rows] [habits]
+       python benchmarks/bench_window.py 10000000 1000
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Analytics import completions_in_window, get_window, TIMESTAMP_FORMAT  # noqa: E402
+from Migrations import migrate  # noqa: E402
+
+
+def fill_database(conn, log_rows, habits):
+    """
+    Insert habits and log_rows completions spread evenly over the last ten years
+    """
+    conn.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                     ((i, "habit {}".format(i), 1) for i in range(1, habits + 1)))
+    now = datetime.datetime.now()
+    span = 10 * 365 * 24 * 3600
+    rng = random.Random(42)
+    conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                     ((rng.randint(1, habits),
+                       (now - datetime.timedelta(seconds=rng.randrange(span))).strftime(TIMESTAMP_FORMAT))
+                      for _ in range(log_rows)))
+    conn.commit()
+
+
+def last_week_in_python(conn):
+    """
+    The implementation of show_completed_within_last_week before the range was pushed into SQL
+    """
+    last_week = datetime.datetime.today() - datetime.timedelta(days=7)
+    c = conn.cursor()
+    c.execute(
+        "SELECT habit_id, habits.name, completed_at FROM habit_logs JOIN habits ON habit_logs.habit_id = habits.id")
+    habits = [(h[0], h[1], datetime.datetime.strptime(h[2], TIMESTAMP_FORMAT)) for h in c.fetchall()]
+    return list(filter(lambda h: h[2] >= last_week, habits))
+
+
+def last_week_in_sql(conn):
+    """
+    The same question answered by completions_in_window
+    """
+    last_week = datetime.datetime.today() - datetime.timedelta(days=7)
+    return list(completions_in_window(last_week, conn=conn))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    log_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    habits = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        migrate(conn)
+        print("inserting {} log rows for {} habits ...".format(log_rows, habits))
+        fill_database(conn, log_rows, habits)
+
+        old, old_ms = timed(last_week_in_python, conn)
+        new, new_ms = timed(last_week_in_sql, conn)
+        assert len(old) == len(new)
+        print("last 7 days, python filter:   {:10.1f} ms ({} rows)".format(old_ms, len(old)))
+        print("last 7 days, sql window:      {:10.1f} ms ({} rows)".format(new_ms, len(new)))
+
+        for period in ("day", "week", "month"):
+            start, end = get_window(period)
+            rows, ms = timed(lambda: sum(1 for _ in completions_in_window(start, end, conn=conn)))
+            print("current {:5} window:         {:10.1f} ms ({} rows)".format(period, ms, rows))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import csv
+import json
+import shlex
+import sqlite3
+import sys
+from Database import ConnectionManager
+from DataTransfer import COLUMNS, FORMATS
+from Habit import Habit
+
+
+# reports: column names and a function of the controller and the parsed arguments that returns the rows
+REPORTS = {
+    "streaks": (("name", "frequency", "ongoing_streak", "longest_streak", "last_completed_at"),
+                lambda controller, args: controller.get_streaks()),
+    "longest": (("name", "longest_streak"), lambda controller, args: controller.get_longest_streak()),
+    "habit": (("name", "ongoing_streak", "longest_streak", "last_completed_at"),
+              lambda controller, args: controller.get_habit_streak(_required(args, "name"))),
+    "frequency": (("name", "frequency"),
+                  lambda controller, args: controller.get_habits_frequency(_required(args, "frequency"))),
+    "last-week": (("habit_id", "name", "completed_at"),
+                  lambda controller, args: controller.get_completed_within_last_week()),
+    "statistics": (("habit_id", "longest_streak", "ongoing_streak", "completions", "completion_rate", "max_gap",
+                    "mean_gap"),
+                   lambda controller, args: [(habit_id,) + tuple(values[column] for column in STATISTICS)
+                                             for habit_id, values
+                                             in sorted(controller.get_habit_statistics().items())]),
+}
+STATISTICS = REPORTS["statistics"][0][1:]
+REPORT_FORMATS = ("table", "json", "csv")
+
+# commands that can't run inside a batch, they don't work on the open connection
+NOT_IN_BATCH = ("batch", "serve", "tenants")
+
+
+def build_parser():
+    """
+    Builds the parser for the non-interactive command line
+    :return: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Non-interactive command line for the Habit Tracker.")
+    parser.add_argument("--db", default="habits.db", help="path of the sqlite database (default: habits.db)")
+    parser.add_argument("--tenant", help="use the shard of this tenant instead of --db")
+    parser.add_argument("--shards", default="shards", help="directory of the tenant shards (default: shards)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command, verb in (("import", "import into"), ("export", "export")):
+        sub = commands.add_parser(command, help="{} a table as CSV or JSON Lines".format(verb))
+        sub.add_argument("table", choices=list(COLUMNS))
+        sub.add_argument("path", help="file to read or write")
+        sub.add_argument("--format", choices=FORMATS, help="file format (default: taken from the file extension)")
+
+    sub = commands.add_parser("rebuild-streaks", help="recalculate the streaks of all habits from the habit logs")
+    sub.add_argument("--incremental", action="store_true", help="only process the logs added since the last run")
+
+    commands.add_parser("rebuild-rollups", help="recreate the completions per day and week from the habit logs")
+
+    sub = commands.add_parser("compact-logs", help="move the habit logs before a day into the compact archive")
+    sub.add_argument("--before", help="first day YYYY-MM-DD that stays in habit_logs (default: today)")
+
+    sub = commands.add_parser("snapshot", help="write or refresh the memory-mapped snapshot for analytics")
+    sub.add_argument("path", help="snapshot file")
+    sub.add_argument("--full", action="store_true", help="write the snapshot from scratch")
+
+    sub = commands.add_parser("add", help="add a habit")
+    sub.add_argument("--name", required=True, help="name of the habit")
+    sub.add_argument("--frequency", type=int, default=1, help="frequency in days (default: 1)")
+
+    for command in ("complete", "delete"):
+        sub = commands.add_parser(command, help="{} the habit with the exact name".format(command))
+        sub.add_argument("--name", required=True, help="name of the habit")
+
+    sub = commands.add_parser("report", help="print the streaks, habits or statistics")
+    sub.add_argument("report", choices=list(REPORTS))
+    sub.add_argument("--format", choices=REPORT_FORMATS, default="table", help="output format (default: table)")
+    sub.add_argument("--name", help="habit of the habit report")
+    sub.add_argument("--frequency", type=int, help="frequency in days of the frequency report")
+
+    sub = commands.add_parser("batch", help="run the commands in a file, one per line, on one connection")
+    sub.add_argument("path", help="file with the commands, - for stdin")
+    sub.add_argument("--keep-going", action="store_true", help="run the remaining commands after a failed one")
+
+    commands.add_parser("tenants", help="list the tenants of --shards with their number of habits and completions")
+
+    sub = commands.add_parser("serve", help="serve the habits as an HTTP/JSON API")
+    sub.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    sub.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    sub.add_argument("--readers", type=int, default=4, help="number of reader threads (default: 4)")
+    sub.add_argument("--quiet", action="store_true", help="don't log every request")
+    return parser
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the command against the database
+    :param argv: command line arguments (default: sys.argv[1:])
+    :return: exit code
+    """
+    args = build_parser().parse_args(argv)
+    if args.command == "tenants" or args.tenant is not None:
+        from Sharding import ShardRouter, tenant_totals
+        router = ShardRouter(args.shards)
+    if args.command == "tenants":
+        for tenant, totals in tenant_totals(router).items():
+            print("{}\t{}\t{}".format(tenant, totals["habits"], totals["completions"]))
+        return 0
+    if args.tenant is not None:
+        try:
+            args.db = router.manager(args.tenant).path
+        except (OSError, ValueError) as error:
+            print("error: {}".format(error), file=sys.stderr)
+            return 1
+
+    if args.command == "serve":
+        from HabitServer import serve
+        try:
+            serve(args.host, args.port, args.db, args.readers, args.quiet)
+        except OSError as error:
+            print("error: {}".format(error), file=sys.stderr)
+            return 1
+        return 0
+
+    # imported here so that parsing the command line stays fast
+    from HabitController import HabitController
+    manager = ConnectionManager(args.db)
+    # the messages about changes go to stderr, so stdout only carries the reports
+    controller = HabitController(manager=manager, messages=sys.stderr)
+    try:
+        if args.command == "batch":
+            return run_batch(controller, args.path, args.keep_going)
+        return run(controller, args)
+    finally:
+        manager.close_all()
+
+
+def run(controller, args):
+    """
+    Runs one command against the database of the controller
+    :param controller: HabitController
+    :param args: parsed command line
+    :return: exit code
+    """
+    try:
+        if args.command == "import":
+            controller.import_data(args.table, args.path, args.format)
+        elif args.command == "export":
+            controller.export_data(args.table, args.path, args.format)
+        elif args.command == "rebuild-streaks":
+            controller.rebuild_streaks(args.incremental)
+        elif args.command == "rebuild-rollups":
+            controller.rebuild_rollups()
+        elif args.command == "compact-logs":
+            controller.compact_logs(args.before)
+        elif args.command == "snapshot":
+            controller.write_snapshot(args.path, args.full)
+        elif args.command == "add":
+            if not args.name.strip():
+                raise ValueError("the name of a habit can't be empty")
+            if args.frequency < 1:
+                raise ValueError("the frequency must be at least one day")
+            return 0 if controller.add_habit(Habit(args.name, args.frequency)) else 1
+        elif args.command == "complete":
+            if not controller.get_habit_streak(args.name):
+                raise ValueError("there is no habit with the name {!r}".format(args.name))
+            # a habit that has already been completed today is not an error, the command can be repeated
+            controller.complete_habit_named(args.name)
+        elif args.command == "delete":
+            return 0 if controller.delete_habit_named(args.name) else 1
+        elif args.command == "report":
+            columns, rows = REPORTS[args.report]
+            write_report(columns, rows(controller, args), args.format)
+    except (OSError, ValueError, sqlite3.Error) as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_batch(controller, path, keep_going=False):
+    """
+    Runs the commands in a file, one command line per line, against the database of the controller. All commands
+    share the process and the open connection, so a batch saves the start of a new interpreter and the opening of
+    the database per command. Empty lines and lines starting with # are skipped, the global options (--db,
+    --tenant) of the lines are ignored.
+    :param controller: HabitController
+    :param path: file with the commands, - for stdin
+    :param keep_going: run the remaining commands after a failed one instead of stopping
+    :return: exit code, 1 if any command failed
+    """
+    parser = build_parser()
+    failed = False
+    try:
+        file = sys.stdin if path == "-" else open(path)
+    except OSError as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 1
+    try:
+        for number, line in enumerate(file, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command in NOT_IN_BATCH:
+                    raise ValueError("{} can't run in a batch".format(args.command))
+                code = run(controller, args)
+            except SystemExit as exit:
+                # argparse has printed the usage error
+                code = exit.code
+            except ValueError as error:
+                print("error: {}".format(error), file=sys.stderr)
+                code = 1
+            if code:
+                print("error: line {} failed: {}".format(number, line.strip()), file=sys.stderr)
+                failed = True
+                if not keep_going:
+                    break
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return 1 if failed else 0
+
+
+def write_report(columns, rows, fmt="table", file=None):
+    """
+    Prints the rows of a report
+    :param columns: column names
+    :param rows: rows of the report
+    :param fmt: "table", "json" (a list of objects) or "csv" (with a header line)
+    :param file: file to print to (default: stdout)
+    :return: None
+    """
+    file = file or sys.stdout
+    if fmt == "json":
+        json.dump([dict(zip(columns, row)) for row in rows], file, indent=2)
+        file.write("\n")
+    elif fmt == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        from Analytics import format_table
+        print(format_table(rows, [column.replace("_", " ").capitalize() for column in columns]), file=file)
+
+
+def _required(args, option):
+    """
+    Get an option of a report that the report can't run without
+    """
+    value = getattr(args, option)
+    if value is None:
+        raise ValueError("the {} report needs --{}".format(args.report, option))
+    return value
+
+
+if __name__ == '__main__':
+    sys.exit(main())
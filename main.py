@@ -1,10 +1,9 @@
-from HabitView import HabitView
-
-
 def main():
     """
     Main function that instantiates HabitVIew object and then runs the view.run() method
     """
+    # imported when the application starts, not when main is imported by other tools
+    from HabitView import HabitView
     view = HabitView()
     view.run()
 
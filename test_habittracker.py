@@ -1,9 +1,33 @@
 import pytest
 import sqlite3
 import datetime
+import threading
+import json
+import random
+import asyncio
+import http.client
+from concurrent.futures import ProcessPoolExecutor
 from HabitModel import HabitModel
-from Habit import Habit
+from Habit import Habit, HabitTable
 from HabitController import HabitController
+from Database import ConnectionManager
+from Cache import QueryCache
+from Migrations import migrate, get_version, SCHEMA_VERSION
+from Analytics import get_window, completions_in_window, habit_statistics, iter_habit_names, paginate, print_table
+from DataTransfer import import_table, export_table
+from StreakEngine import calculate_streaks, recompute_streaks, update_streaks
+from HabitView import HabitPager
+from HabitService import HabitService
+from HabitServer import HabitServer
+import ParallelAnalytics
+from Sharding import ShardRouter, tenant_totals, daily_completions_across
+import Instrumentation
+from SyntheticData import generate, FREQUENCIES
+from Rollups import week_of, rebuild_rollups, daily_completions, weekly_completions
+import cli
+from LogStore import compact_logs, iter_logs, count_logs
+from CompletionQueue import CompletionQueue
+from Snapshot import Snapshot, refresh_snapshot, write_snapshot
 
 
 # test create habit user input possibilities: string
@@ -34,6 +58,16 @@ def db_connection():
     conn.close()
 
 
+@pytest.fixture
+def empty_db():
+    # create an empty test database with the current schema
+    conn = sqlite3.connect(':memory:')
+    conn.execute("PRAGMA foreign_keys=1")
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
 # test create habit user input possibilities: letters
 def test_add_habit_str(db_connection):
     # create a habit object
@@ -261,3 +295,851 @@ def test_complete_habit_weekly(db_connection):
     assert habit[6] == 3  # longest_streak should be incremented by 1
     assert habit[7] == datetime.datetime.now().strftime("%Y-%m-%d")
     assert habit_logs is not None
+
+
+def test_connection_manager_reuses_connection_per_thread(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "habits.db"))
+
+    # the same thread always gets the same connection back
+    conn = manager.connection()
+    assert manager.connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # another thread gets its own connection
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    manager.close_all()
+    assert manager.connection() is not conn
+    manager.close_all()
+
+
+def test_model_and_analytics_share_managed_connection(tmp_path, capsys):
+    manager = ConnectionManager(str(tmp_path / "habits.db"))
+    controller = HabitController(manager=manager)
+    controller.add_habit(Habit("managed habit", 1))
+
+    # the analytics module reads through the same connection as the model
+    assert controller.model.conn is manager.connection()
+    controller.show_habit_names()
+    assert "managed habit" in capsys.readouterr().out
+    manager.close_all()
+
+
+def test_migrate_upgrades_legacy_database_in_place(tmp_path):
+    # create a database with the original schema, a duplicate habit name and a log for each duplicate
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE habits (id integer PRIMARY KEY AUTOINCREMENT, name text, created_at date, "
+                 "frequency int, is_completed int, ongoing_streak int, longest_streak int, last_completed_at text)")
+    conn.execute("CREATE TABLE habit_logs (id integer PRIMARY KEY AUTOINCREMENT, habit_id int, completed_at date, "
+                 "CONSTRAINT FK_habits FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE)")
+    conn.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                     [(1, "Read", 1), (2, "Run", 2), (3, "Read", 1)])
+    conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                     [(1, "2023-04-01 10:00:00"), (3, "2023-04-02 10:00:00")])
+    conn.commit()
+    assert get_version(conn) == 0
+
+    assert migrate(conn) == SCHEMA_VERSION
+    assert get_version(conn) == SCHEMA_VERSION
+
+    # the duplicate has been merged into the oldest habit and kept its logs
+    assert conn.execute("SELECT id, name FROM habits ORDER BY id").fetchall() == [(1, "Read"), (2, "Run")]
+    assert conn.execute("SELECT habit_id FROM habit_logs").fetchall() == [(1,), (1,)]
+
+    # lookups by name and by habit_id use the new indexes
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM habits WHERE name = ?", ("Read",)).fetchall()
+    assert "idx_habits_name" in str(plan)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM habit_logs WHERE habit_id = ? AND completed_at > ?",
+                        (1, "2023")).fetchall()
+    assert "idx_habit_logs_habit_completed" in str(plan)
+
+    # running it again is a no-op
+    assert migrate(conn) == SCHEMA_VERSION
+    conn.close()
+
+
+def test_add_habit_rejects_duplicate_name(db_connection, capsys):
+    controller = HabitController(db_connection)
+    controller.add_habit(Habit("unique habit", 1))
+    controller.add_habit(Habit("unique habit", 7))
+
+    assert "already exists" in capsys.readouterr().out
+    c = db_connection.cursor()
+    c.execute("SELECT frequency FROM habits WHERE name = ?", ("unique habit",))
+    assert c.fetchall() == [(1,)]
+    c.close()
+
+
+def test_get_window():
+    reference = datetime.datetime(2023, 12, 20, 15, 30)
+    assert get_window("day", reference) == (datetime.datetime(2023, 12, 20), datetime.datetime(2023, 12, 21))
+    assert get_window("week", reference) == (datetime.datetime(2023, 12, 18), datetime.datetime(2023, 12, 25))
+    assert get_window("month", reference) == (datetime.datetime(2023, 12, 1), datetime.datetime(2024, 1, 1))
+    with pytest.raises(ValueError):
+        get_window("year", reference)
+
+
+def test_completions_in_window(empty_db):
+    empty_db.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)", [(1, "Read", 1), (2, "Run", 7)])
+    empty_db.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         [(1, "2023-04-30 23:59:59"),
+                          (1, "2023-05-01 00:00:00"),
+                          (2, "2023-05-15 12:00:00"),
+                          (1, "2023-06-01 00:00:00")])
+    empty_db.commit()
+
+    # the window is half open: start is included, end is not
+    start, end = get_window("month", datetime.date(2023, 5, 10))
+    rows = list(completions_in_window(start, end, conn=empty_db, chunk_size=1))
+    assert rows == [(1, "Read", "2023-05-01 00:00:00"), (2, "Run", "2023-05-15 12:00:00")]
+
+    # without an end the window is open ended
+    rows = list(completions_in_window(datetime.date(2023, 5, 15), conn=empty_db))
+    assert [row[2] for row in rows] == ["2023-05-15 12:00:00", "2023-06-01 00:00:00"]
+
+    # the range is looked up on the completed_at index
+    plan = empty_db.execute("EXPLAIN QUERY PLAN SELECT * FROM habit_logs WHERE completed_at >= ? AND completed_at < ?",
+                            ("2023", "2024")).fetchall()
+    assert "idx_habit_logs_completed" in str(plan)
+
+
+def test_complete_habits_batch(empty_db):
+    controller = HabitController(empty_db)
+    controller.add_habit(Habit("daily", 1))
+    controller.add_habit(Habit("weekly", 7))
+
+    day = datetime.datetime(2023, 5, 1, 8, 0)
+    batch = [("daily", day + datetime.timedelta(days=2)),
+             ("daily", day),
+             (Habit("daily", 1), day + datetime.timedelta(days=1)),
+             ("daily", day + datetime.timedelta(days=5)),
+             ("weekly", day),
+             ("weekly", day + datetime.timedelta(days=7)),
+             ("unknown", day)]
+    assert controller.complete_habits(batch) == 6
+
+    # the streaks are calculated in the order of the timestamps, not in the order of the batch
+    c = empty_db.cursor()
+    c.execute("SELECT name, is_completed, ongoing_streak, longest_streak, last_completed_at FROM habits ORDER BY id")
+    assert c.fetchall() == [("daily", 1, 1, 3, "2023-05-06"), ("weekly", 1, 2, 2, "2023-05-08")]
+    c.execute("SELECT COUNT(*) FROM habit_logs")
+    assert c.fetchone()[0] == 6
+    c.close()
+
+    # with once_per_day the same batch can be written again without logging anything twice
+    assert controller.complete_habits(batch, once_per_day=True) == 0
+
+
+@pytest.mark.parametrize("extension", ["csv", "jsonl"])
+def test_export_and_import_round_trip(empty_db, tmp_path, extension):
+    empty_db.executemany("INSERT INTO habits VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(1, "Read", "2023-04-01 10:00:00", 1, 1, 2, 3, "2023-04-05"),
+                          (2, "Run, fast", "2023-04-02 10:00:00", 7, 0, 0, 0, None)])
+    empty_db.executemany("INSERT INTO habit_logs VALUES (?, ?, ?)",
+                         [(i, 1, "2023-04-0{} 10:00:00".format(i)) for i in range(1, 6)])
+    empty_db.commit()
+    habits_file = str(tmp_path / ("habits." + extension))
+    logs_file = str(tmp_path / ("logs." + extension))
+    assert export_table(empty_db, "habits", habits_file) == 2
+    assert export_table(empty_db, "habit_logs", logs_file, chunk_size=2) == 5
+
+    # import into another database in small chunks
+    target = sqlite3.connect(':memory:')
+    migrate(target)
+    assert import_table(target, "habits", habits_file, chunk_size=1) == 2
+    assert import_table(target, "habit_logs", logs_file, chunk_size=2) == 5
+    for table in ("habits", "habit_logs"):
+        query = "SELECT * FROM {} ORDER BY id".format(table)
+        assert target.execute(query).fetchall() == empty_db.execute(query).fetchall()
+    target.close()
+
+
+def test_rollups_follow_completions_and_import(empty_db, tmp_path):
+    controller = HabitController(empty_db)
+    controller.add_habit(Habit("Read", 1))
+    # 2023-01-01 is a Sunday of ISO week 2022-W52
+    assert week_of("2023-01-01 23:59:59") == "2022-W52"
+    assert week_of("2023-01-02") == "2023-W01"
+    controller.complete_habits([("Read", datetime.datetime(2023, 1, 1, 8, 0)),
+                                ("Read", datetime.datetime(2023, 1, 1, 20, 0)),
+                                ("Read", datetime.datetime(2023, 1, 2, 8, 0))])
+    assert controller.daily_completions() == [(1, "2023-01-01", 2), (1, "2023-01-02", 1)]
+    assert controller.weekly_completions(1) == [(1, "2022-W52", 2), (1, "2023-W01", 1)]
+
+    # imported logs are added to the existing buckets
+    logs_file = tmp_path / "logs.csv"
+    logs_file.write_text("habit_id,completed_at\n1,2023-01-02 09:00:00\n1,2023-01-09 09:00:00\n")
+    assert controller.import_data("habit_logs", str(logs_file)) == 2
+    incremental = daily_completions(empty_db), weekly_completions(empty_db)
+    assert daily_completions(empty_db, 1, "2023-01-02", "2023-01-09") == [(1, "2023-01-02", 2)]
+    assert weekly_completions(empty_db, start="2023-W01") == [(1, "2023-W01", 2), (1, "2023-W02", 1)]
+
+    # a rebuild from the logs gives the same counts
+    assert rebuild_rollups(empty_db) == 3
+    assert (daily_completions(empty_db), weekly_completions(empty_db)) == incremental
+
+    # deleting a habit removes its buckets
+    controller.model.delete_habit(Habit("Read", 1))
+    assert daily_completions(empty_db) == []
+
+
+def test_cli_import_export(tmp_path):
+    db = str(tmp_path / "cli.db")
+    source = tmp_path / "habits.csv"
+    source.write_text("name,frequency\nRead,1\nRun,7\n")
+
+    assert cli.main(["--db", db, "import", "habits", str(source)]) == 0
+    assert cli.main(["--db", db, "export", "habits", str(tmp_path / "out.jsonl")]) == 0
+    lines = (tmp_path / "out.jsonl").read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["Read", "Run"]
+
+    # errors are reported with a non-zero exit code
+    assert cli.main(["--db", db, "import", "habits", str(tmp_path / "missing.csv")]) == 1
+
+
+def test_cli_batch_and_reports(tmp_path, capsys):
+    db = str(tmp_path / "batch.db")
+    commands = tmp_path / "commands.txt"
+    commands.write_text('# habits\nadd --name "Read book" --frequency 1\nadd --name Run --frequency 7\n\n'
+                        'complete --name "Read book"\ndelete --name Run\nreport streaks --format json\n')
+    assert cli.main(["--db", db, "batch", str(commands)]) == 0
+    # the messages about the changes go to stderr, stdout only carries the report
+    output = capsys.readouterr()
+    assert "has been added" in output.err
+    report = json.loads(output.out)
+    assert [(row["name"], row["ongoing_streak"]) for row in report] == [("Read book", 1)]
+
+    # unknown habits, missing report options and failing batch lines give a non-zero exit code
+    assert cli.main(["--db", db, "complete", "--name", "Swim"]) == 1
+    assert cli.main(["--db", db, "report", "habit"]) == 1
+    commands.write_text("delete --name Run\nadd --name Swim\n")
+    assert cli.main(["--db", db, "batch", str(commands)]) == 1
+    assert cli.main(["--db", db, "batch", str(commands), "--keep-going"]) == 1
+    assert cli.main(["--db", db, "batch", str(tmp_path / "missing.txt")]) == 1
+    capsys.readouterr()
+    assert cli.main(["--db", db, "report", "frequency", "--frequency", "1", "--format", "csv"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["name,frequency", "Read book,1", "Swim,1"]
+
+
+def test_calculate_streaks():
+    completions = ["2023-05-01 08:00:00", "2023-05-01 20:00:00", "2023-05-03 08:00:00", "2023-05-05 08:00:00",
+                   "2023-05-06 08:00:00", "2023-05-08 08:00:00"]
+    assert calculate_streaks(completions, 2) == ("2023-05-08", 2, 3)
+    assert calculate_streaks([], 2) == (None, 0, 0)
+
+    # continuing from a state gives the same result as a single pass
+    state = calculate_streaks(completions[:3], 2)
+    assert calculate_streaks(completions[3:], 2, state) == ("2023-05-08", 2, 3)
+
+
+def test_recompute_streaks_matches_sample_data(empty_db, capsys):
+    model = HabitModel(empty_db)
+    model.insert_sample_data()
+    query = "SELECT id, ongoing_streak, longest_streak, last_completed_at FROM habits WHERE id IN (2, 8, 16, 19)"
+    expected = empty_db.execute(query).fetchall()
+
+    empty_db.execute("UPDATE habits SET ongoing_streak = 0, longest_streak = 0, last_completed_at = NULL")
+    empty_db.commit()
+    assert recompute_streaks(empty_db) == 20
+    assert empty_db.execute(query).fetchall() == expected
+
+
+def test_update_streaks_incremental(empty_db):
+    empty_db.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)", [(1, "Read", 1), (2, "Run", 1)])
+    empty_db.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         [(1, "2023-05-01 08:00:00"), (1, "2023-05-02 08:00:00"), (2, "2023-05-01 08:00:00")])
+    empty_db.commit()
+    assert update_streaks(empty_db) == 2
+    query = "SELECT ongoing_streak, longest_streak, last_completed_at FROM habits ORDER BY id"
+    assert empty_db.execute(query).fetchall() == [(2, 2, "2023-05-02"), (1, 1, "2023-05-01")]
+
+    # nothing new, nothing to update
+    assert update_streaks(empty_db) == 0
+
+    # a new log continues from the checkpoint of habit 1 only
+    empty_db.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (1, '2023-05-03 08:00:00')")
+    empty_db.commit()
+    assert update_streaks(empty_db) == 1
+    assert empty_db.execute(query).fetchall() == [(3, 3, "2023-05-03"), (1, 1, "2023-05-01")]
+
+    # a log older than the checkpoint forces a full recalculation of that habit
+    empty_db.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (2, '2023-04-30 08:00:00')")
+    empty_db.commit()
+    assert update_streaks(empty_db) == 1
+    assert empty_db.execute(query).fetchall() == [(3, 3, "2023-05-03"), (2, 2, "2023-05-01")]
+
+
+def test_habit_statistics(empty_db):
+    empty_db.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                         [(1, "Read", 2), (2, "Run", 7), (3, "Never", 1)])
+    empty_db.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         [(1, "2023-05-01 08:00:00"), (1, "2023-05-03 08:00:00"), (1, "2023-05-03 20:00:00"),
+                          (1, "2023-05-09 08:00:00"), (2, "2023-05-01 08:00:00")])
+    empty_db.commit()
+
+    statistics = habit_statistics(empty_db, reference=datetime.date(2023, 5, 10))
+    assert statistics[1] == {"longest_streak": 2, "ongoing_streak": 1, "completions": 3, "completion_rate": 0.6,
+                             "max_gap": 6, "mean_gap": 4.0}
+    assert statistics[2]["completion_rate"] == 0.5
+    assert statistics[3]["completions"] == 0
+
+
+def test_numpy_statistics_match_python(empty_db):
+    pytest.importorskip("numpy")
+    import NumpyAnalytics
+
+    # random logs with duplicate days, unsorted ids and habits without logs
+    rng = random.Random(7)
+    empty_db.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                         [(i, "habit {}".format(i), rng.choice([1, 2, 3, 7])) for i in range(1, 41)])
+    start = datetime.datetime(2022, 1, 1)
+    empty_db.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                         [(rng.randint(1, 30), (start + datetime.timedelta(hours=rng.randrange(24 * 120))).strftime(
+                             "%Y-%m-%d %H:%M:%S")) for _ in range(3000)])
+    empty_db.commit()
+
+    reference = datetime.date(2022, 6, 1)
+    assert NumpyAnalytics.habit_statistics(empty_db, reference) == habit_statistics(empty_db, reference)
+
+
+def test_habit_names_are_streamed_in_pages(empty_db, capsys):
+    empty_db.executemany("INSERT INTO habits (name, frequency) VALUES (?, 1)",
+                         [("habit {}".format(i),) for i in range(25)])
+    empty_db.commit()
+
+    names = iter_habit_names(empty_db, chunk_size=4)
+    assert next(names) == "habit 0"
+    assert list(names) == ["habit {}".format(i) for i in range(1, 25)]
+
+    assert [len(page) for page in paginate(range(25), 10)] == [10, 10, 5]
+
+    # every page is rendered as its own table
+    print_table(([name] for name in iter_habit_names(empty_db)), ["Name"], page_size=10)
+    output = capsys.readouterr().out
+    assert output.count("╒") == 3
+    assert "habit 24" in output
+
+
+def test_habit_pager(empty_db, capsys):
+    controller = HabitController(empty_db)
+    empty_db.executemany("INSERT INTO habits (name, frequency) VALUES (?, 1)",
+                         [("habit {}".format(i),) for i in range(45)])
+    # a gap in the ids must not shift the pages
+    empty_db.execute("DELETE FROM habits WHERE id = 3")
+    empty_db.commit()
+
+    pager = HabitPager(controller, page_size=10)
+    assert pager.page_count() == 5
+    assert [row[0] for row in pager.first()] == [1, 2] + list(range(4, 12))
+    assert [row[0] for row in pager.next()] == list(range(12, 22))
+    assert [row[0] for row in pager.previous()] == [1, 2] + list(range(4, 12))
+    assert pager.previous() is None
+
+    assert [row[0] for row in pager.jump(5)] == list(range(42, 46))
+    assert pager.page == 5
+    assert pager.next() is None
+    assert pager.jump(6) is None
+    assert [row[0] for row in pager.previous()] == list(range(32, 42))
+
+    pager.render(pager.jump(2))
+    output = capsys.readouterr().out
+    assert "habit 20" in output and "habit 21" not in output
+    assert "page 2 of 5" in output
+
+
+def test_search_habits(empty_db):
+    model = HabitModel(empty_db)
+    empty_db.executemany("INSERT INTO habits (name, frequency) VALUES (?, 1)",
+                         [("Drink Water",), ("Water plants",), ("Read a book",), ("100% focus",), ("Drive safely",)])
+    empty_db.commit()
+
+    def names(fragment, limit=20):
+        return [row[1] for row in model.search_habits(fragment, limit)]
+
+    # prefix matches come first, then substring matches (case insensitive)
+    assert names("Water") == ["Water plants", "Drink Water"]
+    assert names("water") == ["Drink Water", "Water plants"]
+    assert names("Dri") == ["Drink Water", "Drive safely"]
+    assert names("Dri", limit=1) == ["Drink Water"]
+    # short fragments and wildcards
+    assert names("a ") == ["Read a book"]
+    assert names("%") == ["100% focus"]
+    assert names("xyz") == []
+
+    # the index follows renames and deletes
+    empty_db.execute("UPDATE habits SET name = 'Drink tea' WHERE name = 'Drink Water'")
+    empty_db.execute("DELETE FROM habits WHERE name = 'Water plants'")
+    empty_db.commit()
+    assert names("water") == []
+    assert names("tea") == ["Drink tea"]
+
+
+def test_complete_habit_selected_by_name_fragment(empty_db, monkeypatch):
+    controller = HabitController(empty_db)
+    controller.add_habit(Habit("Drink Water", 1))
+    controller.add_habit(Habit("Water plants", 3))
+
+    answers = iter(["plant", "1"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    controller.complete_habit()
+
+    c = empty_db.cursor()
+    c.execute("SELECT name, ongoing_streak FROM habits ORDER BY id")
+    assert c.fetchall() == [("Drink Water", 0), ("Water plants", 1)]
+    c.close()
+
+
+def test_habit_from_row_and_habit_table(empty_db):
+    row = (7, "Read", "2023-05-01 08:00:00", 2, 1, 3, 4, "2023-05-09")
+    habit = Habit.from_row(row)
+    assert (habit.id, habit.name, habit.created_at, habit.frequency, habit.is_completed, habit.ongoing_streak,
+            habit.longest_streak, habit.last_completed_at) == row
+    # habits have no per-instance dict
+    with pytest.raises(AttributeError):
+        habit.color = "red"
+
+    empty_db.executemany("INSERT INTO habits VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [row, (8, "Run", "2023-05-02 08:00:00", 7, 0, 0, 0, None)])
+    empty_db.commit()
+    table = HabitController(empty_db).get_habit_table()
+    assert len(table) == 2
+    assert table.row(0) == row
+    assert list(table.frequencies) == [2, 7]
+    assert [habit.name for habit in table] == ["Read", "Run"]
+    assert table[1].last_completed_at is None
+    assert HabitTable.from_rows([]).names == []
+
+
+def test_query_cache_lru_ttl_and_tags():
+    now = [0.0]
+    cache = QueryCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    loads = []
+
+    def load(value):
+        loads.append(value)
+        return value
+
+    assert cache.get_or_load("a", lambda: load(1), ("habits",)) == 1
+    assert cache.get_or_load("a", lambda: load(2), ("habits",)) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    # the least recently used entry is evicted
+    cache.get_or_load("b", lambda: load("b"), ("habit:Read",))
+    cache.get_or_load("a", lambda: load(3))
+    cache.get_or_load("c", lambda: load("c"), ("habit_logs",))
+    assert cache.get_or_load("b", lambda: load("b2"), ("habit:Read",)) == "b2"
+
+    # only entries with a matching tag are invalidated
+    cache.invalidate("habit:Read")
+    assert cache.get_or_load("c", lambda: load("c2")) == "c"
+    assert cache.get_or_load("b", lambda: load("b3")) == "b3"
+
+    # entries expire after the ttl
+    now[0] = 11
+    assert cache.get_or_load("b", lambda: load("b4")) == "b4"
+    assert loads == [1, "b", "c", "b2", "b3", "b4"]
+
+
+def test_controller_reads_through_cache(empty_db, capsys):
+    controller = HabitController(empty_db)
+    controller.add_habit(Habit("Read", 1))
+    controller.show_longest_streak()
+    controller.show_longest_streak()
+    assert controller.cache_stats()["hits"] == 1
+
+    # completing a habit invalidates the cached streaks
+    controller.model.complete_habit(Habit("Read", 1))
+    capsys.readouterr()
+    controller.show_longest_streak()
+    assert "│ Read   │                1 │" in capsys.readouterr().out
+    assert controller.cache_stats() == {"hits": 1, "misses": 2, "size": 1}
+
+
+def test_cached_results_are_copies_and_see_other_connections(tmp_path, capsys):
+    path = str(tmp_path / "cache.db")
+    first = HabitModel(manager=ConnectionManager(path))
+    second = HabitModel(manager=ConnectionManager(path))
+    first.add_habit(Habit("Read", 1))
+
+    # changing a result doesn't change the cached entry
+    first.get_habits().clear()
+    assert len(first.get_habits()) == 1
+    assert first.cache.stats()["hits"] == 1
+
+    # a commit of another connection (or process) drops the cached entries
+    second.add_habit(Habit("Run", 1))
+    assert [row[1] for row in first.get_habits()] == ["Read", "Run"]
+    first.manager.close_all()
+    second.manager.close_all()
+
+
+def test_habit_service_serializes_writes_and_reads_concurrently(tmp_path, capsys):
+    async def client(service, name):
+        await service.add_habit(name, 1)
+        streaks = await service.complete_habit(name)
+        habits, statistics = await asyncio.gather(service.get_habits(), service.habit_statistics())
+        return streaks, len(habits), len(statistics)
+
+    async def run():
+        async with HabitService(str(tmp_path / "service.db"), readers=3) as service:
+            results = await asyncio.gather(*(client(service, "habit {}".format(i)) for i in range(20)))
+            assert [streaks for streaks, _, _ in results] == [(1, 1)] * 20
+            # every client sees at least its own habit
+            assert all(habits >= 1 and statistics >= 1 for _, habits, statistics in results)
+            assert await service.count_habits() == 20
+            with pytest.raises(ValueError):
+                await service.add_habit("habit 0", 1)
+            with pytest.raises(ValueError):
+                await service.complete_habit("unknown")
+            await service.delete_habit("habit 0")
+            assert await service.get_habit("habit 0") is None
+            assert len(await service.search_habits("habit 1")) == 11
+            day = datetime.datetime(2023, 5, 1, 8, 0)
+            assert await service.complete_habits([("habit 1", day), ("habit 1", day)]) == 2
+            assert await service.daily_completions(2, end="2023-05-02") == [(2, "2023-05-01", 2)]
+
+    asyncio.run(run())
+    # the models of the service are quiet, the messages of the menu don't end up in the output of the process
+    assert capsys.readouterr().out == ""
+
+
+def test_http_api_over_one_keep_alive_connection(tmp_path):
+    server = HabitServer(("127.0.0.1", 0), str(tmp_path / "server.db"), readers=2)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    client = http.client.HTTPConnection(*server.server_address)
+
+    def request(method, path, body=None):
+        client.request(method, path, json.dumps(body) if body is not None else None)
+        response = client.getresponse()
+        return response.status, json.loads(response.read())
+
+    try:
+        assert request("POST", "/habits", {"name": "Read books", "frequency": 1}) == (201, {"id": 1})
+        assert request("POST", "/habits", {"name": "Read books", "frequency": 1})[0] == 400
+        assert request("POST", "/habits/Read%20books/complete") == (200, {"ongoing_streak": 1, "longest_streak": 1})
+        status, habit = request("GET", "/habits/Read%20books")
+        assert status == 200 and habit["is_completed"] == 1
+        assert request("POST", "/completions", {"completions": [["Read books", "2023-05-01 08:00:00"]]}) == \
+            (200, {"completions": 1})
+        assert request("GET", "/completions/daily?habit_id=1&end=2023-05-02") == (200, [[1, "2023-05-01", 1]])
+        assert [habit["name"] for habit in request("GET", "/search?q=book")[1]] == ["Read books"]
+        assert request("GET", "/statistics")[1]["1"]["completions"] == 2
+        assert request("DELETE", "/habits/Read%20books")[0] == 200
+        assert request("GET", "/habits") == (200, [])
+        assert request("GET", "/habits/Read%20books")[0] == 404
+        assert request("GET", "/unknown")[0] == 404
+        assert request("GET", "/habits?limit=x")[0] == 400
+
+        # a broken Content-Length is answered with a 400 and the connection is closed
+        other = http.client.HTTPConnection(*server.server_address)
+        other.putrequest("POST", "/habits")
+        other.putheader("Content-Length", "x")
+        other.endheaders()
+        response = other.getresponse()
+        assert response.status == 400 and response.getheader("Connection") == "close"
+        other.close()
+
+        # a server that can't bind its port stops the service it has started
+        def service_threads():
+            # event loop, writer and readers of the habit services, not the handler threads of the connections
+            return {thread for thread in threading.enumerate()
+                    if thread.name.startswith(("habit-service", "habit-writer", "habit-reader"))}
+
+        running = service_threads()
+        with pytest.raises(OSError):
+            HabitServer(server.server_address, str(tmp_path / "other.db"))
+        assert service_threads() <= running
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def complete_in_process(path, times):
+    # completes a habit from another process, see test_complete_habit_is_atomic_and_once_per_day
+    manager = ConnectionManager(path)
+    model = HabitModel(manager=manager)
+    results = [model.complete_habit(Habit("Read", 1)) for _ in range(times)]
+    manager.close_all()
+    return results
+
+
+def test_complete_habit_is_atomic_and_once_per_day(tmp_path, capsys):
+    path = str(tmp_path / "stress.db")
+    manager = ConnectionManager(path)
+    model = HabitModel(manager=manager)
+    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    model.conn.execute("INSERT INTO habits VALUES (1, 'Read', '2023-01-01 08:00:00', 1, 1, 2, 2, ?)", (yesterday,))
+    model.conn.commit()
+
+    # many threads with their own connections and two other processes complete the same habit at once
+    results = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        own = HabitModel(manager=manager)
+        barrier.wait()
+        results.extend(own.complete_habit(Habit("Read", 1)) for _ in range(20))
+
+    with ProcessPoolExecutor(2) as pool:
+        futures = [pool.submit(complete_in_process, path, 20) for _ in range(2)]
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for future in futures:
+            results.extend(future.result())
+
+    # exactly one completion won, the streak was incremented once
+    assert results.count(True) == 1 and len(results) == 200
+    conn = manager.connection()
+    assert conn.execute("SELECT ongoing_streak, longest_streak FROM habits").fetchone() == (3, 3)
+    assert conn.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0] == 1
+    assert conn.execute("SELECT SUM(completions) FROM habit_daily_completions").fetchone()[0] == 1
+    assert model.complete_habit(Habit("unknown", 1)) is False
+    manager.close_all()
+
+
+def test_parallel_statistics_match_single_process(tmp_path):
+    path = str(tmp_path / "parallel.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    rng = random.Random(7)
+    conn.executemany("INSERT INTO habits (id, name, frequency) VALUES (?, ?, ?)",
+                     ((i, "habit {}".format(i), rng.choice([1, 2, 7])) for i in range(1, 41)))
+    conn.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, ?)",
+                     ((rng.randint(1, 30), "2023-{:02d}-{:02d} 08:00:00".format(rng.randint(1, 4), rng.randint(1, 28)))
+                      for _ in range(2000)))
+    conn.commit()
+    reference = datetime.date(2023, 5, 1)
+    expected = habit_statistics(conn, reference)
+
+    # the ranges cover every habit once, in ascending order
+    ranges = ParallelAnalytics.partition(conn, 4)
+    assert len(ranges) == 4 and ranges[0][0] == 1 and ranges[-1][1] == 40
+    assert all(previous[1] < following[0] for previous, following in zip(ranges, ranges[1:]))
+    conn.close()
+
+    for workers in (1, 2):
+        result = ParallelAnalytics.habit_statistics(path, reference, workers)
+        assert result == expected and list(result) == sorted(expected)
+    with pytest.raises(ValueError):
+        ParallelAnalytics.habit_statistics(":memory:")
+
+
+def test_shard_router_isolates_tenants(tmp_path, capsys):
+    router = ShardRouter(str(tmp_path / "shards"))
+    assert router.path("alice") == router.path("alice") != router.path("bob")
+    assert router.manager("alice") is router.manager("alice")
+    with pytest.raises(ValueError):
+        router.path("../alice")
+
+    day = datetime.datetime(2023, 5, 1, 8, 0)
+    alice = HabitController(tenant="alice", router=router)
+    alice.add_habit(Habit("Read", 1))
+    alice.complete_habits([("Read", day), ("Read", day + datetime.timedelta(days=1))])
+    bob = HabitController(tenant="bob", router=router)
+    bob.add_habit(Habit("Read", 1))
+    bob.add_habit(Habit("Run", 7))
+    bob.complete_habits([("Run", day)])
+
+    # the same habit name exists once per tenant
+    assert [row[1] for row in alice.get_habits()] == ["Read"]
+    assert [row[1] for row in bob.get_habits()] == ["Read", "Run"]
+
+    assert router.tenants() == ["alice", "bob"]
+    assert tenant_totals(router) == {"alice": {"habits": 1, "completions": 2}, "bob": {"habits": 2, "completions": 1}}
+    assert daily_completions_across(router) == [("2023-05-01", 2), ("2023-05-02", 1)]
+    assert daily_completions_across(router, start="2023-05-02", tenants=["alice"]) == [("2023-05-02", 1)]
+    router.close_all()
+
+    # the command line works on the shard of a tenant
+    assert cli.main(["--shards", router.directory, "--tenant", "carol", "rebuild-rollups"]) == 0
+    capsys.readouterr()
+    assert cli.main(["--shards", router.directory, "tenants"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["alice\t1\t2", "bob\t2\t1", "carol\t0\t0"]
+    assert cli.main(["--shards", router.directory, "--tenant", "a/b", "rebuild-rollups"]) == 1
+
+
+def test_instrumentation_records_statements_rows_and_latency(empty_db, tmp_path):
+    registry = Instrumentation.Registry()
+    Instrumentation.trace_connection(empty_db, force=True)
+    model = HabitModel(empty_db)
+    add_habit = Instrumentation.instrument(HabitModel.add_habit, registry=registry)
+    get_habits = Instrumentation.instrument(HabitModel.get_habits, registry=registry)
+    complete_habits = Instrumentation.instrument(HabitModel.complete_habits, "complete", registry)
+
+    add_habit(model, Habit("Read", 1))
+    add_habit(model, Habit("Run", 7))
+    assert len(get_habits(model)) == 2
+    day = datetime.datetime(2023, 5, 1, 8, 0)
+    with Instrumentation.measure("batch", registry):
+        complete_habits(model, [("Read", day), ("Run", day)])
+
+    operations = registry.operations
+    assert operations["HabitModel.add_habit"]["calls"] == 2
+    # the search index triggers write rows as well
+    assert operations["HabitModel.add_habit"]["rows_written"] >= 2
+    assert operations["HabitModel.get_habits"]["rows_read"] == 2
+    # the query and the PRAGMA data_version check of the cache
+    assert operations["HabitModel.get_habits"]["statements"] == 2
+    # nested blocks count the same changes
+    assert operations["complete"]["rows_written"] == operations["batch"]["rows_written"] >= 8
+    assert sum(operations["batch"]["buckets"]) == 1
+
+    path = str(tmp_path / "metrics.prom")
+    registry.write(path)
+    text = open(path).read()
+    assert 'habit_operation_seconds_count{operation="HabitModel.add_habit"} 2' in text
+    assert 'habit_operation_seconds_bucket{operation="batch",le="+Inf"} 1' in text
+    assert 'habit_operation_rows_written_total{{operation="complete"}} {}'.format(
+        operations["complete"]["rows_written"]) in text
+    registry.write(str(tmp_path / "metrics.json"))
+    assert json.load(open(str(tmp_path / "metrics.json")))["complete"]["calls"] == 1
+
+    # without HABIT_INSTRUMENT the decorator leaves the functions alone
+    if not Instrumentation.ENABLED:
+        assert Instrumentation.instrumented(len) is len
+
+
+def test_synthetic_data_is_deterministic():
+    def dump(seed):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        counts = generate(conn, habits=30, years=0.5, seed=seed)
+        tables = [conn.execute("SELECT * FROM {} ORDER BY 1, 2".format(table)).fetchall()
+                  for table in ("habits", "habit_logs", "habit_daily_completions")]
+        conn.close()
+        return counts, tables
+
+    counts, tables = dump(1)
+    assert counts[0] == 30 and counts[1] == len(tables[1]) > 0
+    assert dump(1) == (counts, tables)
+    assert dump(2)[1][1] != tables[1]
+    assert {row[3] for row in tables[0]} <= set(FREQUENCIES)
+    # the streaks and rollups are derived from the generated logs
+    assert sum(row[2] for row in tables[2]) == len(tables[1])
+    assert all(row[6] >= row[5] for row in tables[0])
+
+
+def test_completion_queue_group_commit_and_replay(tmp_path, capsys):
+    manager = ConnectionManager(str(tmp_path / "queue.db"))
+    model = HabitModel(manager=manager)
+    model.add_habit(Habit("Drink Water", 1))
+    model.add_habit(Habit("Read", 1))
+    capsys.readouterr()
+    journal = str(tmp_path / "completions.jsonl")
+    day = datetime.datetime(2024, 1, 1, 8)
+
+    with CompletionQueue(model, journal, max_items=1000, max_delay=10) as queue:
+        for i in range(50):
+            queue.complete("Drink Water", day + datetime.timedelta(seconds=i))
+        queue.complete("Read", day)
+        queue.complete("Swim", day)
+        assert queue.pending() == 52
+        assert queue.flush(timeout=10)
+        assert queue.pending() == 0
+        assert queue.unknown == [("Swim", day)]
+    # one completion per habit and day, written in one group commit, the journal is empty afterwards
+    assert model.conn.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0] == 2
+    assert open(journal).read() == ""
+    # the queue writes with a model that doesn't print
+    assert capsys.readouterr().out == ""
+
+    # a crashed process left completions in the journal, one committed already and a torn last line
+    with open(journal, "w") as file:
+        file.write(json.dumps({"name": "Read", "completed_at": "2024-01-01 09:00:00"}) + "\n")
+        file.write(json.dumps({"name": "Read", "completed_at": "2024-01-02 09:00:00"}) + "\n")
+        file.write('{"name": "Drink')
+    with CompletionQueue(model, journal, durability="fsync") as queue:
+        assert queue.replayed == 2
+    assert model.conn.execute("SELECT ongoing_streak, last_completed_at FROM habits WHERE name = 'Read'").fetchone() \
+        == (2, "2024-01-02")
+    assert model.conn.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0] == 3
+
+    with pytest.raises(ValueError):
+        CompletionQueue(model, durability="never")
+    manager.close_all()
+
+
+def test_compacted_logs_read_the_same(empty_db, tmp_path):
+    generate(empty_db, habits=30, years=1, seed=3)
+    empty_db.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (1, '2023-06-01 12:00:00')")
+    empty_db.execute("INSERT INTO habit_logs (habit_id, completed_at) VALUES (1, '2023-06-01 12:00:00')")
+    empty_db.commit()
+    reference = datetime.date(2024, 1, 1)
+    window = (datetime.date(2023, 5, 1), datetime.date(2023, 8, 1))
+
+    def snapshot():
+        recompute_streaks(empty_db)
+        rebuild_rollups(empty_db)
+        return (list(iter_logs(empty_db)), habit_statistics(empty_db, reference),
+                list(completions_in_window(*window, conn=empty_db)), daily_completions(empty_db), count_logs(empty_db),
+                empty_db.execute("SELECT id, ongoing_streak, longest_streak, last_completed_at FROM habits").fetchall())
+
+    before = snapshot()
+    total = count_logs(empty_db)
+    assert compact_logs(empty_db, "2023-10-01") > 0
+    recent = empty_db.execute("SELECT COUNT(*) FROM habit_logs").fetchone()[0]
+    assert 0 < recent < total
+    # completions at the same second are stored once with a count
+    assert empty_db.execute("SELECT count FROM habit_log_archive WHERE habit_id = 1 AND completed_at = ?",
+                            ((datetime.datetime(2023, 6, 1, 12) - datetime.datetime(2000, 1, 1)).total_seconds(),)
+                            ).fetchone()[0] >= 2
+    assert snapshot() == before
+
+    # the export contains the archived logs as well
+    assert export_table(empty_db, "habit_logs", str(tmp_path / "logs.csv")) == total
+    with pytest.raises(ValueError):
+        compact_logs(empty_db, "last week")
+
+
+def test_snapshot_refreshes_incrementally(empty_db, tmp_path):
+    pytest.importorskip("numpy")
+    generate(empty_db, habits=20, years=1, seed=5)
+    recompute_streaks(empty_db)
+    compact_logs(empty_db, "2023-10-01")
+    reference = datetime.date(2024, 1, 1)
+    path = str(tmp_path / "habits.snapshot")
+    assert write_snapshot(empty_db, path) == count_logs(empty_db)
+    with Snapshot(path) as snapshot:
+        assert snapshot.habit_statistics(reference) == habit_statistics(empty_db, reference)
+        assert snapshot.names() == [row[0] for row in empty_db.execute("SELECT name FROM habits ORDER BY id")]
+        assert snapshot.get_habits()[0][:5] == empty_db.execute(
+            "SELECT id, name, frequency, ongoing_streak, longest_streak FROM habits ORDER BY id").fetchone()
+        old = snapshot.array("completed_at")
+
+    # only the new logs are read, a reader of the old file keeps its view
+    empty_db.executemany("INSERT INTO habit_logs (habit_id, completed_at) VALUES (?, '2024-01-01 08:00:00')",
+                         [(1,), (2,)])
+    empty_db.commit()
+    assert refresh_snapshot(empty_db, path) == 2
+    with Snapshot(path) as snapshot:
+        assert snapshot.logs == len(old) + 2
+        assert snapshot.habit_statistics(reference) == habit_statistics(empty_db, reference)
+    assert len(old) == count_logs(empty_db) - 2
+
+    # compacting moves logs without changing them, an edited log changes the checksum
+    compact_logs(empty_db, "2024-01-02")
+    assert refresh_snapshot(empty_db, path) == 0
+    empty_db.execute("UPDATE habit_logs SET completed_at = '2023-12-31 08:00:00' WHERE id = "
+                     "(SELECT MAX(id) FROM habit_logs)")
+    empty_db.commit()
+    assert refresh_snapshot(empty_db, path) == count_logs(empty_db)
+    with Snapshot(path) as snapshot:
+        assert snapshot.habit_statistics(reference) == habit_statistics(empty_db, reference)
+
+    # deleted logs can't be appended, the snapshot is written from scratch
+    empty_db.execute("DELETE FROM habits WHERE id = 3")
+    empty_db.commit()
+    assert refresh_snapshot(empty_db, path) == count_logs(empty_db)
+    with Snapshot(path) as snapshot:
+        assert 3 not in list(snapshot.column("id"))
+        assert snapshot.habit_statistics(reference) == habit_statistics(empty_db, reference)